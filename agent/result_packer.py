@@ -0,0 +1,111 @@
+import re
+
+from config.settings import (
+    SEARCH_RESULT_TOKEN_BUDGET,
+    SEARCH_MIN_SIMILARITY,
+    SEARCH_RESULT_MIN_HIT_TOKENS,
+)
+from utils.metrics import metrics
+from utils.tokens import count_tokens, truncate_to_tokens
+
+
+def distance_to_similarity(distance):
+    """Cosine similarity of two normalized vectors from their squared Euclidean distance (the collections' space)."""
+    return 1.0 - distance / 2.0
+
+
+def compact_text(text):
+    """Collapse runs of spaces and blank lines, which cost tokens without telling the model anything."""
+    text = re.sub(r'[ \t\xa0]+', ' ', text or '')
+    return re.sub(r'\s*\n\s*', '\n', text).strip()
+
+
+def merge_hits(results, min_similarity=SEARCH_MIN_SIMILARITY):
+    """
+    Merge the hits of every query of a search result into one list, best first.
+
+    A chunk found by several queries is kept once, with its best score, and chunks of the same (source, page) are
+    grouped under one entry. Hits whose distance is less similar than `min_similarity` are dropped, unless the
+    keyword index matched them: an exact identifier can be far from the query in embedding space.
+
+    :param results: Query results of VectorStore.search_text / search_text_to_image / image_to_image.
+    :return: [{'source': ..., 'page': ..., 'score': ..., 'texts': [...]}], best score first.
+    """
+    best = {}
+    dropped = set()
+    for i, query_ids in enumerate(results.get('ids') or []):
+        # Image results have no documents, and only keyword and hybrid results have scores and keyword matches
+        columns = [results[name][i] if results.get(name) and results[name][i] is not None else [None] * len(query_ids)
+                   for name in ('documents', 'metadatas', 'distances', 'scores', 'keyword_matches')]
+        for chunk_id, document, metadata, distance, score, keyword_match in zip(query_ids, *columns):
+            if distance is not None:
+                similarity = distance_to_similarity(distance)
+                if similarity < min_similarity and not keyword_match:
+                    dropped.add(chunk_id)
+                    continue
+                score = similarity if score is None else score
+            if chunk_id in best and best[chunk_id]['score'] >= score:
+                continue
+            metadata = metadata or {}
+            best[chunk_id] = {
+                'source': metadata.get('source') or chunk_id,
+                'page': metadata.get('page_number'),
+                'score': score,
+                'text': document,
+            }
+    # A chunk found by another query above the threshold was not dropped after all
+    dropped -= set(best)
+    if dropped:
+        metrics.inc('search_hits_dropped_total', len(dropped), reason='similarity')
+
+    groups = {}
+    for hit in sorted(best.values(), key=lambda hit: hit['score'], reverse=True):
+        group = groups.setdefault((hit['source'], hit['page']), {
+            'source': hit['source'], 'page': hit['page'], 'score': hit['score'], 'texts': [],
+        })
+        if hit['text'] and hit['text'] not in group['texts']:
+            group['texts'].append(hit['text'])
+    return list(groups.values())
+
+
+def omitted_note(omitted):
+    return f"({omitted} more result(s) left out to fit the token budget)"
+
+
+def pack_search_results(results, token_budget=SEARCH_RESULT_TOKEN_BUDGET, min_similarity=SEARCH_MIN_SIMILARITY):
+    """
+    Serialize search results for the model: merged and deduplicated hits (see merge_hits), best first, as compact
+    numbered text blocks filling at most `token_budget` tokens. The hit that overflows the budget is cut to the
+    remaining tokens, or left out when fewer than SEARCH_RESULT_MIN_HIT_TOKENS remain.
+    """
+    hits = merge_hits(results, min_similarity=min_similarity)
+    if not hits:
+        return "No relevant results found."
+
+    # Leave room for the note on left out results
+    budget = token_budget - count_tokens(omitted_note(len(hits))) - 1
+    blocks = []
+    used = 0
+    for number, hit in enumerate(hits, start=1):
+        header = f"[{number}] {hit['source']}" + (f", page {hit['page']}" if hit['page'] is not None else '')
+        text = compact_text('\n'.join(hit['texts']))
+        block = f"{header}\n{text}" if text else header
+        # Blocks are separated by a blank line
+        tokens = count_tokens(block) + 1
+        if used + tokens > budget:
+            # The cut text ends with an ellipsis
+            remaining = budget - used - count_tokens(header) - 3
+            if text and remaining >= SEARCH_RESULT_MIN_HIT_TOKENS:
+                block = f"{header}\n{truncate_to_tokens(text, remaining)}…"
+                blocks.append(block)
+                used += count_tokens(block) + 1
+            break
+        blocks.append(block)
+        used += tokens
+
+    omitted = len(hits) - len(blocks)
+    if omitted:
+        metrics.inc('search_hits_dropped_total', omitted, reason='budget')
+        blocks.append(omitted_note(omitted))
+    metrics.observe('search_result_tokens', used)
+    return '\n\n'.join(blocks)
@@ -1,20 +1,28 @@
 import asyncio
 import json
 from pydantic import BaseModel, Field
-from typing import List, Optional, Any
+from typing import List, Optional, Any, Literal
 
+from agent.result_packer import pack_search_results
 from code_interpreter.code_interpreter import CodeInterpreter
 from code_interpreter.code_interpreter_utils import execute_python_code
+from config.settings import SEARCH_MODE, IMAGE_SEARCH_MIN_SIMILARITY
 from ingestor.ingestor import Ingestor
 from ingestor.vector_store import VectorStore
 from init_setup import default_vector_store
 from todo_manager.todo_manager import TodoManager
 from tool_manager.ToolManager import ToolManager
 
+# Modes of VectorStore.search_text
+SearchMode = Literal['hybrid', 'keyword', 'vector']
+
 
 class SemanticDocumentSearchInput(BaseModel):
     queries: List[str] = Field(default=[], description="List of meaningful queries")
     top_k: int = Field(default=2, description="No. of items to retrieve for each queries")
+    mode: SearchMode = Field(default=SEARCH_MODE,
+                             description="'hybrid' matches words and meaning, 'keyword' only exact words "
+                                         "(identifiers, invoice numbers, names; fastest), 'vector' only meaning")
     vector_store: Optional[Any] = Field(default=None, description="Optional VectorStore instance")
 
     class Config:
@@ -58,23 +66,24 @@ class CodeInterpreterInput(BaseModel):
     python_code: str = Field(description="Python Code Snippet")
 
 
-def search(queries: List[str], top_k: int = 2, vector_store: Optional[VectorStore] = None):
+def search(queries: List[str], top_k: int = 2, vector_store: Optional[VectorStore] = None,
+           mode: SearchMode = SEARCH_MODE):
     vector_store = vector_store or default_vector_store
-    results = vector_store.search_text(queries=queries, top_k=top_k)
-    return json.dumps(results, indent=4,
-                      ensure_ascii=False) + "\n\n\nNote: If you are using this information to provide an answer, you must cite the sources (if applicable).".upper()
+    results = vector_store.search_text(queries=queries, top_k=top_k, mode=mode)
+    return pack_search_results(results) + ("\n\n\nNote: If you are using this information to provide an answer, "
+                                           "you must cite the sources (if applicable).").upper()
 
 
 def text_to_image_search(queries: List[str], top_k: int = 2, vector_store: Optional[VectorStore] = None):
     vector_store = vector_store or default_vector_store
     results = vector_store.search_text_to_image(queries=queries, top_k=top_k)
-    return json.dumps(results, indent=4, ensure_ascii=False)
+    return pack_search_results(results, min_similarity=IMAGE_SEARCH_MIN_SIMILARITY)
 
 
 def image_to_image_search(queries: List[str], top_k: int = 2, vector_store: Optional[VectorStore] = None):
     vector_store = vector_store or default_vector_store
     results = vector_store.image_to_image(queries=queries, top_k=top_k)
-    return json.dumps(results, indent=4, ensure_ascii=False)
+    return pack_search_results(results, min_similarity=IMAGE_SEARCH_MIN_SIMILARITY)
 
 
 def index_contents_in_vector_store(contents: List[str], ingestor: Optional[Ingestor] = None):
@@ -106,7 +115,7 @@ tool_manager.register_tool(
     description="To retrieve information(similar to queries) from indexed content",
     full_arg_spec=SemanticDocumentSearchInput,
     return_direct=True,
-    exposed_args=['queries', 'top_k']
+    exposed_args=['queries', 'top_k', 'mode']
 )
 
 tool_manager.register_tool(
@@ -3,14 +3,16 @@ import os
 import streamlit as st
 
 from agent.gennie import gennie
-from init_setup import ingestor, markdown_parser
+from init_setup import ingestion_service, markdown_parser
 
 from sqlalchemy import text
 
 
 import re
 
+from config.settings import METRICS_PANEL_REFRESH_SECONDS
 from todo_manager.db import get_db_connection
+from utils.metrics import metrics
 
 
 def extract_content(input_string):
@@ -39,10 +41,10 @@ st.title('Gennie')
 # Process the working directory on startup or change
 def ingest_documents(directory):
     if os.path.isdir(directory):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        loop.run_until_complete(ingestor.ingest_directory(directory))
-        st.success(f'Ingested all documents in the directory: {directory}')
+        if ingestion_service.ingest_directory(directory):
+            st.success(f'Ingesting documents in the background: {directory}')
+        else:
+            st.info(f'Already ingesting: {directory}')
     else:
         st.error(f'Invalid directory path: {directory}')
 
@@ -82,6 +84,90 @@ if st.sidebar.button("Ingest Directory"):
     st.session_state['working_directory'] = working_directory
     ingest_documents(working_directory)
 
+# Sidebar panel with the progress of background ingestion
+st.sidebar.title("Ingestion Progress")
+
+
+def display_ingestion_progress():
+    directories = ingestion_service.progress()
+    if not directories:
+        st.caption("No directory submitted yet")
+    for progress in directories:
+        processed = progress['done'] + progress['failed']
+        if progress['state'] == 'done':
+            label = f"{progress['path']}: done ({progress['done']} files, {progress['failed']} failed)"
+        elif progress['state'] == 'scanning':
+            label = f"{progress['path']}: scanning, {processed}/{progress['queued']} files so far"
+        else:
+            label = f"{progress['path']}: {processed}/{progress['queued']} files"
+        st.progress(processed / progress['queued'] if progress['queued'] else 1.0, text=label)
+        for current in progress['current']:
+            st.caption(f"Ingesting {os.path.basename(current)}")
+
+
+if hasattr(st, 'fragment'):
+    display_ingestion_progress = st.fragment(run_every=METRICS_PANEL_REFRESH_SECONDS)(display_ingestion_progress)
+
+with st.sidebar:
+    display_ingestion_progress()
+
+# Sidebar panel with live ingestion metrics
+st.sidebar.title("Ingestion Metrics")
+
+
+def display_ingestion_metrics():
+    snapshot = metrics.snapshot()
+    totals, rates = {}, {}
+    for counter in snapshot['counters']:
+        totals[counter['name']] = totals.get(counter['name'], 0) + counter['value']
+        rates[counter['name']] = rates.get(counter['name'], 0) + counter['rate']
+
+    left, right = st.columns(2)
+    left.metric("Files/s", f"{rates.get('ingest_files_total', 0):.2f}")
+    right.metric("Pages/s", f"{rates.get('ingest_pages_total', 0):.2f}")
+    left.metric("MB hashed", f"{totals.get('ingest_bytes_hashed_total', 0) / 1024 ** 2:.1f}")
+    right.metric("Chunks embedded", totals.get('ingest_chunks_embedded_total', 0))
+    left.metric("Retries", totals.get('db_lock_retries_total', 0) + totals.get('ocr_retries_total', 0))
+    right.metric("Failures", totals.get('ingest_failures_total', 0) + totals.get('watch_failures_total', 0))
+
+    query_cache = {'embedding_cache_hits_total': 0, 'embedding_cache_misses_total': 0}
+    for counter in snapshot['counters']:
+        if counter['name'] in query_cache and counter['labels'].get('cache') == 'query':
+            query_cache[counter['name']] += counter['value']
+    lookups = sum(query_cache.values())
+    if lookups:
+        left.metric("Query cache hits", f"{query_cache['embedding_cache_hits_total'] / lookups:.0%}")
+        right.metric("Query embeddings", query_cache['embedding_cache_misses_total'])
+
+    stage_rows = [
+        {
+            'stage': histogram['labels'].get('stage'),
+            'runs': histogram['count'],
+            'p50 (s)': round(histogram['p50'] or 0, 3),
+            'p95 (s)': round(histogram['p95'] or 0, 3),
+        }
+        for histogram in snapshot['histograms'] if histogram['name'] == 'ingest_stage_seconds'
+    ]
+    if stage_rows:
+        st.caption("Stage latency")
+        st.table(stage_rows)
+
+    queue_rows = [
+        {'queue': gauge['labels'].get('stage', 'watcher'), 'depth': gauge['value']}
+        for gauge in snapshot['gauges'] if gauge['name'] in ('ingest_queue_depth', 'watch_pending_events')
+    ]
+    if queue_rows:
+        st.caption("Queue depth")
+        st.table(queue_rows)
+
+
+# Refresh the panel on its own while the rest of the page stays put (needs a Streamlit version with fragments)
+if hasattr(st, 'fragment'):
+    display_ingestion_metrics = st.fragment(run_every=METRICS_PANEL_REFRESH_SECONDS)(display_ingestion_metrics)
+
+with st.sidebar:
+    display_ingestion_metrics()
+
 # Sidebar to display the status of indexed files
 st.sidebar.title("Indexed Files")
 
@@ -119,6 +205,8 @@ refresh_chat_ui()
 user_query = st.chat_input("Ask me anything...")
 if user_query:
     st.session_state["messages"].append({"role": "user", "content": user_query})
+    # Files the user asks about jump ahead of the background backlog
+    ingestion_service.promote_referenced(user_query)
     with st.spinner('Working on your query...'):
         response = asyncio.run(gennie(
             user_query=user_query,
@@ -9,4 +9,167 @@ OPEN_AI_API_KEY = os.getenv("OPEN_AI_API_KEY", "")
 
 # AZURE DOC INTELLIGENCE STUP
 AZURE_DOCUMENT_INTELLIGENCE_API_ENDPOINT = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_API_ENDPOINT","")
-AZURE_DOCUMENT_INTELLIGENCE_API_KEY = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_API_KEY", "")
\ No newline at end of file
+AZURE_DOCUMENT_INTELLIGENCE_API_KEY = os.getenv("AZURE_DOCUMENT_INTELLIGENCE_API_KEY", "")
+
+# INGESTION PIPELINE SETUP
+INGEST_QUEUE_DEPTH = int(os.getenv("INGEST_QUEUE_DEPTH", "32"))
+INGEST_CHECK_WORKERS = int(os.getenv("INGEST_CHECK_WORKERS", "4"))
+INGEST_EXTRACT_WORKERS = int(os.getenv("INGEST_EXTRACT_WORKERS", "4"))
+INGEST_CHUNK_WORKERS = int(os.getenv("INGEST_CHUNK_WORKERS", "2"))
+INGEST_EMBED_WORKERS = int(os.getenv("INGEST_EMBED_WORKERS", "4"))
+INGEST_COMMIT_WORKERS = int(os.getenv("INGEST_COMMIT_WORKERS", "1"))
+
+# EMBEDDING BATCHING SETUP
+EMBED_BATCH_MAX_ITEMS = int(os.getenv("EMBED_BATCH_MAX_ITEMS", "64"))
+EMBED_BATCH_MAX_TOKENS = int(os.getenv("EMBED_BATCH_MAX_TOKENS", "60000"))
+EMBED_MAX_IN_FLIGHT = int(os.getenv("EMBED_MAX_IN_FLIGHT", "4"))
+EMBED_BATCH_LINGER_SECONDS = float(os.getenv("EMBED_BATCH_LINGER_SECONDS", "0.05"))
+
+# FILE WATCHER SETUP
+WATCH_QUIET_PERIOD_SECONDS = float(os.getenv("WATCH_QUIET_PERIOD_SECONDS", "2.0"))
+WATCH_WORKERS = int(os.getenv("WATCH_WORKERS", "2"))
+
+# CHUNKING SETUP
+CHUNK_TARGET_TOKENS = int(os.getenv("CHUNK_TARGET_TOKENS", "400"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "50"))
+
+# LOCAL PDF TEXT LAYER SETUP
+PDF_TEXT_LAYER_ENABLED = os.getenv("PDF_TEXT_LAYER_ENABLED", "true").lower() == "true"
+# Pages with fewer visible characters than this are treated as scanned and sent to Azure OCR
+PDF_TEXT_LAYER_MIN_CHARS = int(os.getenv("PDF_TEXT_LAYER_MIN_CHARS", "100"))
+
+# TEXT LOADER SETUP
+TEXT_LOADER_EXTENSIONS = os.getenv(
+    "TEXT_LOADER_EXTENSIONS",
+    ".txt,.md,.markdown,.rst,.log,.csv,.tsv,.json,.jsonl,.yaml,.yml,.toml,.ini,.cfg,.xml,.html,.htm,"
+    ".py,.js,.ts,.tsx,.jsx,.java,.kt,.go,.rs,.c,.h,.cpp,.hpp,.cs,.rb,.php,.swift,.sh,.sql,.r,.m,.tex"
+).split(",")
+TEXT_LOADER_SKIP_EXTENSIONS = [ext for ext in os.getenv("TEXT_LOADER_SKIP_EXTENSIONS", ".lock,.min.js").split(",") if ext]
+TEXT_LOADER_MAX_FILE_BYTES = int(os.getenv("TEXT_LOADER_MAX_FILE_BYTES", str(4 * 1024 ** 3)))
+# Characters read per piece before chunking, and chunks handed to the embedder per pipeline job
+TEXT_LOADER_SEGMENT_CHARS = int(os.getenv("TEXT_LOADER_SEGMENT_CHARS", "65536"))
+TEXT_LOADER_CHUNKS_PER_PART = int(os.getenv("TEXT_LOADER_CHUNKS_PER_PART", "256"))
+
+# OCR CACHE SETUP
+# Azure Document Intelligence results are kept on disk so rebuilding the index does not OCR documents again
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "true").lower() == "true"
+OCR_CACHE_DIR = os.getenv("OCR_CACHE_DIR", "./ocr_cache")
+OCR_CACHE_MAX_BYTES = int(os.getenv("OCR_CACHE_MAX_BYTES", str(1024 ** 3)))
+
+# DOCUMENT INTELLIGENCE CLIENT SETUP
+AZURE_DI_MAX_CONCURRENCY = int(os.getenv("AZURE_DI_MAX_CONCURRENCY", "4"))
+# Token bucket shared by every request; 429/503 responses pause it for their Retry-After
+AZURE_DI_REQUESTS_PER_SECOND = float(os.getenv("AZURE_DI_REQUESTS_PER_SECOND", "1.0"))
+AZURE_DI_BURST = int(os.getenv("AZURE_DI_BURST", "4"))
+AZURE_DI_MAX_RETRIES = int(os.getenv("AZURE_DI_MAX_RETRIES", "5"))
+AZURE_DI_POLLING_INTERVAL = float(os.getenv("AZURE_DI_POLLING_INTERVAL", "1.0"))
+# PDFs with more pages than this are analyzed as several page ranges in parallel
+AZURE_DI_PAGES_PER_REQUEST = int(os.getenv("AZURE_DI_PAGES_PER_REQUEST", "20"))
+
+# METRICS SETUP
+METRICS_RATE_WINDOW_SECONDS = float(os.getenv("METRICS_RATE_WINDOW_SECONDS", "60"))
+# JSON snapshot written periodically (empty to disable) and optional Prometheus endpoint (0 to disable)
+METRICS_EXPORT_PATH = os.getenv("METRICS_EXPORT_PATH", "./ingest_metrics.json")
+METRICS_EXPORT_INTERVAL_SECONDS = float(os.getenv("METRICS_EXPORT_INTERVAL_SECONDS", "10"))
+METRICS_HTTP_PORT = int(os.getenv("METRICS_HTTP_PORT", "0"))
+METRICS_PANEL_REFRESH_SECONDS = float(os.getenv("METRICS_PANEL_REFRESH_SECONDS", "5"))
+
+# BACKGROUND INGESTION SETUP
+# Files waiting in the priority queue in front of the ingestion pipeline; the directory scan pauses when it is full
+INGEST_BACKLOG_MAX_FILES = int(os.getenv("INGEST_BACKLOG_MAX_FILES", "10000"))
+# Files modified within this window, and files up to this size, are ingested ahead of the bulk backlog
+INGEST_RECENT_SECONDS = float(os.getenv("INGEST_RECENT_SECONDS", str(24 * 3600)))
+INGEST_SMALL_FILE_BYTES = int(os.getenv("INGEST_SMALL_FILE_BYTES", str(1024 * 1024)))
+
+# IMAGE PIPELINE SETUP
+# Images are decoded straight to thumbnails whose short side is this many pixels (CLIP's input resolution)
+IMAGE_THUMBNAIL_SIZE = int(os.getenv("IMAGE_THUMBNAIL_SIZE", "224"))
+IMAGE_DECODE_WORKERS = int(os.getenv("IMAGE_DECODE_WORKERS", str(os.cpu_count() or 1)))
+# Thumbnails are embedded in CLIP forward passes of up to this many images
+IMAGE_EMBED_BATCH_SIZE = int(os.getenv("IMAGE_EMBED_BATCH_SIZE", "32"))
+IMAGE_EMBED_MAX_IN_FLIGHT = int(os.getenv("IMAGE_EMBED_MAX_IN_FLIGHT", "2"))
+IMAGE_EMBED_BATCH_LINGER_SECONDS = float(os.getenv("IMAGE_EMBED_BATCH_LINGER_SECONDS", "0.2"))
+
+# CLIP MODEL SETUP
+# The model multimodal_collection was built with; another model needs another collection
+CLIP_MODEL_NAME = os.getenv("CLIP_MODEL_NAME", "ViT-H-14")
+CLIP_CHECKPOINT = os.getenv("CLIP_CHECKPOINT", "laion2b_s32b_b79k")
+CLIP_DEVICE = os.getenv("CLIP_DEVICE", "cpu")
+# host:port or socket path of a shared model worker (python -m ingestor.clip_server); empty loads CLIP in-process
+CLIP_SERVER_ADDRESS = os.getenv("CLIP_SERVER_ADDRESS", "")
+# Shared secret of the worker and its clients. Required for a TCP address; a socket path without one uses a random
+# key kept next to the socket in a file only this user can read
+CLIP_SERVER_AUTHKEY = os.getenv("CLIP_SERVER_AUTHKEY", "")
+# Start the worker in the background when nothing answers at CLIP_SERVER_ADDRESS
+CLIP_SERVER_AUTOSTART = os.getenv("CLIP_SERVER_AUTOSTART", "true").lower() == "true"
+CLIP_SERVER_START_TIMEOUT_SECONDS = float(os.getenv("CLIP_SERVER_START_TIMEOUT_SECONDS", "120"))
+CLIP_SERVER_LOG_PATH = os.getenv("CLIP_SERVER_LOG_PATH", "./clip_server.log")
+
+# QUERY EMBEDDING CACHE SETUP
+# Search queries are embedded once per (provider, model, normalized query) across turns, sessions and processes
+QUERY_EMBEDDING_CACHE_ENABLED = os.getenv("QUERY_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+QUERY_EMBEDDING_CACHE_PATH = os.getenv("QUERY_EMBEDDING_CACHE_PATH", "./query_embeddings.db")
+QUERY_EMBEDDING_CACHE_MEMORY_ITEMS = int(os.getenv("QUERY_EMBEDDING_CACHE_MEMORY_ITEMS", "1024"))
+QUERY_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+# CHUNK EMBEDDING CACHE SETUP
+# Chunk embeddings keyed by (model, chunk hash), kept outside the vector store so rebuilding it costs no API calls
+CHUNK_EMBEDDING_CACHE_ENABLED = os.getenv("CHUNK_EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+CHUNK_EMBEDDING_CACHE_PATH = os.getenv("CHUNK_EMBEDDING_CACHE_PATH", "./chunk_embeddings.db")
+CHUNK_EMBEDDING_CACHE_MAX_BYTES = int(os.getenv("CHUNK_EMBEDDING_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# TEXT EMBEDDING SETUP
+# "openai" calls the OpenAI API; "local" runs an ONNX sentence-embedding model on this machine's CPU
+TEXT_EMBEDDING_PROVIDER = os.getenv("TEXT_EMBEDDING_PROVIDER", "openai")
+TEXT_EMBEDDING_OPENAI_MODEL = os.getenv("TEXT_EMBEDDING_OPENAI_MODEL", "text-embedding-3-large")
+# Shortened text-embedding-3 vectors (e.g. 1024 instead of 3072), returned by the API itself; 0 keeps the full size
+TEXT_EMBEDDING_OPENAI_DIMENSIONS = int(os.getenv("TEXT_EMBEDDING_OPENAI_DIMENSIONS", "0"))
+# Directory with model.onnx (quantized exports work) and tokenizer.json; empty uses Chroma's all-MiniLM-L6-v2
+TEXT_EMBEDDING_LOCAL_MODEL_PATH = os.getenv("TEXT_EMBEDDING_LOCAL_MODEL_PATH", "")
+# Recorded with the collection and in cache keys; defaults to the model directory's name
+TEXT_EMBEDDING_LOCAL_MODEL_NAME = os.getenv("TEXT_EMBEDDING_LOCAL_MODEL_NAME", "")
+TEXT_EMBEDDING_LOCAL_THREADS = int(os.getenv("TEXT_EMBEDDING_LOCAL_THREADS", str(os.cpu_count() or 1)))
+TEXT_EMBEDDING_LOCAL_BATCH_SIZE = int(os.getenv("TEXT_EMBEDDING_LOCAL_BATCH_SIZE", "32"))
+TEXT_EMBEDDING_LOCAL_MAX_LENGTH = int(os.getenv("TEXT_EMBEDDING_LOCAL_MAX_LENGTH", "256"))
+# Each provider needs a collection of its own; keep one per provider to switch back and forth without re-indexing
+TEXT_COLLECTION_NAME = os.getenv("TEXT_COLLECTION_NAME", "text_collection")
+
+# VECTOR STORE SETUP
+# "chroma" uses Chroma's persistent client; "numpy" keeps vectors in memory-mapped arrays that open instantly
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "chroma")
+VECTOR_STORE_CHROMA_DIR = os.getenv("VECTOR_STORE_CHROMA_DIR", "./vector_store")
+VECTOR_STORE_NUMPY_DIR = os.getenv("VECTOR_STORE_NUMPY_DIR", "./vector_index")
+# float16 halves the disk and page cache footprint; fixed when a collection is created
+VECTOR_STORE_NUMPY_DTYPE = os.getenv("VECTOR_STORE_NUMPY_DTYPE", "float16")
+# "exact" always scans every vector; "ivf" clusters collections of at least IVF_MIN_ROWS vectors and scans a few lists
+VECTOR_STORE_NUMPY_INDEX = os.getenv("VECTOR_STORE_NUMPY_INDEX", "ivf")
+VECTOR_STORE_NUMPY_IVF_MIN_ROWS = int(os.getenv("VECTOR_STORE_NUMPY_IVF_MIN_ROWS", "50000"))
+# 0 picks the square root of the number of vectors
+VECTOR_STORE_NUMPY_IVF_LISTS = int(os.getenv("VECTOR_STORE_NUMPY_IVF_LISTS", "0"))
+VECTOR_STORE_NUMPY_IVF_PROBES = int(os.getenv("VECTOR_STORE_NUMPY_IVF_PROBES", "8"))
+# Vectors converted to float32 at a time while searching, which bounds the memory a query needs
+VECTOR_STORE_NUMPY_SCAN_BYTES = int(os.getenv("VECTOR_STORE_NUMPY_SCAN_BYTES", str(64 * 1024 * 1024)))
+# Leading dimensions kept per vector (Matryoshka truncation, 0 keeps all); fixed when a collection is created
+VECTOR_STORE_NUMPY_DIMENSIONS = int(os.getenv("VECTOR_STORE_NUMPY_DIMENSIONS", "0"))
+# "int8" (1 byte per value) or "binary" (1 bit per value) codes for a first pass, rescored at full precision
+VECTOR_STORE_NUMPY_QUANTIZATION = os.getenv("VECTOR_STORE_NUMPY_QUANTIZATION", "none")
+# Candidates rescored per result; raise it for binary codes or when `recall` reports a low recall
+VECTOR_STORE_NUMPY_RESCORE_FACTOR = int(os.getenv("VECTOR_STORE_NUMPY_RESCORE_FACTOR", "4"))
+
+# HYBRID SEARCH SETUP
+# "hybrid" fuses BM25 keyword and vector rankings; "keyword" skips the query embedding; "vector" is dense-only
+SEARCH_MODE = os.getenv("SEARCH_MODE", "hybrid")
+# Candidates taken from each ranking before fusing them (at least top_k)
+SEARCH_HYBRID_CANDIDATES = int(os.getenv("SEARCH_HYBRID_CANDIDATES", "20"))
+# Reciprocal-rank fusion constant: larger values flatten the advantage of the first ranks
+SEARCH_RRF_K = int(os.getenv("SEARCH_RRF_K", "60"))
+
+# SEARCH RESULT PACKING SETUP
+# Prompt tokens one search tool result may take; the best hits fill it first
+SEARCH_RESULT_TOKEN_BUDGET = int(os.getenv("SEARCH_RESULT_TOKEN_BUDGET", "1200"))
+# Hits less similar than this (cosine similarity of normalized embeddings) are dropped; keyword matches are kept
+SEARCH_MIN_SIMILARITY = float(os.getenv("SEARCH_MIN_SIMILARITY", "0.2"))
+# CLIP similarities run lower than text-embedding ones, so image search has its own threshold
+IMAGE_SEARCH_MIN_SIMILARITY = float(os.getenv("IMAGE_SEARCH_MIN_SIMILARITY", "0.15"))
+# A hit cut to fit the budget keeps at least this many tokens, otherwise it is left out
+SEARCH_RESULT_MIN_HIT_TOKENS = int(os.getenv("SEARCH_RESULT_MIN_HIT_TOKENS", "40"))
@@ -4,7 +4,7 @@ from typing import Any, Iterator, List, Optional
 
 from langchain_community.document_loaders.base import BaseBlobParser
 from langchain_community.document_loaders.blob_loaders import Blob
-from data_loaders.datatype import Document
+from data_loaders.datatype import Document, LeanDocument
 from azure.ai.documentintelligence import DocumentIntelligenceClient
 from azure.ai.documentintelligence.models import DocumentAnalysisFeature, AnalyzeDocumentRequest
 from azure.core.credentials import AzureKeyCredential
@@ -23,8 +23,11 @@ class AzureAIDocumentIntelligenceParser(BaseBlobParser):
             api_model: str = "prebuilt-layout",
             mode: str = "markdown",
             analysis_features: Optional[List[str]] = None,
+            client_options: Optional[dict] = None,
+            lean: bool = False,
     ):
-        kwargs = {}
+        # client_options are passed to DocumentIntelligenceClient, e.g. retry or polling settings
+        kwargs = dict(client_options or {})
         if api_version:
             kwargs["api_version"] = api_version
 
@@ -45,6 +48,8 @@ class AzureAIDocumentIntelligenceParser(BaseBlobParser):
         )
         self.api_model = api_model
         self.mode = mode
+        # Lean results skip validating word/line geometry that ingestion never reads
+        self.lean = lean
         assert self.mode in ["single", "page", "markdown"]
 
     def lazy_parse(self, blob: Blob) -> Any:
@@ -60,14 +65,19 @@ class AzureAIDocumentIntelligenceParser(BaseBlobParser):
             print(result)
             return Document(**result)
 
-    def lazy_parse_file_obj(self, file_obj: Any) -> Any:
+    def lazy_parse_file_obj(self, file_obj: Any, pages: Optional[str] = None) -> Any:
+        """Analyze a file object; `pages` restricts the analysis to a page range such as "1-3,5"."""
+        kwargs = {"pages": pages} if pages else {}
         poller = self.client.begin_analyze_document(
             self.api_model,
             file_obj,
             content_type="application/octet-stream",
             output_content_format="markdown" if self.mode == "markdown" else "text",
+            **kwargs,
         )
         result = poller.result()
+        if self.lean:
+            return LeanDocument(result)
         print(result)
         return Document(**result)
 
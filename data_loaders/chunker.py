@@ -0,0 +1,217 @@
+import re
+from typing import List, Optional, Tuple
+
+from config.settings import CHUNK_TARGET_TOKENS, CHUNK_OVERLAP_TOKENS
+from utils.tokens import count_tokens
+
+# Blocks that must never be split across a blank line: HTML tables/figures emitted by the Azure layout model
+HTML_BLOCK_PATTERN = re.compile(r'<(table|figure)\b.*?</\1>', re.DOTALL | re.IGNORECASE)
+HEADING_PATTERN = re.compile(r'^\s{0,3}#{1,6}\s+(.*?)\s*#*\s*$')
+BLANK_LINE_PATTERN = re.compile(r'\n[ \t]*\n')
+WORD_PATTERN = re.compile(r'\S+')
+
+
+def split_blocks(text: str) -> List[dict]:
+    """
+    Split markdown into structural blocks: headings, tables, figures and paragraphs.
+
+    :return: [{'kind': 'heading' | 'table' | 'paragraph', 'start': int, 'end': int, 'heading': Optional[str]}]
+    """
+    blocks = []
+    position = 0
+    for match in HTML_BLOCK_PATTERN.finditer(text):
+        blocks.extend(_split_plain_blocks(text, position, match.start()))
+        blocks.append({'kind': 'table', 'start': match.start(), 'end': match.end()})
+        position = match.end()
+    blocks.extend(_split_plain_blocks(text, position, len(text)))
+    return blocks
+
+
+def _split_plain_blocks(text, start, end):
+    blocks = []
+    position = start
+    separators = [match.span() for match in BLANK_LINE_PATTERN.finditer(text, start, end)]
+    for separator_start, separator_end in separators + [(end, end)]:
+        blocks.extend(_classify_lines(text, position, separator_start))
+        position = separator_end
+    return blocks
+
+
+def _classify_lines(text, start, end):
+    """Pull headings and pipe-table rows out of a paragraph so each becomes its own block."""
+    blocks = []
+    paragraph_start = None
+    line_start = start
+    while line_start < end:
+        line_end = text.find('\n', line_start, end)
+        line_end = end if line_end == -1 else line_end
+        line = text[line_start:line_end]
+        heading = HEADING_PATTERN.match(line)
+        kind = 'heading' if heading else ('table' if line.lstrip().startswith('|') else 'paragraph')
+
+        if kind == 'paragraph':
+            if paragraph_start is None:
+                paragraph_start = line_start
+        else:
+            if paragraph_start is not None:
+                blocks.append(_block('paragraph', text, paragraph_start, line_start))
+                paragraph_start = None
+            if kind == 'table' and blocks and blocks[-1]['kind'] == 'table' and blocks[-1].get('pipe'):
+                blocks[-1]['end'] = line_end
+            else:
+                block = _block(kind, text, line_start, line_end)
+                if heading:
+                    block['heading'] = heading.group(1)
+                block['pipe'] = kind == 'table'
+                blocks.append(block)
+        line_start = line_end + 1
+
+    if paragraph_start is not None:
+        blocks.append(_block('paragraph', text, paragraph_start, end))
+    return [block for block in blocks if text[block['start']:block['end']].strip()]
+
+
+def _block(kind, text, start, end):
+    # Trim trailing whitespace so offsets point at the visible content
+    while end > start and text[end - 1] in ' \t\n':
+        end -= 1
+    return {'kind': kind, 'start': start, 'end': end}
+
+
+def _split_oversized(text, start, end, target_tokens):
+    """Split a block larger than the target at line boundaries, falling back to word windows."""
+    pieces = []
+    piece_start, piece_tokens = start, 0
+    line_start = start
+    while line_start < end:
+        line_end = text.find('\n', line_start, end)
+        line_end = end if line_end == -1 else line_end + 1
+        line_tokens = count_tokens(text[line_start:line_end])
+        if line_tokens > target_tokens:
+            if piece_start < line_start:
+                pieces.append((piece_start, line_start))
+            pieces.extend(_split_words(text, line_start, line_end, target_tokens))
+            piece_start, piece_tokens = line_end, 0
+        elif piece_tokens + line_tokens > target_tokens and piece_start < line_start:
+            pieces.append((piece_start, line_start))
+            piece_start, piece_tokens = line_start, line_tokens
+        else:
+            piece_tokens += line_tokens
+        line_start = line_end
+    if piece_start < end:
+        pieces.append((piece_start, end))
+    return pieces
+
+
+def _split_words(text, start, end, target_tokens):
+    pieces = []
+    piece_start, piece_tokens = None, 0
+    for word in WORD_PATTERN.finditer(text, start, end):
+        word_tokens = count_tokens(word.group()) + 1
+        if piece_start is not None and piece_tokens + word_tokens > target_tokens:
+            pieces.append((piece_start, word.start()))
+            piece_start, piece_tokens = None, 0
+        if piece_start is None:
+            piece_start = word.start()
+        piece_tokens += word_tokens
+    if piece_start is not None:
+        pieces.append((piece_start, end))
+    return pieces
+
+
+def _overlap_start(text, start, end, overlap_tokens):
+    """Offset inside [start, end) where the trailing `overlap_tokens` tokens begin (at a word boundary)."""
+    if overlap_tokens <= 0:
+        return end
+    words = list(WORD_PATTERN.finditer(text, start, end))
+    tokens = 0
+    overlap = end
+    for word in reversed(words):
+        tokens += count_tokens(word.group()) + 1
+        if tokens > overlap_tokens:
+            break
+        overlap = word.start()
+    return overlap
+
+
+def chunk_text(text: str, target_tokens: int = CHUNK_TARGET_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+               heading: Optional[str] = None) -> List[dict]:
+    """
+    Pack the structural blocks of `text` into chunks of about `target_tokens` tokens.
+
+    Chunks break before headings, never cut a table unless the table alone exceeds the target, and repeat the last
+    `overlap_tokens` tokens of a paragraph at the start of the next chunk when a paragraph run is split.
+
+    :return: [{'content', 'char_start', 'char_end', 'heading'}]; offsets index into `text`.
+    """
+    return chunk_segment(text, target_tokens, overlap_tokens, heading)[0]
+
+
+def chunk_segment(text: str, target_tokens: int = CHUNK_TARGET_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                  heading: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """Like chunk_text, but also returns the last heading seen so the next page/segment can inherit it."""
+    spans = []
+    for block in split_blocks(text):
+        if count_tokens(text[block['start']:block['end']]) > target_tokens:
+            for start, end in _split_oversized(text, block['start'], block['end'], target_tokens):
+                spans.append({'kind': block['kind'], 'start': start, 'end': end})
+        else:
+            spans.append(block)
+
+    chunks = []
+    current = None
+    for span in spans:
+        span_tokens = count_tokens(text[span['start']:span['end']])
+        if current is not None:
+            overflow = current['tokens'] + span_tokens > target_tokens
+            section_break = span['kind'] == 'heading' and current['tokens'] >= target_tokens // 4
+            if overflow or section_break:
+                chunks.append(_chunk(text, current['start'], current['end'], current['heading']))
+                continues_paragraphs = current['last_kind'] == 'paragraph' and span['kind'] == 'paragraph'
+                overlap = _overlap_start(text, current['start'], current['end'], overlap_tokens)
+                if overflow and continues_paragraphs and overlap < current['end']:
+                    current['start'] = overlap
+                    current['tokens'] = count_tokens(text[overlap:current['end']])
+                else:
+                    current = None
+
+        if span['kind'] == 'heading' and span.get('heading'):
+            heading = span['heading']
+        if current is None:
+            current = {'start': span['start'], 'end': span['end'], 'tokens': 0, 'heading': heading}
+        current['end'] = span['end']
+        current['tokens'] += span_tokens
+        current['last_kind'] = span['kind']
+
+    if current is not None:
+        chunks.append(_chunk(text, current['start'], current['end'], current['heading']))
+    return chunks, heading
+
+
+def _chunk(text, start, end, heading):
+    return {'content': text[start:end], 'char_start': start, 'char_end': end, 'heading': heading}
+
+
+def chunk_pages(pages: List[dict], target_tokens: int = CHUNK_TARGET_TOKENS,
+                overlap_tokens: int = CHUNK_OVERLAP_TOKENS) -> List[dict]:
+    """
+    Chunk the output of Document.get_list_of_pages_with_metadata.
+
+    Every chunk keeps the page metadata and adds `chunk_index`, `char_start`/`char_end` (offsets within the page)
+    and, when known, the nearest preceding `heading`, which carries over from earlier pages.
+    """
+    chunks = []
+    heading = None
+    for page in pages:
+        page_chunks, heading = chunk_segment(page['content'], target_tokens, overlap_tokens, heading)
+        for index, chunk in enumerate(page_chunks):
+            metadata = {
+                **page['metadata'],
+                'chunk_index': index,
+                'char_start': chunk['char_start'],
+                'char_end': chunk['char_end'],
+            }
+            if chunk['heading']:
+                metadata['heading'] = chunk['heading']
+            chunks.append({'content': chunk['content'], 'metadata': metadata})
+    return chunks
@@ -1,4 +1,5 @@
-from typing import List, Optional
+from collections import namedtuple
+from typing import Any, List, Optional
 from pydantic import BaseModel, Field
 
 
@@ -95,8 +96,104 @@ class Document(BaseModel):
                 }
             }
 
-            for span in page.spans:
-                page_content['content'] += self.content[span.offset:span.offset + span.length]
+            page_content['content'] = get_span_text(self.content, page.spans)
             pages.append(page_content)
 
         return pages
+
+
+def get_span_text(content: str, spans) -> str:
+    """Text covered by `spans`, joined in one allocation instead of growing a string per span."""
+    if not spans:
+        return ""
+    if len(spans) == 1:
+        return content[spans[0].offset:spans[0].offset + spans[0].length]
+    return "".join(content[span.offset:span.offset + span.length] for span in spans)
+
+
+LeanSpan = namedtuple('LeanSpan', ['offset', 'length'])
+
+
+class LeanParagraph(BaseModel):
+    role: Optional[str] = None
+    spans: List[Span] = None
+
+
+class LeanPage:
+    """
+    Page of a LeanDocument: the page number and spans are read up front, while words, lines and geometry are only
+    validated into the full models when accessed.
+    """
+    __slots__ = ('pageNumber', 'spans', '_raw', '_words', '_lines')
+
+    def __init__(self, raw: dict):
+        self.pageNumber = raw.get('pageNumber')
+        self.spans = [LeanSpan(span['offset'], span['length']) for span in raw.get('spans') or []]
+        self._raw = raw
+        self._words = None
+        self._lines = None
+
+    @property
+    def words(self) -> List[Word]:
+        if self._words is None:
+            self._words = [Word(**word) for word in self._raw.get('words') or []]
+        return self._words
+
+    @property
+    def lines(self) -> List[Line]:
+        if self._lines is None:
+            self._lines = [Line(**line) for line in self._raw.get('lines') or []]
+        return self._lines
+
+    def to_page(self) -> Page:
+        return Page(**self._raw)
+
+
+class LeanDocument:
+    """
+    Analyze result that materializes only what ingestion reads: `content`, page numbers and page spans, plus
+    optionally tables and paragraph roles. Everything else stays as the raw service JSON and is validated into the
+    Document models on first access, so large scans do not build a model object per word polygon.
+
+    :param result: Raw analyze result (a dict or the SDK's AnalyzeResult mapping).
+    :param include_tables: Validate tables up front.
+    :param include_paragraph_roles: Keep the role and spans of every paragraph, without its geometry.
+    """
+
+    def __init__(self, result: Any, include_tables: bool = False, include_paragraph_roles: bool = False):
+        self._raw = result
+        self.content = result.get('content') or ""
+        self.contentFormat = result.get('contentFormat')
+        self.pages = [LeanPage(page) for page in result.get('pages') or []]
+        self._tables = [Table(**table) for table in result.get('tables') or []] if include_tables else None
+        self.paragraph_roles = None
+        if include_paragraph_roles:
+            self.paragraph_roles = [
+                LeanParagraph(role=paragraph.get('role'), spans=paragraph.get('spans'))
+                for paragraph in result.get('paragraphs') or []
+            ]
+        self._document = None
+
+    @property
+    def tables(self) -> List[Table]:
+        if self._tables is None:
+            self._tables = [Table(**table) for table in self._raw.get('tables') or []]
+        return self._tables
+
+    def to_document(self) -> Document:
+        """The fully validated Document, built on first use."""
+        if self._document is None:
+            self._document = Document(**self._raw)
+        return self._document
+
+    def get_list_of_pages_with_metadata(self, source: str):
+        return [
+            {
+                "content": get_span_text(self.content, page.spans),
+                "metadata": {
+                    "source": source,
+                    "page_number": page.pageNumber
+                }
+            }
+            for page in self.pages
+        ]
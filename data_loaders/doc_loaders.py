@@ -1,28 +1,63 @@
 from langchain_core.document_loaders import Blob
 
-from data_loaders.AzureAIDocumentIntelligenceParser import AzureAIDocumentIntelligenceParser, generate_markdown_pages
+from config.settings import PDF_TEXT_LAYER_ENABLED, OCR_CACHE_ENABLED
+from data_loaders.ocr_cache import get_ocr_cache, get_content_hash
+from data_loaders.ocr_client import get_ocr_client, OCR_API_MODEL, OCR_MODE
+from data_loaders.pdf_text_layer import extract_text_layer, has_usable_text, format_page_ranges
 
 
-def ocr_pdf(file_obj, source: str):
-    ocr = AzureAIDocumentIntelligenceParser(
-        api_endpoint="AZURE_DOCUMENT_INTELLIGENCE_API_ENDPOINT",
-        api_key="AZURE_DOCUMENT_INTELLIGENCE_API_KEY",
-        api_model="prebuilt-layout",
-        mode="markdown",
-    )
-    doc = ocr.lazy_parse_file_obj(file_obj)
-    pages = generate_markdown_pages(doc, source)
-    return pages
+def ocr_pdf(file_obj, source: str, pages: str = None):
+    data = file_obj.read()
+    content_hash = get_content_hash(data) if OCR_CACHE_ENABLED else None
+    if content_hash:
+        cached_pages = get_ocr_cache().get(content_hash, OCR_API_MODEL, OCR_MODE, pages=pages)
+        if cached_pages is not None:
+            # Cached pages are stored without a source so identical files at other paths can share them
+            return [{**page, 'metadata': {**page['metadata'], 'source': source}} for page in cached_pages]
+
+    markdown_pages = get_ocr_client().analyze_pdf(data, source, pages=pages)
+    if content_hash:
+        get_ocr_cache().put(content_hash, OCR_API_MODEL, OCR_MODE, pages=pages, value=[
+            {**page, 'metadata': {key: value for key, value in page['metadata'].items() if key != 'source'}}
+            for page in markdown_pages
+        ])
+    return markdown_pages
+
+
+def extract_pdf(file_obj, source: str):
+    """
+    Extract PDF pages from the local text layer, sending only scanned/textless pages to Azure OCR.
+    """
+    local_pages = extract_text_layer(file_obj, source) if PDF_TEXT_LAYER_ENABLED else None
+    if local_pages is None:
+        file_obj.seek(0)
+        return ocr_pdf(file_obj, source)
+
+    scanned_pages = [page['metadata']['page_number'] for page in local_pages if not has_usable_text(page['content'])]
+    if not scanned_pages:
+        return local_pages
+
+    file_obj.seek(0)
+    ocr_pages = {
+        page['metadata']['page_number']: page
+        for page in ocr_pdf(file_obj, source, pages=format_page_ranges(scanned_pages))
+    }
+    for page in ocr_pages.values():
+        page['metadata']['extractor'] = 'ocr'
+    return [ocr_pages.get(page['metadata']['page_number'], page) for page in local_pages]
 
 
 def ocr_image(file_obj, source: str):
-    ocr = AzureAIDocumentIntelligenceParser(
-        api_endpoint="AZURE_DOCUMENT_INTELLIGENCE_API_ENDPOINT",
-        api_key="AZURE_DOCUMENT_INTELLIGENCE_API_KEY",
-        api_model="prebuilt-layout",
-        mode="markdown",
-    )
-    doc = ocr.lazy_parse_file_obj(file_obj)
+    data = file_obj.read()
+    content_hash = get_content_hash(data) if OCR_CACHE_ENABLED else None
+    if content_hash:
+        cached_content = get_ocr_cache().get(content_hash, OCR_API_MODEL, OCR_MODE)
+        if cached_content is not None:
+            return cached_content
+
+    doc = get_ocr_client().analyze(data)
+    if content_hash:
+        get_ocr_cache().put(content_hash, OCR_API_MODEL, OCR_MODE, value=doc.content)
     return doc.content
 
 # file_obj = open("Karan Chavan Resume.pdf", "rb")
@@ -0,0 +1,149 @@
+"""
+Local stand-in for the Azure Document Intelligence analyze API, for running OCR ingestion offline.
+
+    python -m data_loaders.fake_azure_di --port 8765 --requests-per-second 2 --latency 0.5
+
+Then point AZURE_DOCUMENT_INTELLIGENCE_API_ENDPOINT at http://127.0.0.1:8765 (any API key is accepted). Page text
+comes from the PDF text layer, or from the raw bytes split on form feeds for anything else. Requests above
+`--requests-per-second` get a 429 with Retry-After, like the real service; GET /stats reports what was served.
+"""
+import argparse
+import io
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+from data_loaders.pdf_text_layer import parse_page_ranges
+
+API_VERSION = "2024-11-30"
+
+
+def read_pages(data: bytes) -> list:
+    if PdfReader is not None and data.startswith(b'%PDF'):
+        try:
+            return [page.extract_text() or "" for page in PdfReader(io.BytesIO(data)).pages]
+        except Exception:
+            pass
+    return data.decode('utf-8', errors='replace').split('\f')
+
+
+def build_analyze_result(model_id: str, page_texts: list, pages: str = None) -> dict:
+    page_numbers = parse_page_ranges(pages) if pages else range(1, len(page_texts) + 1)
+    content, result_pages = "", []
+    for page_number in page_numbers:
+        if page_number > len(page_texts):
+            continue
+        if content:
+            content += "\n<!-- PageBreak -->\n\n"
+        page_content = page_texts[page_number - 1]
+        result_pages.append({
+            "pageNumber": page_number,
+            "angle": 0,
+            "width": 8.5,
+            "height": 11,
+            "unit": "inch",
+            "words": [],
+            "lines": [],
+            "spans": [{"offset": len(content), "length": len(page_content)}],
+        })
+        content += page_content
+    return {
+        "apiVersion": API_VERSION,
+        "modelId": model_id,
+        "stringIndexType": "textElements",
+        "content": content,
+        "contentFormat": "markdown",
+        "pages": result_pages,
+        "tables": [],
+        "paragraphs": [],
+        "sections": [],
+        "figures": [],
+    }
+
+
+def create_app(requests_per_second: float = 0, latency: float = 0.0) -> FastAPI:
+    app = FastAPI(title="Fake Azure Document Intelligence")
+    lock = threading.Lock()
+    operations = {}
+    recent_requests = []
+    stats = {'analyze_requests': 0, 'throttled': 0, 'pages': 0, 'running': 0, 'max_running': 0}
+
+    def now_iso():
+        return datetime.now(timezone.utc).isoformat()
+
+    def refresh_running():
+        # An operation counts as running until its latency has elapsed
+        now = time.monotonic()
+        stats['running'] = sum(1 for operation in operations.values() if operation['ready_at'] > now)
+        stats['max_running'] = max(stats['max_running'], stats['running'])
+
+    @app.post("/documentintelligence/documentModels/{model_id}:analyze")
+    async def analyze(model_id: str, request: Request, pages: str = None):
+        data = await request.body()
+        with lock:
+            now = time.monotonic()
+            recent_requests[:] = [moment for moment in recent_requests if moment > now - 1]
+            if requests_per_second and len(recent_requests) >= requests_per_second:
+                stats['throttled'] += 1
+                return JSONResponse(
+                    status_code=429,
+                    headers={"Retry-After": "1"},
+                    content={"error": {"code": "429", "message": "Rate limit is exceeded. Try again later."}},
+                )
+            recent_requests.append(now)
+            stats['analyze_requests'] += 1
+
+        result = build_analyze_result(model_id, read_pages(data), pages)
+        result_id = str(uuid.uuid4())
+        with lock:
+            operations[result_id] = {'ready_at': time.monotonic() + latency, 'created': now_iso(), 'result': result}
+            stats['pages'] += len(result['pages'])
+            refresh_running()
+        location = (f"{str(request.base_url).rstrip('/')}/documentintelligence/documentModels/{model_id}"
+                    f"/analyzeResults/{result_id}?api-version={API_VERSION}")
+        return JSONResponse(status_code=202, content=None, headers={"Operation-Location": location})
+
+    @app.get("/documentintelligence/documentModels/{model_id}/analyzeResults/{result_id}")
+    async def analyze_result(model_id: str, result_id: str):
+        with lock:
+            operation = operations.get(result_id)
+            refresh_running()
+        if operation is None:
+            return JSONResponse(status_code=404, content={"error": {"code": "NotFound", "message": result_id}})
+        body = {"status": "running", "createdDateTime": operation['created'], "lastUpdatedDateTime": now_iso()}
+        if operation['ready_at'] <= time.monotonic():
+            body.update(status="succeeded", analyzeResult=operation['result'])
+        return body
+
+    @app.get("/stats")
+    async def get_stats():
+        with lock:
+            refresh_running()
+            return dict(stats)
+
+    return app
+
+
+def main():
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Run a fake Azure Document Intelligence endpoint.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--requests-per-second', type=float, default=0, help="Throttle above this rate (0: never)")
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds before an analysis succeeds")
+    args = parser.parse_args()
+    uvicorn.run(create_app(args.requests_per_second, args.latency), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image, ImageOps
+
+from config.settings import IMAGE_THUMBNAIL_SIZE, IMAGE_DECODE_WORKERS
+
+
+def load_thumbnail(path: str, size: int = IMAGE_THUMBNAIL_SIZE) -> np.ndarray:
+    """
+    Decode an image straight to an RGB thumbnail whose short side is `size` pixels.
+
+    JPEGs are decoded with draft mode, which lets libjpeg scale the image down by up to 8x while decoding, so a
+    12 MP photo never exists in memory at full resolution. Other formats are decoded in full and then reduced.
+    EXIF orientation is applied so the thumbnail is upright.
+
+    :return: HxWx3 uint8 array, the format CLIP embedding functions take.
+    """
+    with Image.open(path) as image:
+        # The draft is at least `size` pixels on both sides, so the short side never has to be scaled up
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGB')
+    scale = size / min(image.size)
+    if scale < 1:
+        thumbnail_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        image = image.resize(thumbnail_size, Image.BICUBIC, reducing_gap=2.0)
+    return np.asarray(image)
+
+
+_thumbnail_pool = None
+_thumbnail_pool_lock = threading.Lock()
+
+
+def get_thumbnail_pool() -> ProcessPoolExecutor:
+    """Process-wide pool that decodes images outside the GIL, created on first use."""
+    global _thumbnail_pool
+    with _thumbnail_pool_lock:
+        if _thumbnail_pool is None:
+            _thumbnail_pool = ProcessPoolExecutor(max_workers=max(1, IMAGE_DECODE_WORKERS))
+        return _thumbnail_pool
+
+
+def submit_thumbnail(path: str, size: int = IMAGE_THUMBNAIL_SIZE) -> Future:
+    """
+    Start decoding an image in the thumbnail pool.
+
+    :return: Future resolving to the load_thumbnail array, or raising the error the image failed with.
+    """
+    return get_thumbnail_pool().submit(load_thumbnail, path, size)
@@ -0,0 +1,167 @@
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Optional
+
+from config.settings import OCR_CACHE_DIR, OCR_CACHE_MAX_BYTES
+
+
+def get_content_hash(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+class OCRCache:
+    """
+    On-disk cache of Azure Document Intelligence results.
+
+    Entries are gzip-compressed JSON files keyed by (content hash, api_model, mode, pages), so a document is only sent
+    to Azure once no matter how often the catalog or the vector store is rebuilt. A small SQLite index tracks entry
+    sizes and last use; once the cache grows beyond `max_bytes` the least recently used entries are evicted.
+    """
+
+    def __init__(self, directory=OCR_CACHE_DIR, max_bytes=OCR_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.db_path = os.path.join(directory, 'index.db')
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.init_db()
+
+    def connect(self):
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    def init_db(self):
+        conn = self.connect()
+        conn.execute('''CREATE TABLE IF NOT EXISTS entries (
+                            key TEXT PRIMARY KEY,
+                            size INTEGER NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_used REAL NOT NULL)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_entries_last_used ON entries (last_used)')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def make_key(content_hash, api_model, mode, pages=None):
+        return hashlib.sha256(f"{content_hash}\x00{api_model}\x00{mode}\x00{pages or ''}".encode('utf-8')).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.directory, key[:2], f"{key}.json.gz")
+
+    def get(self, content_hash: str, api_model: str, mode: str, pages: Optional[str] = None) -> Optional[Any]:
+        """
+        :return: The cached result, or None on a miss.
+        """
+        key = self.make_key(content_hash, api_model, mode, pages)
+        try:
+            with gzip.open(self.entry_path(key), 'rt', encoding='utf-8') as f:
+                value = json.load(f)
+        except (OSError, ValueError):
+            return None
+        conn = self.connect()
+        conn.execute('UPDATE entries SET last_used = ? WHERE key = ?', (time.time(), key))
+        conn.commit()
+        conn.close()
+        return value
+
+    def put(self, content_hash: str, api_model: str, mode: str, value: Any, pages: Optional[str] = None):
+        key = self.make_key(content_hash, api_model, mode, pages)
+        path = self.entry_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with gzip.open(temp_path, 'wt', encoding='utf-8') as f:
+            json.dump(value, f)
+        os.replace(temp_path, path)
+
+        now = time.time()
+        conn = self.connect()
+        conn.execute('INSERT OR REPLACE INTO entries (key, size, created_at, last_used) VALUES (?, ?, ?, ?)',
+                     (key, os.path.getsize(path), now, now))
+        conn.commit()
+        conn.close()
+        self.prune(max_bytes=self.max_bytes)
+
+    def stats(self):
+        conn = self.connect()
+        entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries').fetchone()
+        conn.close()
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes, 'directory': self.directory}
+
+    def prune(self, max_bytes: Optional[int] = None, older_than: Optional[float] = None) -> int:
+        """
+        Evict entries last used more than `older_than` seconds ago, then least recently used entries until the cache
+        fits in `max_bytes`.
+
+        :return: Number of entries removed.
+        """
+        with self._lock:
+            conn = self.connect()
+            evicted = []
+            if older_than is not None:
+                evicted.extend(key for key, in conn.execute('SELECT key FROM entries WHERE last_used < ?',
+                                                            (time.time() - older_than,)))
+            if max_bytes is not None:
+                total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+                for key, size in conn.execute('SELECT key, size FROM entries ORDER BY last_used'):
+                    if total <= max_bytes:
+                        break
+                    if key not in evicted:
+                        evicted.append(key)
+                    total -= size
+            for key in evicted:
+                try:
+                    os.remove(self.entry_path(key))
+                except FileNotFoundError:
+                    pass
+            conn.executemany('DELETE FROM entries WHERE key = ?', [(key,) for key in evicted])
+            conn.commit()
+            conn.close()
+            return len(evicted)
+
+    def clear(self) -> int:
+        return self.prune(max_bytes=0)
+
+
+_ocr_cache = None
+_ocr_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRCache:
+    """Process-wide cache instance, created on first use."""
+    global _ocr_cache
+    with _ocr_cache_lock:
+        if _ocr_cache is None:
+            _ocr_cache = OCRCache()
+        return _ocr_cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or prune the OCR result cache.")
+    parser.add_argument('--dir', default=OCR_CACHE_DIR, help="Cache directory")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show the number and total size of cached results")
+    prune_parser = subparsers.add_parser('prune', help="Evict old or least recently used results")
+    prune_parser.add_argument('--max-bytes', type=int, default=None, help="Shrink the cache to at most this size")
+    prune_parser.add_argument('--older-than-days', type=float, default=None,
+                              help="Evict results not used for this many days")
+    subparsers.add_parser('clear', help="Remove every cached result")
+    args = parser.parse_args()
+
+    cache = OCRCache(directory=args.dir)
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == 'prune':
+        max_bytes = args.max_bytes if args.max_bytes is not None else cache.max_bytes
+        older_than = args.older_than_days * 86400 if args.older_than_days is not None else None
+        print(f"Removed {cache.prune(max_bytes=max_bytes, older_than=older_than)} cached result(s)")
+    elif args.command == 'clear':
+        print(f"Removed {cache.clear()} cached result(s)")
+
+
+if __name__ == '__main__':
+    main()
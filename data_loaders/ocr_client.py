@@ -0,0 +1,182 @@
+import io
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+from azure.core.exceptions import HttpResponseError
+
+from config.settings import (
+    AZURE_DOCUMENT_INTELLIGENCE_API_ENDPOINT,
+    AZURE_DOCUMENT_INTELLIGENCE_API_KEY,
+    AZURE_DI_MAX_CONCURRENCY,
+    AZURE_DI_REQUESTS_PER_SECOND,
+    AZURE_DI_BURST,
+    AZURE_DI_MAX_RETRIES,
+    AZURE_DI_POLLING_INTERVAL,
+    AZURE_DI_PAGES_PER_REQUEST,
+)
+from data_loaders.AzureAIDocumentIntelligenceParser import AzureAIDocumentIntelligenceParser, generate_markdown_pages
+from data_loaders.datatype import LeanDocument
+from data_loaders.pdf_text_layer import format_page_ranges, parse_page_ranges
+from utils.metrics import metrics
+
+OCR_API_MODEL = "prebuilt-layout"
+OCR_MODE = "markdown"
+RETRY_STATUS_CODES = (429, 503)
+
+
+class TokenBucket:
+    """
+    Lets through `rate` requests per second on average, with bursts of up to `capacity`. A throttled response
+    empties the bucket and pauses it, so every caller backs off together instead of each one retrying on its own.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now >= self._paused_until:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    wait = (1 - self._tokens) / self.rate
+                else:
+                    wait = self._paused_until - now
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+            self._updated = self._paused_until
+
+
+def get_retry_after(response, default: float) -> float:
+    headers = getattr(response, 'headers', None) or {}
+    for header in ('retry-after-ms', 'x-ms-retry-after-ms'):
+        if headers.get(header):
+            try:
+                return float(headers[header]) / 1000
+            except ValueError:
+                pass
+    try:
+        return float(headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return default
+
+
+class OCRClient:
+    """
+    Process-wide Azure Document Intelligence client.
+
+    One parser, and with it one HTTP connection pool, is shared by every caller. At most `max_concurrency` analyses
+    run at once, new requests are spaced by a token bucket, and 429/503 responses pause the bucket for their
+    Retry-After before the request is retried. PDFs with more than `pages_per_request` pages are split into page
+    ranges that are analyzed in parallel and merged back in page order.
+    """
+
+    def __init__(self, api_endpoint=AZURE_DOCUMENT_INTELLIGENCE_API_ENDPOINT,
+                 api_key=AZURE_DOCUMENT_INTELLIGENCE_API_KEY, api_model=OCR_API_MODEL, mode=OCR_MODE,
+                 max_concurrency=AZURE_DI_MAX_CONCURRENCY,
+                 requests_per_second=AZURE_DI_REQUESTS_PER_SECOND, burst=AZURE_DI_BURST,
+                 max_retries=AZURE_DI_MAX_RETRIES, polling_interval=AZURE_DI_POLLING_INTERVAL,
+                 pages_per_request=AZURE_DI_PAGES_PER_REQUEST):
+        self.parser = AzureAIDocumentIntelligenceParser(
+            api_endpoint=api_endpoint,
+            api_key=api_key,
+            api_model=api_model,
+            mode=mode,
+            # Throttling is retried here so the wait is shared through the token bucket
+            client_options={'retry_status': 0, 'polling_interval': polling_interval},
+            lean=True,
+        )
+        self.api_model = api_model
+        self.mode = mode
+        self.max_retries = max_retries
+        self.pages_per_request = max(1, pages_per_request)
+        self.bucket = TokenBucket(requests_per_second, burst)
+        self._slots = threading.BoundedSemaphore(max(1, max_concurrency))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_concurrency), thread_name_prefix='ocr')
+
+    def analyze(self, data: bytes, pages: Optional[str] = None) -> LeanDocument:
+        """
+        Analyze a document, retrying throttled requests.
+
+        :param data: File content; it is re-sent on every retry.
+        :param pages: Optional page range such as "1-3,5".
+        """
+        attempt = 0
+        while True:
+            self.bucket.acquire()
+            with self._slots:
+                try:
+                    with metrics.timer('ocr_request_seconds'):
+                        return self.parser.lazy_parse_file_obj(io.BytesIO(data), pages=pages)
+                except HttpResponseError as e:
+                    if e.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                        metrics.inc('ocr_failures_total')
+                        raise
+                    metrics.inc('ocr_retries_total', status=e.status_code)
+                    status_code = e.status_code
+                    retry_after = get_retry_after(e.response, default=min(60, 2 ** attempt))
+            attempt += 1
+            print(f"Document Intelligence returned {status_code}, retrying in {retry_after:.1f}s")
+            self.bucket.pause(retry_after)
+
+    def analyze_pdf(self, data: bytes, source: str, pages: Optional[str] = None) -> List[dict]:
+        """
+        :return: Pages in the same shape as generate_markdown_pages, ordered by page number.
+        """
+        page_numbers = parse_page_ranges(pages) if pages else count_pdf_pages(data)
+        if not page_numbers or len(page_numbers) <= self.pages_per_request:
+            return generate_markdown_pages(self.analyze(data, pages=pages), source)
+
+        page_ranges = [
+            format_page_ranges(page_numbers[i:i + self.pages_per_request])
+            for i in range(0, len(page_numbers), self.pages_per_request)
+        ]
+        merged_pages = []
+        for doc in self._executor.map(lambda page_range: self.analyze(data, pages=page_range), page_ranges):
+            merged_pages.extend(generate_markdown_pages(doc, source))
+        return sorted(merged_pages, key=lambda page: page['metadata']['page_number'])
+
+
+def count_pdf_pages(data: bytes) -> Optional[List[int]]:
+    """Page numbers of a PDF, or None if they cannot be read locally."""
+    if PdfReader is None:
+        return None
+    try:
+        return list(range(1, len(PdfReader(io.BytesIO(data)).pages) + 1))
+    except Exception:
+        return None
+
+
+_ocr_client = None
+_ocr_client_lock = threading.Lock()
+
+
+def get_ocr_client() -> OCRClient:
+    """Process-wide client, created on first use."""
+    global _ocr_client
+    with _ocr_client_lock:
+        if _ocr_client is None:
+            _ocr_client = OCRClient()
+        return _ocr_client
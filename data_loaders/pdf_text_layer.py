@@ -0,0 +1,83 @@
+import logging
+import re
+from typing import Any, List, Optional
+
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+from config.settings import PDF_TEXT_LAYER_MIN_CHARS
+
+logger = logging.getLogger(__name__)
+
+VISIBLE_CHAR_PATTERN = re.compile(r'\w', re.UNICODE)
+
+
+def extract_text_layer(file_obj: Any, source: str) -> Optional[List[dict]]:
+    """
+    Read page text from the PDF's own text layer, without any remote call.
+
+    Lines are kept as lines and blank-line gaps as paragraph breaks, so the chunker still sees the page structure.
+
+    :return: Pages in the same shape as generate_markdown_pages, or None if pypdf is missing or cannot read the file.
+    """
+    if PdfReader is None:
+        return None
+    try:
+        reader = PdfReader(file_obj)
+        pages = []
+        for page_number, page in enumerate(reader.pages, start=1):
+            pages.append({
+                "content": normalize_page_text(page.extract_text() or ""),
+                "metadata": {
+                    "source": source,
+                    "page_number": page_number,
+                    "extractor": "text_layer"
+                }
+            })
+        return pages
+    except Exception as e:
+        logger.warning(f"Could not read the text layer of {source}: {e}")
+        return None
+
+
+def normalize_page_text(text: str) -> str:
+    lines = [line.rstrip() for line in text.replace('\r\n', '\n').replace('\r', '\n').split('\n')]
+    paragraphs, current = [], []
+    for line in lines:
+        if line.strip():
+            current.append(line)
+        elif current:
+            paragraphs.append('\n'.join(current))
+            current = []
+    if current:
+        paragraphs.append('\n'.join(current))
+    return '\n\n'.join(paragraphs)
+
+
+def has_usable_text(content: str, min_chars: int = PDF_TEXT_LAYER_MIN_CHARS) -> bool:
+    return len(VISIBLE_CHAR_PATTERN.findall(content)) >= min_chars
+
+
+def format_page_ranges(page_numbers: List[int]) -> str:
+    """[1, 2, 3, 7, 9, 10] -> '1-3,7,9-10' (the `pages` syntax of Document Intelligence)."""
+    ranges = []
+    for page_number in sorted(set(page_numbers)):
+        if ranges and page_number == ranges[-1][1] + 1:
+            ranges[-1][1] = page_number
+        else:
+            ranges.append([page_number, page_number])
+    return ','.join(f"{start}-{end}" if start != end else str(start) for start, end in ranges)
+
+
+def parse_page_ranges(pages: str) -> List[int]:
+    """'1-3,7' -> [1, 2, 3, 7]; the inverse of format_page_ranges."""
+    page_numbers = set()
+    for part in pages.split(','):
+        part = part.strip()
+        if not part:
+            continue
+        start, _, end = part.partition('-')
+        page_numbers.update(range(int(start), int(end or start) + 1))
+    return sorted(page_numbers)
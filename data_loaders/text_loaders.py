@@ -0,0 +1,176 @@
+import codecs
+import csv
+import io
+import os
+from typing import Iterator, Optional
+
+try:
+    from charset_normalizer import from_bytes
+except ImportError:
+    from_bytes = None
+
+from config.settings import (
+    CHUNK_TARGET_TOKENS,
+    TEXT_LOADER_EXTENSIONS,
+    TEXT_LOADER_SKIP_EXTENSIONS,
+    TEXT_LOADER_SEGMENT_CHARS,
+)
+from data_loaders.chunker import chunk_segment
+from utils.tokens import count_tokens
+
+ENCODING_SAMPLE_BYTES = 64 * 1024
+CSV_EXTENSIONS = ('.csv', '.tsv')
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def get_text_kind(file_path: str) -> Optional[str]:
+    """'csv' or 'text' for files the text loaders handle, None otherwise."""
+    name = os.path.basename(file_path).lower()
+    if any(name.endswith(ext) for ext in TEXT_LOADER_SKIP_EXTENSIONS):
+        return None
+    ext = os.path.splitext(name)[1]
+    if ext in CSV_EXTENSIONS:
+        return 'csv'
+    if ext in TEXT_LOADER_EXTENSIONS:
+        return 'text'
+    return None
+
+
+def detect_encoding(file_path: str) -> Optional[str]:
+    """
+    Guess a file's encoding from its first bytes.
+
+    :return: Codec name, or None if the file looks binary.
+    """
+    with open(file_path, 'rb') as f:
+        sample = f.read(ENCODING_SAMPLE_BYTES)
+    for bom, encoding in BOMS:
+        if sample.startswith(bom):
+            return encoding
+    if b'\x00' in sample:
+        return None
+    try:
+        # final=False tolerates a multi-byte character cut off at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(sample, final=False)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        pass
+    if from_bytes is not None:
+        match = from_bytes(sample).best()
+        if match is not None:
+            return match.encoding
+    return 'cp1252'
+
+
+def iter_text_segments(file_path: str, encoding: str,
+                       segment_chars: int = TEXT_LOADER_SEGMENT_CHARS) -> Iterator[dict]:
+    """
+    Stream a text file as pieces of roughly `segment_chars` characters, cut at line boundaries (preferring blank
+    lines) so only one piece is in memory at a time.
+
+    :return: Iterator of {'content', 'char_offset', 'line_start'}.
+    """
+    with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+        lines, size = [], 0
+        char_offset, line_number, line_start = 0, 1, 1
+        for line in f:
+            # A single huge line (minified files, binary-ish logs) is still cut into bounded pieces
+            while len(line) > segment_chars:
+                if lines:
+                    yield _segment(lines, char_offset, line_start)
+                    char_offset += size
+                    lines, size = [], 0
+                yield _segment([line[:segment_chars]], char_offset, line_number)
+                char_offset += segment_chars
+                line = line[segment_chars:]
+            if not lines:
+                line_start = line_number
+            lines.append(line)
+            size += len(line)
+            line_number += 1
+            if size >= segment_chars and (not line.strip() or size >= 2 * segment_chars):
+                yield _segment(lines, char_offset, line_start)
+                char_offset += size
+                lines, size = [], 0
+        if lines:
+            yield _segment(lines, char_offset, line_start)
+
+
+def _segment(lines, char_offset, line_start):
+    return {'content': ''.join(lines), 'char_offset': char_offset, 'line_start': line_start}
+
+
+def iter_csv_segments(file_path: str, encoding: str, target_tokens: int = CHUNK_TARGET_TOKENS) -> Iterator[dict]:
+    """
+    Stream a CSV/TSV file as groups of records of about `target_tokens` tokens. Every group repeats the header row
+    so each chunk can be read on its own.
+    """
+    delimiter = '\t' if file_path.lower().endswith('.tsv') else ','
+    with open(file_path, 'r', encoding=encoding, errors='replace', newline='') as f:
+        reader = csv.reader(f, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return
+        header_line = _csv_line(header, delimiter)
+        header_tokens = count_tokens(header_line)
+        rows, tokens, row_start = [], header_tokens, reader.line_num + 1
+        previous_line_num = reader.line_num
+        for row in reader:
+            # Quoted fields may span lines, so the row's first line is tracked through the reader
+            row_line = previous_line_num + 1
+            previous_line_num = reader.line_num
+            line = _csv_line(row, delimiter)
+            line_tokens = count_tokens(line)
+            if rows and tokens + line_tokens > target_tokens:
+                yield {'content': header_line + ''.join(rows), 'char_offset': None, 'line_start': row_start}
+                rows, tokens, row_start = [], header_tokens, row_line
+            rows.append(line)
+            tokens += line_tokens
+        if rows:
+            yield {'content': header_line + ''.join(rows), 'char_offset': None, 'line_start': row_start}
+
+
+def _csv_line(row, delimiter):
+    buffer = io.StringIO()
+    csv.writer(buffer, delimiter=delimiter, lineterminator='\n').writerow(row)
+    return buffer.getvalue()
+
+
+def iter_text_chunks(file_path: str, kind: str, encoding: str, source: str) -> Iterator[dict]:
+    """
+    Stream chunks of a text or CSV file in the same shape as data_loaders.chunker.chunk_pages.
+
+    Metadata carries `line_start` of the piece the chunk came from and, for plain text, absolute `char_start` and
+    `char_end` offsets in the decoded file.
+    """
+    segments = iter_csv_segments(file_path, encoding) if kind == 'csv' else iter_text_segments(file_path, encoding)
+    heading = None
+    chunk_index = 0
+    for segment in segments:
+        # CSV groups are already chunk-sized and must keep their header, so they are not split further
+        if kind == 'csv':
+            chunks = [{'content': segment['content'], 'char_start': None, 'char_end': None, 'heading': None}]
+        else:
+            chunks, last_heading = chunk_segment(segment['content'], heading=heading)
+        for chunk in chunks:
+            metadata = {
+                'source': source,
+                'encoding': encoding,
+                'line_start': segment['line_start'],
+                'chunk_index': chunk_index,
+            }
+            if segment['char_offset'] is not None:
+                metadata['char_start'] = segment['char_offset'] + chunk['char_start']
+                metadata['char_end'] = segment['char_offset'] + chunk['char_end']
+            if chunk['heading']:
+                metadata['heading'] = chunk['heading']
+            chunk_index += 1
+            yield {'content': chunk['content'], 'metadata': metadata}
+        if kind != 'csv':
+            heading = last_heading
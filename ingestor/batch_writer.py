@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from config.settings import (
+    EMBED_BATCH_MAX_ITEMS,
+    EMBED_BATCH_MAX_TOKENS,
+    EMBED_MAX_IN_FLIGHT,
+    EMBED_BATCH_LINGER_SECONDS,
+)
+from utils.metrics import metrics
+from utils.tokens import count_tokens
+
+# Client errors about the request itself rather than its inputs: timeout, conflict, rate limit
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+class EmbeddingInputError(ValueError):
+    """Raised by embedding functions when some of the inputs they were given cannot be embedded."""
+
+
+def is_input_error(error):
+    """
+    Whether error was caused by some of the inputs of a batch, so that embedding its halves separately isolates
+    them: an HTTP 4xx other than a timeout, conflict or rate limit (OpenAI), an EmbeddingInputError (inputs the CLIP
+    model worker rejected, undecodable images), or a ValueError or TypeError of an in-process model.
+
+    Rate limits, timeouts, connection errors and failures of the whole CLIP worker are not: every half would fail
+    the same way. The OpenAI client already retries those with backoff, and the CLIP client reconnects once.
+    """
+    status_code = getattr(error, 'status_code', None)
+    if isinstance(status_code, int):
+        return 400 <= status_code < 500 and status_code not in RETRYABLE_STATUS_CODES
+    return isinstance(error, (ValueError, TypeError))
+
+
+def wait_for_embeddings(futures):
+    """
+    Block until every future has succeeded or failed.
+
+    :return: (embeddings, errors) lists aligned with futures; a failed input has embedding None and its error set.
+    """
+    embeddings, errors = [], []
+    for future in futures:
+        try:
+            embeddings.append(future.result())
+            errors.append(None)
+        except Exception as e:
+            embeddings.append(None)
+            errors.append(e)
+    return embeddings, errors
+
+
+class EmbeddingBatcher:
+    """
+    Collects embedding inputs submitted from any thread and sends them to the embedding function in batches.
+
+    A batch is flushed once it reaches `max_items` inputs or `max_tokens` tokens, or when its oldest input has
+    waited `linger` seconds. At most `max_in_flight` batches are being embedded at any time. Every input gets its
+    own Future. A batch failing because of its inputs (see is_input_error) is bisected so one bad input only fails
+    itself; any other error fails the whole batch at once. Without a `token_counter` batches are bounded by
+    `max_items` alone. `kind` labels the batcher's metrics.
+    """
+
+    def __init__(self, embedding_function, max_items=EMBED_BATCH_MAX_ITEMS, max_tokens=EMBED_BATCH_MAX_TOKENS,
+                 max_in_flight=EMBED_MAX_IN_FLIGHT, linger=EMBED_BATCH_LINGER_SECONDS, token_counter=count_tokens,
+                 kind='text'):
+        self.embedding_function = embedding_function
+        self.kind = kind
+        self.max_items = max(1, max_items)
+        self.max_tokens = max_tokens
+        self.linger = linger
+        self.token_counter = token_counter
+        self._pending = deque()
+        self._pending_tokens = 0
+        self._condition = threading.Condition()
+        self._in_flight = threading.BoundedSemaphore(max(1, max_in_flight))
+        self._executor = ThreadPoolExecutor(max_workers=max(1, max_in_flight), thread_name_prefix='embed')
+        self._flusher = None
+
+    def submit(self, inputs):
+        """
+        Queue inputs for embedding.
+
+        :return: One Future per input, resolving to its embedding or raising the error that input failed with.
+        """
+        futures = []
+        with self._condition:
+            for item in inputs:
+                future = Future()
+                tokens = self.token_counter(item) if self.token_counter else 0
+                self._pending.append((item, tokens, future))
+                self._pending_tokens += tokens
+                futures.append(future)
+            if self._flusher is None:
+                self._flusher = threading.Thread(target=self._flush_loop, name=f'embed-batcher-{self.kind}',
+                                                 daemon=True)
+                self._flusher.start()
+            self._condition.notify()
+        return futures
+
+    def embed(self, inputs):
+        """
+        Embed inputs, blocking until every one of them has succeeded or failed.
+
+        :return: (embeddings, errors) lists aligned with inputs; a failed input has embedding None and its error set.
+        """
+        return wait_for_embeddings(self.submit(inputs))
+
+    def _batch_ready(self):
+        return len(self._pending) >= self.max_items or self._pending_tokens >= self.max_tokens
+
+    def _take_batch(self):
+        batch, tokens = [], 0
+        while self._pending and len(batch) < self.max_items:
+            item_tokens = self._pending[0][1]
+            # An oversized input still goes out on its own so it can fail (or succeed) individually
+            if batch and tokens + item_tokens > self.max_tokens:
+                break
+            batch.append(self._pending.popleft())
+            tokens += item_tokens
+            self._pending_tokens -= item_tokens
+        return batch
+
+    def _flush_loop(self):
+        while True:
+            # A batch is only formed once a slot is free, so inputs keep piling into it while every slot is busy
+            self._in_flight.acquire()
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                deadline = time.monotonic() + self.linger
+                while not self._batch_ready():
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                batch = self._take_batch()
+            self._executor.submit(self._run, batch)
+
+    def _run(self, batch):
+        try:
+            self._send(batch)
+        finally:
+            self._in_flight.release()
+
+    def _send(self, batch):
+        try:
+            with metrics.timer('embed_batch_seconds', kind=self.kind):
+                embeddings = self.embedding_function([item for item, _, _ in batch])
+            metrics.inc('embed_batches_total', kind=self.kind)
+            metrics.observe('embed_batch_items', len(batch), kind=self.kind)
+            if len(embeddings) != len(batch):
+                raise ValueError(f"Expected {len(batch)} embeddings, got {len(embeddings)}")
+        except Exception as e:
+            metrics.inc('embed_batch_failures_total', kind=self.kind)
+            if len(batch) == 1 or not is_input_error(e):
+                for _, _, future in batch:
+                    future.set_exception(e)
+                return
+            middle = len(batch) // 2
+            self._send(batch[:middle])
+            self._send(batch[middle:])
+            return
+        for (_, _, future), embedding in zip(batch, embeddings):
+            future.set_result(embedding)
@@ -0,0 +1,291 @@
+import os
+import secrets
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from multiprocessing.connection import Client
+
+import numpy as np
+from chromadb.api.types import is_image
+from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
+from PIL import Image
+
+from config.settings import (
+    CLIP_MODEL_NAME,
+    CLIP_CHECKPOINT,
+    CLIP_DEVICE,
+    CLIP_SERVER_ADDRESS,
+    CLIP_SERVER_AUTHKEY,
+    CLIP_SERVER_AUTOSTART,
+    CLIP_SERVER_START_TIMEOUT_SECONDS,
+    CLIP_SERVER_LOG_PATH,
+)
+from ingestor.batch_writer import EmbeddingInputError
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Embedding dimension of the open_clip models, to recognize collections built with another one
+CLIP_DIMENSIONS = {
+    'ViT-B-32': 512,
+    'ViT-B-16': 512,
+    'ViT-L-14': 768,
+    'ViT-H-14': 1024,
+    'ViT-g-14': 1024,
+    'ViT-bigG-14': 1280,
+}
+
+
+def parse_address(address):
+    """'host:port' becomes an (host, port) TCP address; anything else is a Unix socket path or Windows pipe name."""
+    host, _, port = address.rpartition(':')
+    if host and port.isdigit() and not address.startswith('\\\\'):
+        return host, int(port)
+    return address
+
+
+def get_authkey(address, authkey=CLIP_SERVER_AUTHKEY):
+    """
+    Shared secret of the worker at address and its clients.
+
+    Both ends unpickle what they receive, so anyone holding the key can run code in the worker; there is no default
+    key. A TCP address needs an explicit CLIP_SERVER_AUTHKEY. A socket path without one uses a random key, created
+    by whichever process comes first, in `<socket path>.key` with owner-only permissions.
+
+    :raises ValueError: If address is a TCP address or Windows pipe and no key is set, or the key file is readable
+        by other users.
+    """
+    if authkey:
+        return authkey.encode('utf-8')
+    socket_path = parse_address(address)
+    if not isinstance(socket_path, str) or socket_path.startswith('\\\\'):
+        raise ValueError(f"Set CLIP_SERVER_AUTHKEY to use the CLIP model worker at {address}")
+
+    key_path = f"{socket_path}.key"
+    if not os.path.exists(key_path):
+        # Written under a temporary name and linked into place, so no process ever reads a partial key
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(key_path)), prefix='.clip-key-')
+        try:
+            with os.fdopen(fd, 'w') as f:
+                f.write(secrets.token_hex(32))
+            os.link(temp_path, key_path)
+        except FileExistsError:
+            pass
+        finally:
+            os.remove(temp_path)
+    if os.stat(key_path).st_mode & 0o077:
+        raise ValueError(f"{key_path} must only be readable by its owner (chmod 600)")
+    with open(key_path) as f:
+        return f.read().strip().encode('utf-8')
+
+
+class BatchedOpenCLIPEmbeddingFunction(OpenCLIPEmbeddingFunction):
+    """
+    OpenCLIP embedding function that encodes all the images, and all the texts, of a call in a single forward pass.
+
+    Chroma's function runs the model once per input, which leaves most of the CPU idle between tiny matrix
+    multiplications. Only its public interface (name, config, spaces) is inherited: the model is loaded here with
+    open_clip, so nothing depends on how Chroma's function keeps it.
+    """
+
+    def __init__(self, model_name=CLIP_MODEL_NAME, checkpoint=CLIP_CHECKPOINT, device=CLIP_DEVICE):
+        try:
+            import open_clip
+            import torch
+        except ImportError:
+            raise ValueError("Image embeddings need open_clip and torch: pip install open-clip-torch")
+        self.model_name = model_name
+        self.checkpoint = checkpoint
+        self.device = device
+        self.torch = torch
+        model, _, self.preprocess = open_clip.create_model_and_transforms(model_name=model_name,
+                                                                          pretrained=checkpoint)
+        self.model = model.to(device)
+        self.tokenizer = open_clip.get_tokenizer(model_name)
+
+    def __call__(self, input):
+        image_indexes = [i for i, item in enumerate(input) if is_image(item)]
+        text_indexes = [i for i, item in enumerate(input) if not is_image(item)]
+        embeddings = [None] * len(input)
+        with self.torch.no_grad():
+            if image_indexes:
+                batch = self.torch.stack([self.preprocess(Image.fromarray(input[i])) for i in image_indexes])
+                self.add_features(embeddings, image_indexes, self.model.encode_image(batch.to(self.device)))
+            if text_indexes:
+                tokens = self.tokenizer([input[i] for i in text_indexes]).to(self.device)
+                self.add_features(embeddings, text_indexes, self.model.encode_text(tokens))
+        return embeddings
+
+    @staticmethod
+    def add_features(embeddings, indexes, features):
+        features /= features.norm(dim=-1, keepdim=True)
+        for i, feature in zip(indexes, features.cpu().numpy()):
+            embeddings[i] = np.array(feature, dtype=np.float32)
+
+
+class LazyOpenCLIPEmbeddingFunction(BatchedOpenCLIPEmbeddingFunction):
+    """
+    Loads torch and the CLIP weights on the first call instead of on construction, so creating the vector store
+    (and rendering the UI) does not wait for a model that only image ingestion and image search use.
+    """
+
+    def __init__(self, model_name=CLIP_MODEL_NAME, checkpoint=CLIP_CHECKPOINT, device=CLIP_DEVICE):
+        # Chroma persists this config with the collection; it must match the eagerly loaded function's
+        self.model_name = model_name
+        self.checkpoint = checkpoint
+        self.device = device
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                print(f"Loading CLIP model {self.model_name} ({self.checkpoint}) on {self.device}")
+                started = time.monotonic()
+                super().__init__(model_name=self.model_name, checkpoint=self.checkpoint, device=self.device)
+                self._loaded = True
+                print(f"CLIP model loaded in {time.monotonic() - started:.1f}s")
+
+    def __call__(self, input):
+        self.load()
+        return super().__call__(input)
+
+    @staticmethod
+    def build_from_config(config):
+        # Chroma rebuilds the function from its config when a collection is opened; the copy must stay lazy too
+        return LazyOpenCLIPEmbeddingFunction(model_name=config.get('model_name', CLIP_MODEL_NAME),
+                                             checkpoint=config.get('checkpoint', CLIP_CHECKPOINT),
+                                             device=config.get('device', CLIP_DEVICE))
+
+
+class CLIPClient:
+    """
+    Connection pool to a shared CLIP model worker (see ingestor.clip_server).
+
+    Requests are pickled over an authenticated multiprocessing connection. Each calling thread borrows its own
+    connection, so the Streamlit process, ingestion workers and CLI tools can all embed at once; the worker batches
+    their inputs together.
+    """
+
+    def __init__(self, address=CLIP_SERVER_ADDRESS, authkey=CLIP_SERVER_AUTHKEY, autostart=CLIP_SERVER_AUTOSTART,
+                 start_timeout=CLIP_SERVER_START_TIMEOUT_SECONDS):
+        self.raw_address = address
+        self.address = parse_address(address)
+        self.authkey = get_authkey(address, authkey)
+        self.autostart = autostart
+        self.start_timeout = start_timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._start_failed_at = None
+
+    def connect(self):
+        try:
+            return Client(self.address, authkey=self.authkey)
+        except (OSError, EOFError):
+            if not self.autostart:
+                raise
+        with self._start_lock:
+            # Another thread may have started the worker while this one was waiting
+            try:
+                return Client(self.address, authkey=self.authkey)
+            except (OSError, EOFError):
+                # A worker that just failed to start is not started again for every request
+                if time.monotonic() - (self._start_failed_at or float('-inf')) < self.start_timeout:
+                    raise
+                self.start_server()
+            deadline = time.monotonic() + self.start_timeout
+            while True:
+                try:
+                    connection = Client(self.address, authkey=self.authkey)
+                    self._start_failed_at = None
+                    return connection
+                except (OSError, EOFError):
+                    if time.monotonic() > deadline:
+                        self._start_failed_at = time.monotonic()
+                        raise
+                    time.sleep(0.5)
+
+    def start_server(self):
+        print(f"Starting CLIP model worker at {self.raw_address}, logging to {CLIP_SERVER_LOG_PATH}")
+        # The worker outlives this process, so it must not hold on to its stdout
+        with open(CLIP_SERVER_LOG_PATH, 'ab') as log:
+            subprocess.Popen([sys.executable, '-m', 'ingestor.clip_server', '--address', self.raw_address, 'serve'],
+                             cwd=PROJECT_ROOT, stdin=subprocess.DEVNULL, stdout=log, stderr=subprocess.STDOUT,
+                             start_new_session=True)
+
+    def request(self, command, payload=None):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        for attempt in range(2):
+            conn = conn or self.connect()
+            try:
+                conn.send((command, payload))
+                status, result = conn.recv()
+                break
+            except (OSError, EOFError):
+                # The worker restarted; a fresh connection gets one more try
+                conn.close()
+                conn = None
+                if attempt:
+                    raise
+        with self._lock:
+            self._idle.append(conn)
+        if status == 'input_error':
+            raise EmbeddingInputError(f"CLIP model worker rejected the inputs: {result}")
+        if status != 'ok':
+            raise RuntimeError(f"CLIP model worker failed: {result}")
+        return result
+
+
+class RemoteCLIPEmbeddingFunction(LazyOpenCLIPEmbeddingFunction):
+    """Same embeddings as LazyOpenCLIPEmbeddingFunction, computed by the shared model worker instead."""
+
+    def __init__(self, client=None, **kwargs):
+        super().__init__(**kwargs)
+        self.client = client or CLIPClient()
+
+    def __call__(self, input):
+        return [np.asarray(embedding, dtype=np.float32) for embedding in self.client.request('embed', list(input))]
+
+
+def get_clip_embedding_function():
+    """The shared model worker when CLIP_SERVER_ADDRESS is set, otherwise an in-process model loaded on first use."""
+    if CLIP_SERVER_ADDRESS:
+        return RemoteCLIPEmbeddingFunction()
+    return LazyOpenCLIPEmbeddingFunction()
+
+
+def check_clip_collection(collection, embedding_function):
+    """
+    Record which CLIP model builds collection, or refuse a model other than the one that built it (see
+    ingestor.text_embeddings.check_collection).
+
+    Collections created before the model was recorded are checked against the length of a stored vector.
+
+    :raises ValueError: If collection holds vectors of another model or dimension.
+    """
+    expected = {'clip_model': embedding_function.model_name, 'clip_checkpoint': embedding_function.checkpoint}
+    metadata = collection.metadata or {}
+    if metadata.get('clip_model') is None:
+        stored = collection.get(limit=1, include=['embeddings'])['embeddings']
+        dimension = CLIP_DIMENSIONS.get(expected['clip_model'])
+        if stored is not None and len(stored) and dimension and len(stored[0]) != dimension:
+            raise ValueError(
+                f"Collection {collection.name} holds {len(stored[0])}-dimensional vectors, but CLIP "
+                f"{expected['clip_model']} returns {dimension}. Set CLIP_MODEL_NAME and CLIP_CHECKPOINT to the model "
+                f"that built it."
+            )
+        collection.modify(metadata={**metadata, **expected})
+        return
+
+    recorded = {key: metadata.get(key) for key in expected}
+    if recorded != expected:
+        raise ValueError(
+            f"Collection {collection.name} was built with CLIP {recorded['clip_model']} "
+            f"({recorded['clip_checkpoint']}), not {expected['clip_model']} ({expected['clip_checkpoint']}). "
+            f"Set CLIP_MODEL_NAME and CLIP_CHECKPOINT back."
+        )
@@ -0,0 +1,125 @@
+"""
+Long-lived CLIP model worker shared by every process of the app.
+
+    CLIP_SERVER_ADDRESS=/tmp/gennie-clip.sock python -m ingestor.clip_server serve
+    CLIP_SERVER_ADDRESS=127.0.0.1:8766 CLIP_SERVER_AUTHKEY=<secret> python -m ingestor.clip_server serve
+
+The model is loaded once, here, instead of in the Streamlit process, each ingestion process and every CLI tool.
+Clients (ingestor.clip_embeddings.CLIPClient) start the worker on their own when nothing answers at the address,
+unless CLIP_SERVER_AUTOSTART is false. Inputs from concurrent clients are embedded together in batched forward
+passes. `status` reports whether the worker is up and what it has served.
+"""
+import argparse
+import json
+import os
+import threading
+import time
+from multiprocessing.connection import Listener
+
+from config.settings import (
+    CLIP_SERVER_ADDRESS,
+    CLIP_SERVER_AUTHKEY,
+    IMAGE_EMBED_BATCH_SIZE,
+    IMAGE_EMBED_BATCH_LINGER_SECONDS,
+)
+from ingestor.batch_writer import EmbeddingBatcher, is_input_error, wait_for_embeddings
+from ingestor.clip_embeddings import CLIPClient, LazyOpenCLIPEmbeddingFunction, get_authkey, parse_address
+
+
+class CLIPServer:
+    def __init__(self, address=CLIP_SERVER_ADDRESS, authkey=CLIP_SERVER_AUTHKEY, embedding_function=None):
+        self.address = parse_address(address)
+        self.authkey = get_authkey(address, authkey)
+        self.embedding_function = embedding_function or LazyOpenCLIPEmbeddingFunction()
+        # One forward pass at a time: the model already uses every core
+        self.batcher = EmbeddingBatcher(self.embedding_function, max_items=IMAGE_EMBED_BATCH_SIZE, max_in_flight=1,
+                                        linger=IMAGE_EMBED_BATCH_LINGER_SECONDS, token_counter=None, kind='clip')
+        self.started_at = time.time()
+        self.stats = {'connections': 0, 'requests': 0, 'inputs': 0}
+        self._lock = threading.Lock()
+
+    def serve_forever(self):
+        # Load before accepting connections, so clients never see a half-started worker
+        self.embedding_function.load()
+        self.remove_stale_socket()
+        with Listener(self.address, authkey=self.authkey) as listener:
+            print(f"CLIP model worker listening at {listener.address}")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:
+                    # A client with the wrong authkey must not take the worker down
+                    print(f"Rejected CLIP client: {e}")
+                    continue
+                threading.Thread(target=self.handle, args=(conn,), name='clip-client', daemon=True).start()
+
+    def remove_stale_socket(self):
+        """A worker that was killed leaves its Unix socket file behind, which would make the bind fail."""
+        if not isinstance(self.address, str) or not os.path.exists(self.address):
+            return
+        try:
+            CLIPClient(address=self.address, authkey=self.authkey.decode('utf-8'), autostart=False).connect().close()
+        except (OSError, EOFError):
+            os.remove(self.address)
+
+    def handle(self, conn):
+        with self._lock:
+            self.stats['connections'] += 1
+        with conn:
+            while True:
+                try:
+                    command, payload = conn.recv()
+                except (EOFError, OSError):
+                    return
+                try:
+                    conn.send(('ok', self.run(command, payload)))
+                except Exception as e:
+                    # Only errors caused by the inputs are worth bisecting the batch for on the client side
+                    conn.send(('input_error' if is_input_error(e) else 'error', str(e)))
+
+    def run(self, command, payload):
+        if command == 'embed':
+            with self._lock:
+                self.stats['requests'] += 1
+                self.stats['inputs'] += len(payload)
+            embeddings, errors = wait_for_embeddings(self.batcher.submit(payload))
+            error = next((error for error in errors if error is not None), None)
+            if error is not None:
+                raise error
+            return embeddings
+        if command == 'status':
+            with self._lock:
+                return {
+                    'model_name': self.embedding_function.model_name,
+                    'checkpoint': self.embedding_function.checkpoint,
+                    'device': self.embedding_function.device,
+                    'uptime_seconds': time.time() - self.started_at,
+                    **self.stats,
+                }
+        raise ValueError(f"Unknown command: {command}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve CLIP embeddings to every process of the app.")
+    parser.add_argument('--address', default=CLIP_SERVER_ADDRESS, help="host:port or socket path")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('serve', help="Load the model and serve embeddings until killed")
+    subparsers.add_parser('status', help="Show whether the worker is running and what it has served")
+    args = parser.parse_args()
+    if not args.address:
+        parser.error("set CLIP_SERVER_ADDRESS or pass --address")
+
+    try:
+        if args.command == 'serve':
+            CLIPServer(address=args.address).serve_forever()
+        elif args.command == 'status':
+            try:
+                print(json.dumps(CLIPClient(address=args.address, autostart=False).request('status'), indent=2))
+            except (OSError, EOFError) as e:
+                print(f"CLIP model worker is not running at {args.address}: {e}")
+    except ValueError as e:
+        parser.error(str(e))
+
+
+if __name__ == '__main__':
+    main()
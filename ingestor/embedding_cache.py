@@ -0,0 +1,250 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Optional
+
+import numpy as np
+
+from config.settings import (
+    QUERY_EMBEDDING_CACHE_PATH,
+    QUERY_EMBEDDING_CACHE_MAX_BYTES,
+    QUERY_EMBEDDING_CACHE_MEMORY_ITEMS,
+)
+from utils.metrics import metrics
+
+# SQLite caps the number of parameters of one statement
+LOOKUP_BATCH_SIZE = 500
+
+
+def normalize_query(query: str) -> str:
+    """Fold the differences that do not change what a query asks for: Unicode forms, case and whitespace."""
+    return ' '.join(unicodedata.normalize('NFKC', query).split()).casefold()
+
+
+def get_model_key(embedding_function):
+    """
+    :return: (provider, model) naming the vector space an embedding function produces.
+    """
+    config = embedding_function.get_config() if hasattr(embedding_function, 'get_config') else {}
+    model = config.get('model_name') or type(embedding_function).__name__
+    if config.get('checkpoint'):
+        model = f"{model}/{config['checkpoint']}"
+    if config.get('dimensions'):
+        # Shortened vectors of the same model are a different space
+        model = f"{model}@{config['dimensions']}"
+    provider = embedding_function.name() if hasattr(embedding_function, 'name') else type(embedding_function).__name__
+    return provider, model
+
+
+class EmbeddingCache:
+    """
+    Two-tier embedding cache: an in-memory LRU of `memory_items` vectors in front of a SQLite file that every process
+    shares and that survives restarts.
+
+    Entries are keyed by a hash of (provider, model, text), so vectors of different models never mix. Vectors are
+    stored as float32 blobs; once the file holds more than `max_bytes` of them the least recently used are evicted.
+    `name` labels the cache's hit and miss metrics.
+    """
+
+    def __init__(self, path=QUERY_EMBEDDING_CACHE_PATH, max_bytes=QUERY_EMBEDDING_CACHE_MAX_BYTES,
+                 memory_items=QUERY_EMBEDDING_CACHE_MEMORY_ITEMS, name='query'):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.memory_items = memory_items
+        self.name = name
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self.init_db()
+        # Running estimate of the file's payload, so writes only sum the table when it may have outgrown max_bytes
+        self._estimated_bytes = self.stats()['bytes']
+
+    def connect(self):
+        return sqlite3.connect(self.path, timeout=30)
+
+    def init_db(self):
+        conn = self.connect()
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''CREATE TABLE IF NOT EXISTS embeddings (
+                            key TEXT PRIMARY KEY,
+                            provider TEXT NOT NULL,
+                            model TEXT NOT NULL,
+                            vector BLOB NOT NULL,
+                            size INTEGER NOT NULL,
+                            created_at REAL NOT NULL,
+                            last_used REAL NOT NULL)''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def make_key(provider, model, text):
+        return hashlib.sha256(f"{provider}\x00{model}\x00{text}".encode('utf-8')).hexdigest()
+
+    def get_many(self, keys):
+        """
+        :return: Dict of key -> vector for the keys found in either tier.
+        """
+        found = {}
+        with self._lock:
+            for key in keys:
+                if key in self._memory:
+                    self._memory.move_to_end(key)
+                    found[key] = self._memory[key]
+        if found:
+            metrics.inc('embedding_cache_hits_total', len(found), cache=self.name, tier='memory')
+
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            conn = self.connect()
+            try:
+                for i in range(0, len(missing), LOOKUP_BATCH_SIZE):
+                    batch = missing[i:i + LOOKUP_BATCH_SIZE]
+                    placeholders = ','.join('?' * len(batch))
+                    rows = conn.execute(f'SELECT key, vector FROM embeddings WHERE key IN ({placeholders})', batch)
+                    disk_hits = {key: np.frombuffer(vector, dtype=np.float32) for key, vector in rows}
+                    if disk_hits:
+                        conn.executemany('UPDATE embeddings SET last_used = ? WHERE key = ?',
+                                         [(time.time(), key) for key in disk_hits])
+                    found.update(disk_hits)
+                conn.commit()
+            finally:
+                conn.close()
+            disk_hit_count = sum(1 for key in missing if key in found)
+            if disk_hit_count:
+                metrics.inc('embedding_cache_hits_total', disk_hit_count, cache=self.name, tier='disk')
+                self._remember({key: found[key] for key in missing if key in found})
+            if len(missing) > disk_hit_count:
+                metrics.inc('embedding_cache_misses_total', len(missing) - disk_hit_count, cache=self.name)
+        return found
+
+    def put_many(self, provider, model, vectors):
+        """
+        :param vectors: Dict of key -> embedding.
+        """
+        vectors = {key: np.asarray(vector, dtype=np.float32) for key, vector in vectors.items()}
+        if not vectors:
+            return
+        now = time.time()
+        conn = self.connect()
+        try:
+            conn.executemany(
+                '''INSERT OR REPLACE INTO embeddings (key, provider, model, vector, size, created_at, last_used)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)''',
+                [(key, provider, model, vector.tobytes(), vector.nbytes, now, now) for key, vector in vectors.items()]
+            )
+            conn.commit()
+        finally:
+            conn.close()
+        self._remember(vectors)
+        with self._lock:
+            self._estimated_bytes += sum(vector.nbytes for vector in vectors.values())
+            over_budget = self.max_bytes is not None and self._estimated_bytes > self.max_bytes
+        if over_budget:
+            self.prune(max_bytes=self.max_bytes)
+
+    def _remember(self, vectors):
+        if self.memory_items <= 0:
+            return
+        with self._lock:
+            for key, vector in vectors.items():
+                self._memory[key] = vector
+                self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def embed(self, embedding_function, inputs, keys=None, prepare=None):
+        """
+        Embed inputs, calling embedding_function only for those not cached.
+
+        :param keys: Cache key per input; by default derived from the function's model and the normalized input.
+        :param prepare: Optional function mapping the missing inputs to what embedding_function takes, so expensive
+            preparation (e.g. decoding images) only happens on a miss.
+        :return: One vector per input.
+        """
+        provider, model = get_model_key(embedding_function)
+        if keys is None:
+            keys = [self.make_key(provider, model, normalize_query(item)) for item in inputs]
+        found = self.get_many(keys)
+
+        missing = {}
+        for key, item in zip(keys, inputs):
+            if key not in found and key not in missing:
+                missing[key] = item
+        if missing:
+            items = list(missing.values())
+            computed = embedding_function(prepare(items) if prepare else items)
+            computed = dict(zip(missing, computed))
+            self.put_many(provider, model, computed)
+            found.update({key: np.asarray(vector, dtype=np.float32) for key, vector in computed.items()})
+        return [found[key] for key in keys]
+
+    def stats(self):
+        conn = self.connect()
+        entries, size = conn.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM embeddings').fetchone()
+        models = conn.execute('SELECT provider, model, COUNT(*) FROM embeddings GROUP BY provider, model').fetchall()
+        conn.close()
+        return {
+            'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes, 'path': self.path,
+            'models': [{'provider': provider, 'model': model, 'entries': count} for provider, model, count in models],
+        }
+
+    def prune(self, max_bytes: Optional[int] = None) -> int:
+        """
+        Evict least recently used entries until the cache fits in `max_bytes`.
+
+        :return: Number of entries removed.
+        """
+        if max_bytes is None:
+            return 0
+        conn = self.connect()
+        try:
+            total = conn.execute('SELECT COALESCE(SUM(size), 0) FROM embeddings').fetchone()[0]
+            evicted = []
+            for key, size in conn.execute('SELECT key, size FROM embeddings ORDER BY last_used'):
+                if total <= max_bytes:
+                    break
+                evicted.append(key)
+                total -= size
+            conn.executemany('DELETE FROM embeddings WHERE key = ?', [(key,) for key in evicted])
+            conn.commit()
+        finally:
+            conn.close()
+        with self._lock:
+            self._estimated_bytes = total
+            for key in evicted:
+                self._memory.pop(key, None)
+        return len(evicted)
+
+    def clear(self) -> int:
+        return self.prune(max_bytes=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or prune an embedding cache.")
+    parser.add_argument('--path', default=QUERY_EMBEDDING_CACHE_PATH, help="Cache database")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show the number and total size of cached embeddings")
+    prune_parser = subparsers.add_parser('prune', help="Evict least recently used embeddings")
+    prune_parser.add_argument('--max-bytes', type=int, required=True, help="Shrink the cache to at most this size")
+    subparsers.add_parser('clear', help="Remove every cached embedding")
+    args = parser.parse_args()
+
+    cache = EmbeddingCache(path=args.path, memory_items=0)
+    if args.command == 'stats':
+        print(json.dumps(cache.stats(), indent=2))
+    elif args.command == 'prune':
+        print(f"Removed {cache.prune(max_bytes=args.max_bytes)} cached embedding(s)")
+    elif args.command == 'clear':
+        print(f"Removed {cache.clear()} cached embedding(s)")
+
+
+if __name__ == '__main__':
+    main()
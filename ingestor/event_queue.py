@@ -0,0 +1,162 @@
+import asyncio
+import os
+import threading
+import time
+from itertools import chain
+
+from config.settings import WATCH_QUIET_PERIOD_SECONDS, WATCH_WORKERS
+from utils.metrics import metrics
+
+
+class CoalescingEventQueue:
+    """
+    Long-lived queue between the watchdog threads and the ingestor.
+
+    Events are folded per path into one net action ('upsert', 'delete' or 'move') which is dispatched once the path
+    has been quiet for `quiet_period` seconds. A burst such as create -> modify -> modify, or an editor's
+    write-to-temp-then-rename save, therefore costs a single ingest of the final file. Actions run on a fixed set of
+    workers inside one event loop owned by the queue's thread. A path the ingestion pipeline is working on (see
+    Ingestor.claim_path) stays pending until the pipeline is done with it.
+    """
+
+    def __init__(self, ingestor, quiet_period=WATCH_QUIET_PERIOD_SECONDS, workers=WATCH_WORKERS):
+        self.ingestor = ingestor
+        self.quiet_period = quiet_period
+        self.workers = max(1, workers)
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._running = {}
+        self._loop = None
+        self._thread = None
+        self._ready = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.new_event_loop()
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._run_loop, args=(started,), name='ingest-events', daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    def push(self, event_type, src_path, dest_path=None):
+        """
+        Record a file system event. Safe to call from any thread.
+
+        :param event_type: One of 'created', 'modified', 'deleted' or 'moved'.
+        :param src_path: Path the event refers to.
+        :param dest_path: Destination path for 'moved' events.
+        """
+        src_path = os.path.abspath(src_path)
+        deadline = time.monotonic() + self.quiet_period
+        with self._lock:
+            if event_type in ('created', 'modified'):
+                entry = self._pending.get(src_path)
+                # A moved file is re-checked after the move anyway
+                if entry is None or entry['action'] != 'move':
+                    self._pending[src_path] = {'action': 'upsert'}
+                touched = [src_path]
+            elif event_type == 'deleted':
+                entry = self._pending.pop(src_path, None)
+                if entry and entry['action'] == 'move':
+                    # Moved then deleted: what disappears is the original file
+                    src_path = entry['src']
+                self._pending[src_path] = {'action': 'delete'}
+                touched = [src_path]
+            elif event_type == 'moved':
+                dest_path = os.path.abspath(dest_path)
+                entry = self._pending.pop(src_path, None)
+                if entry is None:
+                    self._pending[dest_path] = {'action': 'move', 'src': src_path}
+                elif entry['action'] == 'move':
+                    self._pending[dest_path] = {'action': 'move', 'src': entry['src']}
+                else:
+                    # Created or modified within the quiet period (e.g. an atomic save): index the final file
+                    self._pending[src_path] = {'action': 'delete'}
+                    self._pending[dest_path] = {'action': 'upsert'}
+                touched = [src_path, dest_path]
+            else:
+                return
+
+            for path in touched:
+                if path in self._pending:
+                    self._pending[path]['deadline'] = deadline
+            metrics.set('watch_pending_events', len(self._pending))
+
+    def pending_count(self):
+        with self._lock:
+            return len(self._pending) + len(self._running)
+
+    def _run_loop(self, started):
+        asyncio.set_event_loop(self._loop)
+        self._ready = asyncio.Queue()
+        tasks = [self._loop.create_task(self._dispatch_loop())]
+        tasks.extend(self._loop.create_task(self._worker()) for _ in range(self.workers))
+        started.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            for task in tasks:
+                task.cancel()
+            self._loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            self._loop.close()
+
+    def _take_ready(self):
+        now = time.monotonic()
+        with self._lock:
+            # A path that is the source of an unfinished move must wait until the move has been applied
+            move_sources = {
+                entry['src'] for entry in chain(self._pending.values(), self._running.values())
+                if entry['action'] == 'move'
+            }
+            ready = []
+            for path, entry in list(self._pending.items()):
+                if entry['deadline'] > now or path in self._running:
+                    continue
+                if path in move_sources and not (entry['action'] == 'move' and entry['src'] == path):
+                    continue
+                entry['claimed'] = (path, entry['src']) if entry['action'] == 'move' else (path,)
+                if not self.ingestor.claim_path(*entry['claimed'], blocking=False):
+                    continue
+                del self._pending[path]
+                self._running[path] = entry
+                ready.append((path, entry))
+            metrics.set('watch_pending_events', len(self._pending))
+        ready.sort(key=lambda item: item[1]['action'] != 'move')
+        return ready
+
+    async def _dispatch_loop(self):
+        tick = min(0.25, self.quiet_period / 4) or 0.05
+        while True:
+            await asyncio.sleep(tick)
+            for item in self._take_ready():
+                self._ready.put_nowait(item)
+
+    async def _worker(self):
+        while True:
+            path, entry = await self._ready.get()
+            try:
+                await self._apply(path, entry)
+            except Exception as e:
+                print(f"Failed to apply {entry['action']} for {path}: {e}")
+                metrics.inc('watch_failures_total', action=entry['action'])
+            finally:
+                self.ingestor.release_path(*entry['claimed'])
+                with self._lock:
+                    self._running.pop(path, None)
+
+    async def _apply(self, path, entry):
+        if entry['action'] == 'move' and entry['src'] != path:
+            await asyncio.to_thread(self.ingestor.move_file, entry['src'], path)
+        if entry['action'] == 'delete' or not os.path.exists(path):
+            await asyncio.to_thread(self.ingestor.remove_file, path)
+        else:
+            # Also covers moves: unchanged files are skipped by the stat check, renamed-in files get indexed
+            await self.ingestor.ingest_document(path)
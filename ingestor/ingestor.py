@@ -1,57 +1,201 @@
+import asyncio
 import hashlib
+import inspect
 import mimetypes
 import os
+import threading
+import time
 import uuid
 
 from sqlalchemy import text
 from sqlalchemy.exc import OperationalError
 from watchdog.observers import Observer
 
-from data_loaders.doc_loaders import ocr_pdf, ocr_image
+from config.settings import TEXT_LOADER_MAX_FILE_BYTES, TEXT_LOADER_CHUNKS_PER_PART
+from data_loaders.chunker import chunk_pages
+from data_loaders.doc_loaders import extract_pdf, ocr_image
+from data_loaders.text_loaders import get_text_kind, detect_encoding, iter_text_chunks
 from todo_manager.db import retry_on_lock, init_db
 
-from vector_store import VectorStore
-
-
+from ingestor.batch_writer import wait_for_embeddings
+from ingestor.event_queue import CoalescingEventQueue
+from ingestor.pipeline import IngestionPipeline, STAGES, iter_directory_jobs
+from ingestor.vector_store import VectorStore, make_chunk_id, get_chunk_hash, get_chunk_locator
+from utils.metrics import metrics
+
+# Files are hashed in fixed-size chunks so large files never have to fit in memory
+HASH_CHUNK_SIZE = 1024 * 1024
+STAT_KEYS = ('size', 'mtime_ns', 'inode')
+TEXT_KINDS = ('text', 'csv')
+FILE_KIND_LABELS = {'pdf': 'PDF', 'image': 'Image', 'text': 'Text', 'csv': 'CSV'}
+# Upsert shared by every write that settles a file, so the snapshot always matches what was last ingested
+UPSERT_SNAPSHOT = '''INSERT INTO file_snapshots (path, size, mtime_ns, inode)
+                     VALUES (:path, :size, :mtime_ns, :inode)
+                     ON CONFLICT(path) DO UPDATE SET size = excluded.size, mtime_ns = excluded.mtime_ns,
+                         inode = excluded.inode'''
+
+
+def get_prefix_range(directory_path):
+    """
+    :return: (low, high) such that `path >= low AND path < high` selects the paths under directory_path. Unlike
+        LIKE or substr, the range is answered from the index on the path column.
+    """
+    prefix = os.path.join(os.path.abspath(directory_path), '')
+    return prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)
 
 
 class Ingestor:
     def __init__(self, vector_store: VectorStore):
         init_db()
         self.vector_store = vector_store
+        # Serializes hash-based copy/move detection between check workers
+        self.dedup_lock = threading.Lock()
+        # Paths being ingested, moved or removed (see claim_path)
+        self._busy_paths = set()
+        self._busy_condition = threading.Condition()
+
+    def claim_path(self, *paths, blocking=True):
+        """
+        Reserve paths for one ingest, move or removal, so the pipeline and the watcher never work on a file at once
+        (e.g. both deleting the other's chunks as stale).
+
+        :param blocking: Wait until no path is claimed anymore instead of returning False.
+        :return: Whether the paths were claimed; they must be released with release_path.
+        """
+        with self._busy_condition:
+            while any(path in self._busy_paths for path in paths):
+                if not blocking:
+                    return False
+                self._busy_condition.wait()
+            self._busy_paths.update(paths)
+            return True
+
+    def release_path(self, *paths):
+        with self._busy_condition:
+            self._busy_paths.difference_update(paths)
+            self._busy_condition.notify_all()
 
     def get_file_hash(self, file_path):
         hasher = hashlib.md5()
-        with open(file_path, 'rb') as f:
-            buf = f.read()
-            hasher.update(buf)
+        with metrics.timer('ingest_hash_seconds'), open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                hasher.update(chunk)
+                metrics.inc('ingest_bytes_hashed_total', len(chunk))
         return hasher.hexdigest()
 
+    def get_file_stat(self, file_path):
+        stat = os.stat(file_path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino}
+
+    def get_entry_stat(self, entry):
+        """Same as get_file_stat for an os.scandir entry, reusing the stat the directory listing already returned."""
+        stat = entry.stat()
+        # Windows leaves st_ino empty in directory listings
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'inode': stat.st_ino or entry.inode()}
+
     @retry_on_lock
-    def file_already_processed(self, file_path):
+    def get_file_record(self, file_path):
         conn = get_db_connection()
         try:
-            file_hash = self.get_file_hash(file_path)
             result = conn.execute(
-                text('SELECT * FROM files WHERE path = :path AND hash = :hash'),
-                {'path': file_path, 'hash': file_hash}
+                text('SELECT path, hash, size, mtime_ns, inode FROM files WHERE path = :path'),
+                {'path': file_path}
             )
-            record = result.fetchone()
+            record = result.mappings().fetchone()
         finally:
             conn.close()
-        return record is not None
+        return dict(record) if record else None
+
+    def detect_change(self, file_path, file_stat=None):
+        """
+        Compare a file against its catalog record, reading its bytes only when the stat signature changed.
+
+        :return: (file_stat, file_hash) if the file is new or modified, otherwise None.
+        """
+        file_stat = file_stat or self.get_file_stat(file_path)
+        record = self.get_file_record(file_path)
+        if record and all(record[key] == file_stat[key] for key in STAT_KEYS):
+            return None
+
+        file_hash = self.get_file_hash(file_path)
+        if record and record['hash'] == file_hash:
+            # Touched (or copied back in place) without changing content
+            self.update_file_stat(file_path, file_stat)
+            return None
+        return file_stat, file_hash
 
     @retry_on_lock
-    def save_file_record(self, file_path):
+    def get_file_records_by_hash(self, file_hash):
         conn = get_db_connection()
         try:
-            file_hash = self.get_file_hash(file_path)
+            result = conn.execute(
+                text('SELECT path, hash, size, mtime_ns, inode FROM files WHERE hash = :hash'),
+                {'hash': file_hash}
+            )
+            records = result.mappings().fetchall()
+        finally:
+            conn.close()
+        return [dict(record) for record in records]
+
+    def reuse_known_content(self, file_path, file_hash, file_stat):
+        """
+        Index a new or modified file from vectors already stored for the same content hash.
+
+        If the known copy has disappeared from disk the file was moved, so its vectors and catalog record are
+        re-pointed at the new path. Otherwise the file is a copy and the stored vectors are duplicated under the
+        new source without calling OCR or the embedding API.
+
+        :return: True if the file was indexed from known content, False if it has to go through extraction.
+        """
+        with self.dedup_lock:
+            records = [record for record in self.get_file_records_by_hash(file_hash) if record['path'] != file_path]
+            if not records:
+                return False
+
+            moved_from = next((record['path'] for record in records if not os.path.exists(record['path'])), None)
+            self.write_journal(file_path, 'reusing', file_hash=file_hash)
+            if moved_from:
+                # Vectors already re-pointed by an interrupted move are kept; otherwise whatever was indexed under
+                # this path belongs to its previous content
+                if self.vector_store.get_ids_by_source(moved_from):
+                    self.vector_store.delete_by_source(file_path)
+                    self.vector_store.update_source(moved_from, file_path)
+                self.delete_file_record(file_path)
+                self.update_file_record(moved_from, file_path)
+                self.update_file_stat(file_path, file_stat)
+                self.delete_journal_entry(file_path)
+                print(f"File moved: {moved_from} -> {file_path}")
+                return True
+
+            self.vector_store.delete_by_source(file_path)
+
+            if not self.vector_store.copy_source(records[0]['path'], file_path):
+                return False
+            self.save_file_record(file_path, file_hash=file_hash, file_stat=file_stat)
+            print(f"File indexed from identical content: {records[0]['path']} -> {file_path}")
+            return True
+
+    def file_already_processed(self, file_path):
+        return self.detect_change(file_path) is None
+
+    @retry_on_lock
+    def save_file_record(self, file_path, file_hash=None, file_stat=None):
+        conn = get_db_connection()
+        try:
+            file_hash = file_hash or self.get_file_hash(file_path)
+            file_stat = file_stat or self.get_file_stat(file_path)
             file_url = os.path.abspath(file_path)
             print(f"Saving file record: Path={file_path}, Hash={file_hash}, URL={file_url}")
             conn.execute(
-                text('INSERT INTO files (path, hash, url) VALUES (:path, :hash, :url)'),
-                {'path': file_path, 'hash': file_hash, 'url': file_url}
+                text('''INSERT INTO files (path, hash, url, size, mtime_ns, inode)
+                        VALUES (:path, :hash, :url, :size, :mtime_ns, :inode)
+                        ON CONFLICT(path) DO UPDATE SET hash = excluded.hash, url = excluded.url,
+                            size = excluded.size, mtime_ns = excluded.mtime_ns, inode = excluded.inode'''),
+                {'path': file_path, 'hash': file_hash, 'url': file_url, **file_stat}
             )
+            conn.execute(text(UPSERT_SNAPSHOT), {'path': file_path, **file_stat})
+            # Committed together with the record, so a file is either journaled or cataloged
+            conn.execute(text('DELETE FROM ingest_journal WHERE path = :path'), {'path': file_path})
             conn.commit()
         except OperationalError as e:
             print(f"An error occurred while saving the file record: {e}")
@@ -60,6 +204,24 @@ class Ingestor:
         finally:
             conn.close()
 
+    @retry_on_lock
+    def update_file_stat(self, file_path, file_stat):
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                text('''UPDATE files SET size = :size, mtime_ns = :mtime_ns, inode = :inode
+                        WHERE path = :path'''),
+                {'path': file_path, **file_stat}
+            )
+            conn.execute(text(UPSERT_SNAPSHOT), {'path': file_path, **file_stat})
+            conn.commit()
+        except OperationalError as e:
+            print(f"An error occurred while updating the file stat: {e}")
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
     @retry_on_lock
     def update_file_record(self, old_path, new_path):
         conn = get_db_connection()
@@ -68,6 +230,11 @@ class Ingestor:
                 text('UPDATE files SET path = :new_path, url = :url WHERE path = :old_path'),
                 {'new_path': new_path, 'url': os.path.abspath(new_path), 'old_path': old_path}
             )
+            conn.execute(text('DELETE FROM file_snapshots WHERE path = :path'), {'path': new_path})
+            conn.execute(
+                text('UPDATE file_snapshots SET path = :new_path WHERE path = :old_path'),
+                {'new_path': new_path, 'old_path': old_path}
+            )
             conn.commit()
         except OperationalError as e:
             print(f"An error occurred while updating the file record: {e}")
@@ -84,6 +251,8 @@ class Ingestor:
                 text('DELETE FROM files WHERE path = :path'),
                 {'path': file_path}
             )
+            conn.execute(text('DELETE FROM file_snapshots WHERE path = :path'), {'path': file_path})
+            conn.execute(text('DELETE FROM ingest_journal WHERE path = :path'), {'path': file_path})
             conn.commit()
         except OperationalError as e:
             print(f"An error occurred while deleting the file record: {e}")
@@ -92,26 +261,441 @@ class Ingestor:
         finally:
             conn.close()
 
-    async def ingest_pdf(self, file_path):
-        if self.file_already_processed(file_path):
+    # File snapshots: the stat of every settled file, so a startup scan only re-checks files whose stat changed
+    @retry_on_lock
+    def save_snapshot(self, file_path, file_stat):
+        """Record a file that was examined but not cataloged (e.g. binary), so it is not examined again."""
+        conn = get_db_connection()
+        try:
+            conn.execute(text(UPSERT_SNAPSHOT), {'path': file_path, **file_stat})
+            conn.execute(text('DELETE FROM ingest_journal WHERE path = :path'), {'path': file_path})
+            conn.commit()
+        except OperationalError as e:
+            print(f"An error occurred while saving the file snapshot: {e}")
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    @retry_on_lock
+    def get_snapshot(self, directory_path):
+        """
+        :return: Dict of path -> (size, mtime_ns, inode) for the snapshot rows under directory_path.
+        """
+        low, high = get_prefix_range(directory_path)
+        conn = get_db_connection()
+        try:
+            result = conn.execute(
+                text('''SELECT path, size, mtime_ns, inode FROM file_snapshots
+                        WHERE path >= :low AND path < :high'''),
+                {'low': low, 'high': high}
+            )
+            return {path: (size, mtime_ns, inode) for path, size, mtime_ns, inode in result}
+        finally:
+            conn.close()
+
+    def iter_changed_files(self, directory_path, existing_files):
+        """
+        Walk directory_path with os.scandir and diff it against its snapshot.
+
+        :param existing_files: Set that receives the path of every file found, including unchanged ones.
+        :return: Generator of (path, stat) for supported files that are new or changed since the snapshot.
+        """
+        snapshot = self.get_snapshot(directory_path)
+        scanned = unchanged = 0
+        directories = [os.path.abspath(directory_path)]
+        with metrics.timer('ingest_scan_seconds'):
+            while directories:
+                directory = directories.pop()
+                try:
+                    entries = list(os.scandir(directory))
+                except OSError as e:
+                    print(f"Failed to scan {directory}: {e}")
+                    # Files that cannot be listed right now are not gone
+                    low, high = get_prefix_range(directory)
+                    existing_files.update(path for path in snapshot if low <= path < high)
+                    continue
+                for entry in entries:
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            directories.append(entry.path)
+                            continue
+                        if not entry.is_file():
+                            continue
+                        file_stat = self.get_entry_stat(entry)
+                    except OSError:
+                        continue
+                    scanned += 1
+                    existing_files.add(entry.path)
+                    if snapshot.get(entry.path) == tuple(file_stat[key] for key in STAT_KEYS):
+                        unchanged += 1
+                    elif self.get_file_kind(entry.path) is not None:
+                        yield entry.path, file_stat
+        metrics.inc('ingest_files_scanned_total', scanned)
+        metrics.inc('ingest_files_unchanged_total', unchanged)
+
+    # Ingestion journal: one row per file between the start of its ingestion and the commit of its catalog record.
+    # Chunk ids are deterministic and the source-id mapping is written before vectors, so redoing a journaled file
+    # overwrites what it had already indexed and only embeds the chunks that are missing.
+    @retry_on_lock
+    def write_journal(self, file_path, stage, file_hash=None, error=None):
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                text('''INSERT INTO ingest_journal (path, hash, stage, error, updated_at)
+                        VALUES (:path, :hash, :stage, :error, :updated_at)
+                        ON CONFLICT(path) DO UPDATE SET hash = COALESCE(excluded.hash, hash), stage = excluded.stage,
+                            error = excluded.error, updated_at = excluded.updated_at'''),
+                {'path': file_path, 'hash': file_hash, 'stage': stage, 'error': error, 'updated_at': time.time()}
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    @retry_on_lock
+    def journal_part_committed(self, file_path):
+        conn = get_db_connection()
+        try:
+            conn.execute(
+                text('''UPDATE ingest_journal SET stage = 'indexing', parts_committed = parts_committed + 1,
+                            updated_at = :updated_at WHERE path = :path'''),
+                {'path': file_path, 'updated_at': time.time()}
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+    @retry_on_lock
+    def delete_journal_entry(self, file_path):
+        conn = get_db_connection()
+        try:
+            conn.execute(text('DELETE FROM ingest_journal WHERE path = :path'), {'path': file_path})
+            conn.commit()
+        finally:
+            conn.close()
+
+    @retry_on_lock
+    def get_journal_entries(self, directory_path=None):
+        """
+        :return: Journal rows, optionally only those under directory_path.
+        """
+        conn = get_db_connection()
+        try:
+            if directory_path:
+                low, high = get_prefix_range(directory_path)
+                result = conn.execute(
+                    text('''SELECT path, hash, stage, parts_committed, error FROM ingest_journal
+                            WHERE path >= :low AND path < :high'''),
+                    {'low': low, 'high': high}
+                )
+            else:
+                result = conn.execute(text('SELECT path, hash, stage, parts_committed, error FROM ingest_journal'))
+            entries = result.mappings().fetchall()
+        finally:
+            conn.close()
+        return [dict(entry) for entry in entries]
+
+    def recover_journal(self, directory_path=None):
+        """
+        Clean up after an interrupted run: files that disappeared lose whatever was indexed for them.
+
+        :return: Paths of journaled files still on disk, to be ingested again before anything else.
+        """
+        resume_paths = []
+        for entry in self.get_journal_entries(directory_path):
+            if os.path.exists(entry['path']):
+                resume_paths.append(entry['path'])
+            else:
+                self.remove_file(entry['path'])
+        if resume_paths:
+            print(f"Resuming {len(resume_paths)} interrupted file(s)")
+        return resume_paths
+
+    def get_file_kind(self, file_path):
+        text_kind = get_text_kind(file_path)
+        if text_kind:
+            return text_kind
+        mime_type, _ = mimetypes.guess_type(file_path)
+        if mime_type:
+            if mime_type == 'application/pdf':
+                return 'pdf'
+            elif mime_type.startswith('image'):
+                return 'image'
+        return None
+
+    # Ingestion stages. Each stage takes a job dict and returns it (or None to drop the file), so the
+    # same steps can run back to back for a single file or concurrently in IngestionPipeline.
+    def new_job(self, file_path):
+        return {
+            'path': os.path.abspath(file_path),
+            'kind': self.get_file_kind(file_path),
+            'stat': None,
+            'hash': None,
+            'encoding': None,
+            'pages': [],
+            'ids': [],
+            'contents': [],
+            'metadatas': [],
+            'embeddings': None,
+            'chunk_ids': [],
+            'image_ids': [],
+            'image_uris': None,
+            'image_metadatas': [],
+            'image_embeddings': None,
+            'image_futures': [],
+            'errors': [],
+            'file': self.new_file_state(parts=1),
+            'resume': False,
+        }
+
+    def new_file_state(self, parts):
+        """State shared by every job (part) of one file; a file is finalized once all its parts are committed."""
+        return {
+            'lock': threading.Lock(),
+            'parts': parts,
+            'finished': parts > 0,
+            'committed': 0,
+            'seen_ids': set(),
+            'chunk_ids': set(),
+            'existing_chunks': None,
+            'embedded': 0,
+            'errors': [],
+        }
+
+    def new_part(self, job):
+        part = self.new_job(job['path'])
+        for key in ('kind', 'stat', 'hash', 'encoding', 'file'):
+            part[key] = job[key]
+        return part
+
+    def add_chunk(self, job, content, metadata):
+        metadata['chunk_hash'] = get_chunk_hash(content)
+        chunk_id = make_chunk_id(job['path'], get_chunk_locator(metadata), metadata['chunk_hash'])
+        # Identical chunks at the same location are stored once
+        if chunk_id in job['file']['seen_ids']:
             return
-        with open(file_path, 'rb') as f:
-            page_contents = ocr_pdf(file_obj=f, source=f"file:///{file_path}")
-        contents = []
-        metadatas = []
-        for page_content in page_contents:
-            contents.append(page_content['content'])
-            metadatas.append(page_content['metadata'])
-            metadatas[-1]['type'] = 'document'
-            metadatas[-1]['source'] = os.path.abspath(file_path)
-        self.vector_store.multimodal_index(
-            ids=[str(uuid.uuid4()) for _ in contents],
-            contents=contents,
-            image_uris=None,
-            metadatas=metadatas
-        )
-        self.save_file_record(file_path)
-        print(f'PDF file ingested: {file_path}')
+        job['file']['seen_ids'].add(chunk_id)
+        job['ids'].append(chunk_id)
+        job['contents'].append(content)
+        job['metadatas'].append(metadata)
+
+    def check_job(self, job):
+        if job['kind'] is None:
+            return None
+        job['stat'] = job['stat'] or self.get_file_stat(job['path'])
+        if job['resume']:
+            # A journaled file may already be cataloged with its current stat (e.g. an interrupted move)
+            self.delete_file_record(job['path'])
+        if job['kind'] in TEXT_KINDS and job['stat']['size'] > TEXT_LOADER_MAX_FILE_BYTES:
+            print(f"Skipping file larger than {TEXT_LOADER_MAX_FILE_BYTES} bytes: {job['path']}")
+            self.save_snapshot(job['path'], job['stat'])
+            return None
+        change = self.detect_change(job['path'], job['stat'])
+        if change is None:
+            metrics.inc('ingest_files_unchanged_total')
+            return None
+        # The hash is computed once here and reused when the file record is committed
+        job['stat'], job['hash'] = change
+        if self.reuse_known_content(job['path'], job['hash'], job['stat']):
+            metrics.inc('ingest_files_reused_total')
+            return None
+        self.write_journal(job['path'], 'checked', file_hash=job['hash'])
+        return job
+
+    def extract_job(self, job):
+        file_path = job['path']
+        if job['kind'] == 'pdf':
+            with open(file_path, 'rb') as f:
+                job['pages'] = extract_pdf(file_obj=f, source=f"file:///{file_path}")
+            metrics.inc('ingest_pages_total', len(job['pages']))
+        elif job['kind'] in TEXT_KINDS:
+            # Text files are read lazily by the chunk stage; only the encoding is settled here
+            job['encoding'] = detect_encoding(file_path)
+            if job['encoding'] is None:
+                print(f"Skipping binary file: {file_path}")
+                self.save_snapshot(file_path, job['stat'])
+                return None
+        elif job['kind'] == 'image':
+            image_metadata = {'type': 'image', 'source': file_path, 'content_hash': job['hash'],
+                              'chunk_hash': job['hash']}
+            image_id = make_chunk_id(file_path, get_chunk_locator(image_metadata), job['hash'])
+            job['image_ids'] = [image_id]
+            job['image_uris'] = [file_path]
+            job['image_metadatas'] = [image_metadata]
+            # Decoded and embedded in batched CLIP passes while OCR runs; the commit stage collects the result
+            job['image_futures'] = self.vector_store.submit_images(job['image_uris'])
+            metrics.inc('ingest_images_embedded_total')
+
+            # Ingest Image Content
+            try:
+                with open(file_path, 'rb') as f:
+                    content = ocr_image(file_obj=f, source=f"file:///{file_path}")
+                job['ids'] = [image_id]
+                job['contents'] = [content]
+                job['metadatas'] = [{'type': "Image", 'source': file_path, 'content_hash': job['hash'],
+                                     'chunk_hash': job['hash']}]
+            except:
+                print("Image doesn't have any content")
+        self.write_journal(job['path'], 'extracted')
+        return job
+
+    def chunk_job(self, job):
+        if job['kind'] in TEXT_KINDS:
+            return self.iter_text_parts(job)
+        for chunk in chunk_pages(job['pages']):
+            metadata = chunk['metadata']
+            metadata['type'] = 'document'
+            metadata['source'] = job['path']
+            metadata['content_hash'] = job['hash']
+            self.add_chunk(job, chunk['content'], metadata)
+        job['pages'] = []
+        return job
+
+    def iter_text_parts(self, job):
+        """
+        Stream a text file through the remaining stages as a series of jobs of at most TEXT_LOADER_CHUNKS_PER_PART
+        chunks, so memory stays bounded by the queue depth rather than the file size.
+        """
+        file_state = job['file'] = self.new_file_state(parts=0)
+        part = self.new_part(job)
+        for chunk in iter_text_chunks(job['path'], job['kind'], job['encoding'], source=job['path']):
+            metadata = chunk['metadata']
+            metadata['type'] = 'text'
+            metadata['content_hash'] = job['hash']
+            self.add_chunk(part, chunk['content'], metadata)
+            if len(part['ids']) >= TEXT_LOADER_CHUNKS_PER_PART:
+                with file_state['lock']:
+                    file_state['parts'] += 1
+                yield part
+                part = self.new_part(job)
+        with file_state['lock']:
+            file_state['parts'] += 1
+            file_state['finished'] = True
+        yield part
+
+    def get_existing_chunks(self, job):
+        file_state = job['file']
+        with file_state['lock']:
+            if file_state['existing_chunks'] is None:
+                file_state['existing_chunks'] = self.vector_store.get_chunk_keys(job['path'])
+            return file_state['existing_chunks']
+
+    def embed_job(self, job):
+        # Chunks whose location and content are already indexed for this source keep their vectors
+        existing_chunks = self.get_existing_chunks(job)
+        job['chunk_ids'] = []
+        changed = []
+        for i, metadata in enumerate(job['metadatas']):
+            existing_id = existing_chunks.get((get_chunk_locator(metadata), metadata['chunk_hash']))
+            if existing_id:
+                job['chunk_ids'].append(existing_id)
+            else:
+                job['chunk_ids'].append(job['ids'][i])
+                changed.append(i)
+        job['ids'] = [job['ids'][i] for i in changed]
+        job['contents'] = [job['contents'][i] for i in changed]
+        job['metadatas'] = [job['metadatas'][i] for i in changed]
+
+        if job['contents']:
+            job['embeddings'], errors = self.vector_store.embed_texts(job['contents'])
+            metrics.inc('ingest_chunks_embedded_total', len(job['contents']))
+            job['errors'] = [
+                f"{job['ids'][i]}: {error}" for i, error in enumerate(errors) if error is not None
+            ]
+        self.write_journal(job['path'], 'embedded')
+        return job
+
+    def commit_job(self, job):
+        image_errors = []
+        if job['image_futures']:
+            job['image_embeddings'], errors = wait_for_embeddings(job['image_futures'])
+            job['image_futures'] = []
+            image_errors = [f"{job['image_ids'][i]}: {error}" for i, error in enumerate(errors) if error is not None]
+            indexed = [i for i, embedding in enumerate(job['image_embeddings']) if embedding is not None]
+            for key in ('image_ids', 'image_uris', 'image_metadatas', 'image_embeddings'):
+                job[key] = [job[key][i] for i in indexed]
+        if job['image_uris']:
+            report = self.vector_store.multimodal_index(
+                ids=job['image_ids'],
+                contents=None,
+                image_uris=job['image_uris'],
+                metadatas=job['image_metadatas'],
+                image_embeddings=job['image_embeddings']
+            )
+            image_errors.extend(f"{item['id']}: {item['error']}" for item in report if item['error'])
+        if job['contents']:
+            report = self.vector_store.multimodal_index(
+                ids=job['ids'],
+                contents=job['contents'],
+                image_uris=None,
+                metadatas=job['metadatas'],
+                embeddings=job['embeddings']
+            )
+            job['errors'] = job['errors'] or [f"{item['id']}: {item['error']}" for item in report if item['error']]
+        job['errors'] = job['errors'] + image_errors
+
+        self.journal_part_committed(job['path'])
+        file_state = job['file']
+        with file_state['lock']:
+            file_state['chunk_ids'].update(job['chunk_ids'])
+            file_state['chunk_ids'].update(job['image_ids'])
+            file_state['errors'].extend(job['errors'])
+            file_state['embedded'] += len(job['ids'])
+            file_state['committed'] += 1
+            if not (file_state['finished'] and file_state['committed'] == file_state['parts']):
+                return job
+        return self.finalize_job(job)
+
+    def finalize_job(self, job):
+        file_state = job['file']
+        # Drop the chunks that no longer exist in this version of the file
+        stale_ids = [chunk_id for chunk_id in self.vector_store.get_ids_by_source(job['path'])
+                     if chunk_id not in file_state['chunk_ids']]
+        self.vector_store.delete_ids(job['path'], stale_ids)
+
+        if file_state['errors']:
+            # Leave the file out of the catalog so the next scan retries it
+            print(f"Failed to index {len(file_state['errors'])} chunk(s) of {job['path']}: {file_state['errors']}")
+            self.write_journal(job['path'], 'failed', error='; '.join(file_state['errors'])[:1000])
+            metrics.inc('ingest_failures_total', stage='commit')
+            return job
+        self.save_file_record(job['path'], file_hash=job['hash'], file_stat=job['stat'])
+        metrics.inc('ingest_files_total', kind=job['kind'])
+        metrics.inc('ingest_bytes_total', job['stat']['size'])
+        print(f"{FILE_KIND_LABELS.get(job['kind'], 'File')} file ingested: {job['path']}: "
+              f"{file_state['embedded']} chunk(s) embedded, {len(stale_ids)} removed")
+        return job
+
+    async def ingest_file(self, file_path):
+        return await asyncio.to_thread(self.process_job, self.new_job(file_path))
+
+    def run_stage(self, stage, job):
+        """Run one `<stage>_job` method, recording its latency."""
+        with metrics.timer('ingest_stage_seconds', stage=stage):
+            return getattr(self, f'{stage}_job')(job)
+
+    def next_part(self, stage, parts):
+        with metrics.timer('ingest_stage_seconds', stage=stage):
+            return next(parts, None)
+
+    def process_job(self, job, stages=STAGES):
+        """Run a job through `stages` one after the other in the calling thread."""
+        try:
+            result = self.run_stage(stages[0], job)
+        except Exception:
+            metrics.inc('ingest_failures_total', stage=stages[0])
+            raise
+        if inspect.isgenerator(result):
+            # A stage that streams a file yields several jobs; each runs through the remaining stages in turn
+            while (part := self.next_part(stages[0], result)) is not None:
+                self.process_job(part, stages[1:])
+            return job
+        if result is None or len(stages) == 1:
+            return result
+        return self.process_job(result, stages[1:])
+
+    async def ingest_pdf(self, file_path):
+        await self.ingest_file(file_path)
 
     async def ingest_content(self, contents: list[str]):
         self.vector_store.multimodal_index(
@@ -122,37 +706,22 @@ class Ingestor:
         )
 
     async def ingest_image(self, file_path):
-        if self.file_already_processed(file_path):
-            return
-        self.save_file_record(file_path)
-
-        metadata = {'type': 'image', 'source': os.path.abspath(file_path)}
-        image_id = str(uuid.uuid4())
-        self.vector_store.multimodal_index(ids=[image_id], contents=None, image_uris=[file_path], metadatas=[metadata])
-        print(f'Image file ingested: {file_path}')
-
-        # Ingest Image Content
-        try:
-            with open(file_path, 'rb') as f:
-                content = ocr_image(file_obj=f, source=f"file:///{file_path}")
-                self.vector_store.multimodal_index(
-                    ids=[image_id],
-                    contents=[content],
-                    image_uris=None,
-                    metadatas=[{'type': "Image", 'source': f"file:///{file_path}"}]
-                )
-        except:
-            print("Image doesn't have any content")
-
+        await self.ingest_file(file_path)
         return f'Image file ingested: {file_path}'
 
     async def ingest_document(self, file_path):
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if mime_type:
-            if mime_type == 'application/pdf':
-                await self.ingest_pdf(file_path)
-            elif mime_type.startswith('image'):
-                await self.ingest_image(file_path)
+        if self.get_file_kind(file_path):
+            await self.ingest_file(file_path)
+
+    def remove_file(self, file_path):
+        self.vector_store.delete_by_source(file_path)
+        self.delete_file_record(file_path)
+
+    def move_file(self, old_path, new_path):
+        # A file that was replaced by the move must not keep its vectors or block the catalog update
+        self.remove_file(new_path)
+        self.vector_store.update_source(old_path, new_path)
+        self.update_file_record(old_path, new_path)
 
 
 import os
@@ -166,71 +735,82 @@ class DirectoryIngestor(Ingestor):
     def __init__(self, vector_store: VectorStore):
         super().__init__(vector_store)
         self.observers = {}
+        # One queue (and event loop) shared by every watched directory
+        self.event_queue = CoalescingEventQueue(self)
 
     @retry_on_lock
     def resolve_directory_conflicts(self, directory_path):
-        conn = get_db_connection()
-        try:
-            result = conn.execute(text('SELECT * FROM directories'))
-            all_dirs = result.fetchall()
-
-            parent_dir = None
-            child_dirs = []
+        """
+        Register directory_path as an ingestion root.
 
-            abs_directory_path = os.path.abspath(directory_path)
+        Its watcher is started right away, before the directory is scanned, so files changed while it is ingested
+        are picked up (the stat check skips those the scan already handled). Roots nested inside it are folded into
+        it: their rows are dropped and their watchers stopped once the new root's watcher covers them.
 
-            for dir in all_dirs:
-                abs_dir_path = os.path.abspath(dir[1])  # Change from dir['path'] to dir[1]
-                if os.path.commonpath([abs_directory_path, abs_dir_path]) == abs_dir_path:
-                    parent_dir = abs_dir_path
-                elif os.path.commonpath([abs_dir_path, abs_directory_path]) == abs_directory_path:
-                    child_dirs.append(abs_dir_path)
+        :return: The watched root that already contains directory_path, if any; the directory is then left to it.
+        """
+        abs_directory_path = os.path.abspath(directory_path)
+        conn = get_db_connection()
+        try:
+            all_dirs = [row[0] for row in conn.execute(text('SELECT path FROM directories'))]
 
+            parent_dir = next((dir_path for dir_path in all_dirs if dir_path != abs_directory_path
+                               and dir_path in self.observers
+                               and os.path.commonpath([abs_directory_path, dir_path]) == dir_path), None)
             if parent_dir:
-                conn.execute(text('DELETE FROM directories WHERE path = :path'), {'path': parent_dir})
+                return parent_dir
+
+            child_dirs = [dir_path for dir_path in all_dirs if dir_path != abs_directory_path
+                          and os.path.commonpath([dir_path, abs_directory_path]) == abs_directory_path]
             for child_dir in child_dirs:
                 conn.execute(text('DELETE FROM directories WHERE path = :path'), {'path': child_dir})
+            conn.execute(
+                text('''INSERT INTO directories (id, path, parent, timestamp)
+                        VALUES (:id, :path, NULL, :timestamp)
+                        ON CONFLICT(path) DO UPDATE SET timestamp = excluded.timestamp'''),
+                {'id': str(uuid.uuid4()), 'path': abs_directory_path, 'timestamp': str(time.time())}
+            )
             conn.commit()
         finally:
             conn.close()
 
-        return parent_dir
+        self.start_file_watcher(abs_directory_path)
+        for child_dir in child_dirs:
+            self.stop_file_watcher(child_dir)
+        return None
 
     async def ingest_directory(self, directory_path):
         if self.resolve_directory_conflicts(directory_path):
             print(f"Directory already processed: {directory_path}")
             return
 
-        # Track existing files in the directory
+        # Files left half-ingested by an interrupted run go first
+        resume_paths = self.recover_journal(directory_path)
+
+        # Diff the tree against its snapshot, then check, extract, embed and commit the changed files concurrently
         existing_files = set()
-        for root, dirs, files in os.walk(directory_path):
-            for file in files:
-                file_path = os.path.join(root, file)
-                existing_files.add(os.path.abspath(file_path))
-                mime_type, _ = mimetypes.guess_type(file_path)
-                if mime_type:
-                    if mime_type == 'application/pdf':
-                        await self.ingest_pdf(file_path)
-                    elif mime_type.startswith('image'):
-                        await self.ingest_image(file_path)
-
-        # Fetch records from the database to find missing files
-        conn = get_db_connection()
-        try:
-            result = conn.execute(text('SELECT path FROM files'))
-            db_files = result.fetchall()
-        finally:
-            conn.close()
+        jobs = (job for job, _ in iter_directory_jobs(self, directory_path, existing_files, resume_paths))
+        with metrics.timer('ingest_directory_seconds'):
+            await IngestionPipeline(self).run(jobs)
 
-        db_files_set = set(os.path.abspath(file[0]) for file in db_files)  # Change from file['path'] to file[0]
+        self.remove_missing_files(directory_path, existing_files)
 
-        # Detect deleted or moved files
-        missing_files = db_files_set - existing_files
+    def remove_missing_files(self, directory_path, existing_files):
+        """
+        Drop the vectors and records of files under directory_path that are no longer on disk. Runs after the
+        changed files were ingested, so moved files have already been re-pointed to their new path.
+        """
+        missing_files = set(self.get_snapshot(directory_path)) - existing_files
         for missing_file in missing_files:
-            self.vector_store.delete_by_source(missing_file)
-            self.delete_file_record(missing_file)
-
-        self.start_file_watcher(directory_path)
+            self.claim_path(missing_file)
+            try:
+                # Created after the walk passed its directory, and ingested by the watcher since
+                if not os.path.exists(missing_file):
+                    self.remove_file(missing_file)
+            finally:
+                self.release_path(missing_file)
+        if missing_files:
+            print(f"Removed {len(missing_files)} missing file(s) from the index")
 
     def start_file_watcher(self, directory_path):
         abs_directory_path = os.path.abspath(directory_path)
@@ -238,6 +818,7 @@ class DirectoryIngestor(Ingestor):
             print(f"Directory watcher already running for: {abs_directory_path}")
             return
 
+        self.event_queue.start()
         event_handler = IngestionEventHandler(self)
         observer = Observer()
         observer.schedule(event_handler, abs_directory_path, recursive=True)
@@ -245,15 +826,21 @@ class DirectoryIngestor(Ingestor):
         self.observers[abs_directory_path] = observer
         print(f'Started watching directory: {abs_directory_path}')
 
+    def stop_file_watcher(self, directory_path):
+        observer = self.observers.pop(os.path.abspath(directory_path), None)
+        if observer is not None:
+            observer.stop()
+            observer.join()
+            print(f'Stopped watching directory: {directory_path}')
+
     def stop_all_watchers(self):
         for observer in self.observers.values():
             observer.stop()
             observer.join()
         self.observers.clear()
+        self.event_queue.stop()
 
 
-import os
-import asyncio
 from watchdog.events import FileSystemEventHandler
 
 class IngestionEventHandler(FileSystemEventHandler):
@@ -261,31 +848,19 @@ class IngestionEventHandler(FileSystemEventHandler):
         """
         Initialize the event handler with a reference to the ingestor.
 
-        :param ingestor: Instance of Ingestor or DirectoryIngestor to handle the events.
+        :param ingestor: DirectoryIngestor whose event queue receives the events.
         """
         self.ingestor = ingestor
+        self.event_queue = ingestor.event_queue
 
-    async def handle_event(self, event):
+    def handle_event(self, event):
         """
-        Handle file system events and perform the appropriate ingestion or deletion action.
+        Forward a file system event to the coalescing event queue, which debounces it and applies the net action.
 
         :param event: File system event object.
         """
         if not event.is_directory:
-            if event.event_type == 'deleted':
-                # Handle file deletion event
-                self.ingestor.vector_store.delete_by_source(os.path.abspath(event.src_path))
-                self.ingestor.delete_file_record(os.path.abspath(event.src_path))
-            elif event.event_type == 'moved':
-                # Handle file move event
-                self.ingestor.vector_store.update_source(
-                    os.path.abspath(event.src_path),
-                    os.path.abspath(event.dest_path)
-                )
-                self.ingestor.update_file_record(os.path.abspath(event.src_path), os.path.abspath(event.dest_path))
-            else:
-                # Handle file creation or modification event
-                await self.ingestor.ingest_document(event.src_path)
+            self.event_queue.push(event.event_type, event.src_path, getattr(event, 'dest_path', None))
 
     def on_created(self, event):
         """
@@ -293,7 +868,15 @@ class IngestionEventHandler(FileSystemEventHandler):
 
         :param event: File system event object.
         """
-        asyncio.run(self.handle_event(event))
+        self.handle_event(event)
+
+    def on_modified(self, event):
+        """
+        Triggered when a file or directory is modified.
+
+        :param event: File system event object.
+        """
+        self.handle_event(event)
 
     def on_deleted(self, event):
         """
@@ -301,7 +884,7 @@ class IngestionEventHandler(FileSystemEventHandler):
 
         :param event: File system event object.
         """
-        asyncio.run(self.handle_event(event))
+        self.handle_event(event)
 
     def on_moved(self, event):
         """
@@ -309,4 +892,4 @@ class IngestionEventHandler(FileSystemEventHandler):
 
         :param event: File system event object.
         """
-        asyncio.run(self.handle_event(event))
+        self.handle_event(event)
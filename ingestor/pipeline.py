@@ -0,0 +1,165 @@
+import asyncio
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from config.settings import (
+    INGEST_QUEUE_DEPTH,
+    INGEST_CHECK_WORKERS,
+    INGEST_EXTRACT_WORKERS,
+    INGEST_CHUNK_WORKERS,
+    INGEST_EMBED_WORKERS,
+    INGEST_COMMIT_WORKERS,
+)
+from utils.metrics import metrics
+
+STAGES = ['check', 'extract', 'chunk', 'embed', 'commit']
+
+
+def iter_directory_jobs(ingestor, directory_path, existing_files, resume_paths=()):
+    """
+    Yield (job, file_stat) for every file under directory_path that needs ingesting.
+
+    Journaled files from an interrupted run come first, flagged to be re-checked even if their stat is unchanged
+    (their file_stat is None). Then come the files whose stat differs from the snapshot; every file found on disk,
+    changed or not, is added to existing_files.
+    """
+    queued = set()
+    for file_path in resume_paths:
+        job = ingestor.new_job(file_path)
+        if job['kind'] is None:
+            continue
+        job['resume'] = True
+        queued.add(job['path'])
+        yield job, None
+
+    # Files whose stat matches the snapshot are skipped without touching the catalog
+    for file_path, file_stat in ingestor.iter_changed_files(directory_path, existing_files):
+        if file_path in queued:
+            continue
+        metrics.inc('ingest_files_seen_total')
+        yield ingestor.new_job(file_path), file_stat
+
+
+class IngestionPipeline:
+    """
+    Bounded producer/consumer pipeline that ingests files.
+
+    A feeder thread pulls jobs from an iterator into the first queue, and every stage
+    (check -> extract -> chunk -> embed -> commit) runs its own pool of workers that calls the matching
+    `<stage>_job` method of the ingestor. Each queue holds at most `queue_depth` jobs, so a slow stage applies back
+    pressure upstream instead of buffering the whole tree: the iterator is only advanced when the check queue has
+    room. A file is claimed (see Ingestor.claim_path) before it is fed, so it waits while the watcher works on it.
+    Once every job of a file (a streamed file has several) has left the pipeline, the file is released and
+    `on_file_done(path, failed)` is called.
+    """
+
+    def __init__(self, ingestor, queue_depth=INGEST_QUEUE_DEPTH, check_workers=INGEST_CHECK_WORKERS,
+                 extract_workers=INGEST_EXTRACT_WORKERS, chunk_workers=INGEST_CHUNK_WORKERS,
+                 embed_workers=INGEST_EMBED_WORKERS, commit_workers=INGEST_COMMIT_WORKERS, on_file_done=None):
+        self.ingestor = ingestor
+        self.queue_depth = queue_depth
+        self.stage_workers = {
+            'check': max(1, check_workers),
+            'extract': max(1, extract_workers),
+            'chunk': max(1, chunk_workers),
+            'embed': max(1, embed_workers),
+            'commit': max(1, commit_workers),
+        }
+        self.on_file_done = on_file_done
+        # path -> {'pending': jobs of the file still in the pipeline, 'failed': ...}; only touched on the event loop
+        self._files = {}
+
+    async def run(self, jobs):
+        """
+        Run every job of `jobs` through the stages.
+
+        :param jobs: Iterator of jobs (see Ingestor.new_job). It is advanced on a daemon thread of its own and may
+            block while it waits for work, so a never-ending iterator keeps the pipeline running.
+        :return: Once every job has been processed.
+        """
+        loop = asyncio.get_running_loop()
+        # One extra thread runs on_file_done
+        executor = ThreadPoolExecutor(max_workers=sum(self.stage_workers.values()) + 1,
+                                      thread_name_prefix='ingest')
+        queues = {stage: asyncio.Queue(maxsize=self.queue_depth) for stage in STAGES}
+
+        workers = []
+        for index, stage in enumerate(STAGES):
+            next_queue = queues[STAGES[index + 1]] if index + 1 < len(STAGES) else None
+            for _ in range(self.stage_workers[stage]):
+                workers.append(asyncio.create_task(
+                    self._worker(stage, queues[stage], next_queue, loop, executor)
+                ))
+
+        try:
+            fed = loop.create_future()
+            threading.Thread(target=self._feed, args=(jobs, queues['check'], loop, fed), name='ingest-feed',
+                             daemon=True).start()
+            await fed
+            # A stage only becomes idle once everything upstream has drained into it
+            for stage in STAGES:
+                await queues[stage].join()
+        finally:
+            for worker in workers:
+                worker.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            executor.shutdown(wait=False)
+
+    def _feed(self, jobs, queue, loop, fed):
+        try:
+            for job in jobs:
+                self.ingestor.claim_path(job['path'])
+                try:
+                    # Blocks the feeder while the check queue is full
+                    asyncio.run_coroutine_threadsafe(self._put(queue, job), loop).result()
+                except BaseException:
+                    self.ingestor.release_path(job['path'])
+                    raise
+        except Exception as e:
+            loop.call_soon_threadsafe(fed.set_exception, e)
+        else:
+            loop.call_soon_threadsafe(fed.set_result, None)
+
+    async def _put(self, queue, job):
+        state = self._files.setdefault(job['path'], {'pending': 0, 'failed': False})
+        state['pending'] += 1
+        await queue.put(job)
+
+    async def _worker(self, stage, queue, next_queue, loop, executor):
+        while True:
+            job = await queue.get()
+            metrics.set('ingest_queue_depth', queue.qsize(), stage=stage)
+            failed = False
+            try:
+                result = await loop.run_in_executor(executor, self.ingestor.run_stage, stage, job)
+                if inspect.isgenerator(result):
+                    # Streamed files arrive as several bounded jobs; the full next queue throttles the reader
+                    while (part := await loop.run_in_executor(executor, self.ingestor.next_part, stage, result)):
+                        await self._put(next_queue, part)
+                elif result is not None and next_queue is not None:
+                    await self._put(next_queue, result)
+                elif result is not None:
+                    failed = bool(result['file']['errors'])
+            except Exception as e:
+                failed = True
+                print(f"Ingestion failed at {stage} stage for {job['path']}: {e}")
+                metrics.inc('ingest_failures_total', stage=stage)
+            try:
+                await self._job_done(job['path'], failed, loop, executor)
+            finally:
+                queue.task_done()
+
+    async def _job_done(self, path, failed, loop, executor):
+        state = self._files[path]
+        state['pending'] -= 1
+        state['failed'] = state['failed'] or failed
+        if state['pending'] > 0:
+            return
+        del self._files[path]
+        self.ingestor.release_path(path)
+        if self.on_file_done is not None:
+            try:
+                await loop.run_in_executor(executor, self.on_file_done, path, state['failed'])
+            except Exception as e:
+                print(f"Failed to record the end of ingestion for {path}: {e}")
@@ -0,0 +1,226 @@
+import asyncio
+import heapq
+import itertools
+import os
+import re
+import threading
+import time
+
+from config.settings import INGEST_BACKLOG_MAX_FILES, INGEST_RECENT_SECONDS, INGEST_SMALL_FILE_BYTES
+from ingestor.pipeline import IngestionPipeline, iter_directory_jobs
+from utils.metrics import metrics
+
+# Priority tiers, lowest first
+REFERENCED, RECENT, SMALL, BULK = range(4)
+# Shorter names match too many unrelated words of a query
+MIN_REFERENCE_LENGTH = 4
+
+
+class BackgroundIngestionService:
+    """
+    Ingests directories in the background so the app stays usable while a tree is indexed.
+
+    Files are fed to one long-running IngestionPipeline through a priority queue instead of in walk order: files
+    the user referenced in a query come first, then recently modified files (newest first), then small files
+    (smallest first), then the bulk backlog by size. Files from an interrupted run are treated as referenced. The
+    queue holds at most `max_backlog` files; the directory scan waits while it is full, and the pipeline only takes
+    the next file when its check queue has room. The directory's watcher starts before the scan; once every file of
+    the directory has been processed, files that disappeared from it are dropped from the index.
+    """
+
+    def __init__(self, ingestor, max_backlog=INGEST_BACKLOG_MAX_FILES, recent_seconds=INGEST_RECENT_SECONDS,
+                 small_file_bytes=INGEST_SMALL_FILE_BYTES):
+        self.ingestor = ingestor
+        self.max_backlog = max(1, max_backlog)
+        self.recent_seconds = recent_seconds
+        self.small_file_bytes = small_file_bytes
+        self.pipeline = IngestionPipeline(ingestor, on_file_done=self._file_done)
+        self._condition = threading.Condition()
+        self._heap = []
+        self._entries = {}
+        self._sequence = itertools.count()
+        self._directories = {}
+        self._running = {}
+        self._thread = None
+
+    def start(self):
+        with self._condition:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=asyncio.run, args=(self.pipeline.run(self._jobs()),),
+                                            name='ingest-pipeline', daemon=True)
+            self._thread.start()
+
+    def ingest_directory(self, directory_path):
+        """
+        Queue every file under directory_path and return immediately.
+
+        :return: False if the directory is already being ingested, True otherwise.
+        """
+        directory_path = os.path.abspath(directory_path)
+        with self._condition:
+            progress = self._directories.get(directory_path)
+            if progress and progress['state'] != 'done':
+                return False
+            self._directories[directory_path] = {
+                'path': directory_path, 'state': 'scanning', 'queued': 0, 'done': 0, 'failed': 0,
+                'started_at': time.time(), 'finished_at': None, 'existing_files': set(), 'reconcile': True,
+            }
+        self.start()
+        threading.Thread(target=self._scan, args=(directory_path,), name='ingest-scan', daemon=True).start()
+        return True
+
+    def promote(self, paths):
+        """Move queued files to the front of the backlog."""
+        with self._condition:
+            for path in paths:
+                entry = self._entries.get(os.path.abspath(path))
+                if entry is not None and entry['priority'][0] != REFERENCED:
+                    self._push(entry['job'], entry['directory'], (REFERENCED, 0))
+
+    def promote_referenced(self, query):
+        """
+        Promote queued files whose path or file name appears in a user query.
+
+        :return: Paths that were promoted.
+        """
+        query = query.lower()
+        words = set(re.findall(r'[\w.\-/]+', query))
+        with self._condition:
+            referenced = [
+                path for path in self._entries
+                if path.lower() in query or self._mentions(os.path.basename(path).lower(), query, words)
+            ]
+        self.promote(referenced)
+        return referenced
+
+    @staticmethod
+    def _mentions(name, query, words):
+        if len(name) < MIN_REFERENCE_LENGTH:
+            return False
+        stem = os.path.splitext(name)[0]
+        return name in query or (len(stem) >= MIN_REFERENCE_LENGTH and stem in words)
+
+    def progress(self):
+        """
+        :return: One dict per submitted directory with its state ('scanning', 'ingesting', 'finishing', 'done'),
+            queued, done and failed file counts, and the files being ingested right now.
+        """
+        with self._condition:
+            running = list(self._running.items())
+            return [
+                {
+                    **{key: value for key, value in progress.items() if key not in ('existing_files', 'reconcile')},
+                    'current': [path for path, directory in running if directory == progress['path']],
+                }
+                for progress in self._directories.values()
+            ]
+
+    def pending_count(self):
+        with self._condition:
+            return len(self._entries)
+
+    def get_priority(self, file_stat):
+        age = time.time() - file_stat['mtime_ns'] / 1e9
+        if age <= self.recent_seconds:
+            return RECENT, -file_stat['mtime_ns']
+        if file_stat['size'] <= self.small_file_bytes:
+            return SMALL, file_stat['size']
+        return BULK, file_stat['size']
+
+    def _push(self, job, directory, priority):
+        # Re-pushing a path supersedes its older heap entry, which is skipped when popped
+        path = job['path']
+        entry = {'path': path, 'job': job, 'directory': directory, 'priority': priority,
+                 'sequence': next(self._sequence)}
+        self._entries[path] = entry
+        heapq.heappush(self._heap, (priority, entry['sequence'], path))
+        metrics.set('ingest_backlog', len(self._entries))
+        self._condition.notify_all()
+
+    def _pop(self):
+        while True:
+            while not self._heap:
+                self._condition.wait()
+            priority, sequence, path = heapq.heappop(self._heap)
+            entry = self._entries.get(path)
+            if entry is not None and entry['sequence'] == sequence:
+                del self._entries[path]
+                metrics.set('ingest_backlog', len(self._entries))
+                # Wakes a scan waiting for room in the backlog
+                self._condition.notify_all()
+                return entry
+
+    def _scan(self, directory_path):
+        try:
+            if self.ingestor.resolve_directory_conflicts(directory_path):
+                print(f"Directory already processed: {directory_path}")
+                self._finish_directory(directory_path, reconcile=False)
+                return
+
+            # Files left half-ingested by an interrupted run go first; only files whose stat differs from the
+            # snapshot follow
+            resume_paths = self.ingestor.recover_journal(directory_path)
+            existing_files = self._directories[directory_path]['existing_files']
+            for job, file_stat in iter_directory_jobs(self.ingestor, directory_path, existing_files, resume_paths):
+                priority = (REFERENCED, 0) if job['resume'] else self.get_priority(file_stat)
+                self._queue_file(directory_path, job, priority)
+        except Exception as e:
+            print(f"Failed to scan {directory_path}: {e}")
+            # A partial walk must not be mistaken for deleted files
+            self._directories[directory_path]['reconcile'] = False
+
+        with self._condition:
+            progress = self._directories[directory_path]
+            finished = progress['done'] + progress['failed'] >= progress['queued']
+            # Whoever sees the last file done (this thread or a worker) finishes the directory, exactly once
+            progress['state'] = 'finishing' if finished else 'ingesting'
+        if finished:
+            self._finish_directory(directory_path)
+
+    def _queue_file(self, directory_path, job, priority):
+        with self._condition:
+            # A file already queued or in the pipeline is not queued twice
+            if job['path'] in self._entries or job['path'] in self._running:
+                return
+            while len(self._entries) >= self.max_backlog:
+                self._condition.wait()
+            self._directories[directory_path]['queued'] += 1
+            self._push(job, directory_path, priority)
+
+    def _jobs(self):
+        """Never-ending job source of the pipeline; it blocks until a file is queued."""
+        while True:
+            with self._condition:
+                entry = self._pop()
+                self._running[entry['path']] = entry['directory']
+            yield entry['job']
+
+    def _file_done(self, path, failed):
+        with self._condition:
+            directory = self._running.pop(path, None)
+            if directory is None:
+                return
+            progress = self._directories[directory]
+            progress['failed' if failed else 'done'] += 1
+            finished = (progress['state'] == 'ingesting'
+                        and progress['done'] + progress['failed'] >= progress['queued'])
+            if finished:
+                progress['state'] = 'finishing'
+        if finished:
+            # Reconciling a large tree must not hold up a pipeline worker
+            threading.Thread(target=self._finish_directory, args=(directory,), name='ingest-finish',
+                             daemon=True).start()
+
+    def _finish_directory(self, directory_path, reconcile=True):
+        progress = self._directories[directory_path]
+        try:
+            if reconcile and progress['reconcile']:
+                self.ingestor.remove_missing_files(directory_path, progress['existing_files'])
+        except Exception as e:
+            print(f"Failed to finish ingesting {directory_path}: {e}")
+        with self._condition:
+            progress['state'] = 'done'
+            progress['finished_at'] = time.time()
+            progress['existing_files'] = set()
+        print(f"Ingested all documents in the directory: {directory_path}")
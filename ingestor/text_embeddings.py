@@ -0,0 +1,277 @@
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import List
+
+import numpy as np
+import chromadb.utils.embedding_functions as embedding_functions
+from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+from config.settings import (
+    OPEN_AI_API_KEY,
+    TEXT_EMBEDDING_PROVIDER,
+    TEXT_EMBEDDING_OPENAI_MODEL,
+    TEXT_EMBEDDING_OPENAI_DIMENSIONS,
+    TEXT_EMBEDDING_LOCAL_MODEL_PATH,
+    TEXT_EMBEDDING_LOCAL_MODEL_NAME,
+    TEXT_EMBEDDING_LOCAL_THREADS,
+    TEXT_EMBEDDING_LOCAL_BATCH_SIZE,
+    TEXT_EMBEDDING_LOCAL_MAX_LENGTH,
+)
+
+
+class TextEmbeddingProvider(ABC):
+    """
+    Turns chunks and search queries into vectors of the text collection.
+
+    A collection can only be queried with vectors of the space it was built in, so the provider name, model and
+    dimension are recorded in the collection's metadata (see check_collection).
+    """
+
+    # Local models compete with the app for the CPU, so their batches are embedded one at a time
+    runs_locally = False
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+
+    @staticmethod
+    @abstractmethod
+    def name() -> str:
+        """
+        Short provider name, also used in embedding cache keys.
+        """
+        pass
+
+    @abstractmethod
+    def __call__(self, input: List[str]) -> List[np.ndarray]:
+        """
+        Embed texts.
+
+        :return: One float32 vector per text.
+        """
+        pass
+
+    @property
+    @abstractmethod
+    def dimension(self) -> int:
+        """
+        Length of the vectors this provider returns.
+        """
+        pass
+
+    def get_config(self) -> dict:
+        return {'model_name': self.model_name}
+
+    def describe(self, dimension=None) -> dict:
+        """
+        :param dimension: Length of vectors at hand, so the model need not be loaded (or called) to learn it.
+        :return: Collection metadata identifying the vector space.
+        """
+        return {
+            'embedding_provider': self.name(),
+            'embedding_model': self.model_name,
+            'embedding_dimension': dimension or self.dimension,
+        }
+
+
+class OpenAITextEmbeddingProvider(TextEmbeddingProvider):
+    """
+    OpenAI embeddings API. Every call is a network request.
+
+    text-embedding-3 models can return shortened vectors (`dimensions`), which keep most of their quality at a
+    fraction of the size.
+    """
+
+    DIMENSIONS = {
+        'text-embedding-3-large': 3072,
+        'text-embedding-3-small': 1536,
+        'text-embedding-ada-002': 1536,
+    }
+
+    def __init__(self, model_name=TEXT_EMBEDDING_OPENAI_MODEL, api_key=OPEN_AI_API_KEY,
+                 dimensions=TEXT_EMBEDDING_OPENAI_DIMENSIONS):
+        super().__init__(model_name)
+        self.api_key = api_key
+        self.dimensions = dimensions or None
+        self._embedding_function = None
+        self._dimension = self.dimensions or self.DIMENSIONS.get(model_name)
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def name() -> str:
+        # Same name as Chroma's OpenAI function, so chunks cached before providers existed are still found
+        return 'openai'
+
+    def __call__(self, input):
+        # Created on first use, so a local setup never needs an API key
+        with self._lock:
+            if self._embedding_function is None:
+                self._embedding_function = embedding_functions.OpenAIEmbeddingFunction(
+                    api_key=self.api_key,
+                    model_name=self.model_name,
+                    dimensions=self.dimensions
+                )
+        return [np.asarray(embedding, dtype=np.float32) for embedding in self._embedding_function(list(input))]
+
+    @property
+    def dimension(self):
+        if self._dimension is None:
+            self._dimension = len(self(['dimension'])[0])
+        return self._dimension
+
+    def get_config(self):
+        return {'model_name': self.model_name, 'dimensions': self.dimensions}
+
+
+class LocalTextEmbeddingProvider(TextEmbeddingProvider):
+    """
+    Sentence-embedding model run with ONNX Runtime on the CPU, so indexing and search need no network access and a
+    query costs one local forward pass.
+
+    `model_path` is a directory with model.onnx and tokenizer.json. Any BERT-style export works, including
+    int8-quantized ones: inputs the model does not declare (e.g. token_type_ids) are not fed. Without a model path,
+    Chroma's all-MiniLM-L6-v2 is used, downloaded once into Chroma's model cache.
+
+    Texts are truncated to `max_length` tokens, sorted by length and padded per batch of `batch_size`, so short
+    chunks do not pay for long ones. The model runs on `threads` threads, one batch at a time. Token vectors are
+    mean-pooled unless the model already outputs one vector per text; vectors are normalized.
+    """
+
+    runs_locally = True
+
+    def __init__(self, model_path=TEXT_EMBEDDING_LOCAL_MODEL_PATH, model_name=TEXT_EMBEDDING_LOCAL_MODEL_NAME,
+                 threads=TEXT_EMBEDDING_LOCAL_THREADS, batch_size=TEXT_EMBEDDING_LOCAL_BATCH_SIZE,
+                 max_length=TEXT_EMBEDDING_LOCAL_MAX_LENGTH):
+        super().__init__(model_name or os.path.basename(os.path.normpath(model_path)) or ONNXMiniLM_L6_V2.MODEL_NAME)
+        self.model_path = model_path
+        self.threads = max(1, threads)
+        self.batch_size = max(1, batch_size)
+        self.max_length = max_length
+        self._session = None
+        self._tokenizer = None
+        self._input_names = None
+        self._dimension = None
+        self._load_lock = threading.Lock()
+        self._run_lock = threading.Lock()
+
+    @staticmethod
+    def name() -> str:
+        return 'local'
+
+    def load(self):
+        if self._session is not None:
+            return
+        with self._load_lock:
+            if self._session is None:
+                import onnxruntime
+                from tokenizers import Tokenizer
+
+                model_path = self.model_path
+                if not model_path:
+                    default_model = ONNXMiniLM_L6_V2()
+                    default_model._download_model_if_not_exists()
+                    model_path = os.path.join(default_model.DOWNLOAD_PATH, default_model.EXTRACTED_FOLDER_NAME)
+                print(f"Loading text embedding model {self.model_name} from {model_path} on {self.threads} thread(s)")
+                started = time.monotonic()
+
+                tokenizer = Tokenizer.from_file(os.path.join(model_path, 'tokenizer.json'))
+                tokenizer.enable_truncation(max_length=self.max_length)
+                pad_id = tokenizer.token_to_id('[PAD]')
+                tokenizer.enable_padding(pad_id=pad_id or 0, pad_token='[PAD]')
+
+                options = onnxruntime.SessionOptions()
+                options.intra_op_num_threads = self.threads
+                options.inter_op_num_threads = 1
+                options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+                options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+                # Idle threads sleep instead of spinning, so the rest of the app gets the cores back between batches
+                options.add_session_config_entry('session.intra_op.allow_spinning', '0')
+                options.log_severity_level = 3
+                session = onnxruntime.InferenceSession(os.path.join(model_path, 'model.onnx'), sess_options=options,
+                                                       providers=['CPUExecutionProvider'])
+
+                self._tokenizer = tokenizer
+                self._input_names = {model_input.name for model_input in session.get_inputs()}
+                output_dimension = session.get_outputs()[0].shape[-1]
+                if isinstance(output_dimension, int):
+                    self._dimension = output_dimension
+                self._session = session
+                print(f"Text embedding model loaded in {time.monotonic() - started:.1f}s")
+
+    def __call__(self, input):
+        self.load()
+        input = list(input)
+        embeddings = [None] * len(input)
+        order = sorted(range(len(input)), key=lambda i: len(input[i]))
+        with self._run_lock:
+            for start in range(0, len(order), self.batch_size):
+                batch = order[start:start + self.batch_size]
+                for i, embedding in zip(batch, self._forward([input[i] for i in batch])):
+                    embeddings[i] = embedding
+        return embeddings
+
+    def _forward(self, texts):
+        encodings = self._tokenizer.encode_batch(texts)
+        input_ids = np.array([encoding.ids for encoding in encodings], dtype=np.int64)
+        attention_mask = np.array([encoding.attention_mask for encoding in encodings], dtype=np.int64)
+        feeds = {'input_ids': input_ids, 'attention_mask': attention_mask, 'token_type_ids': np.zeros_like(input_ids)}
+        output = self._session.run(None, {name: value for name, value in feeds.items() if name in self._input_names})[0]
+
+        if output.ndim == 3:
+            mask = attention_mask[:, :, np.newaxis].astype(np.float32)
+            output = (output * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        norms[norms == 0] = 1e-12
+        return list((output / norms).astype(np.float32))
+
+    @property
+    def dimension(self):
+        self.load()
+        if self._dimension is None:
+            self._dimension = len(self(['dimension'])[0])
+        return self._dimension
+
+
+TEXT_EMBEDDING_PROVIDERS = {
+    'openai': OpenAITextEmbeddingProvider,
+    'local': LocalTextEmbeddingProvider,
+}
+
+
+def get_text_embedding_provider(name=TEXT_EMBEDDING_PROVIDER) -> TextEmbeddingProvider:
+    if name not in TEXT_EMBEDDING_PROVIDERS:
+        raise ValueError(f"Unknown text embedding provider {name!r}, expected one of {list(TEXT_EMBEDDING_PROVIDERS)}")
+    return TEXT_EMBEDDING_PROVIDERS[name]()
+
+
+def check_collection(collection, provider: TextEmbeddingProvider, dimension=None):
+    """
+    Record which provider builds collection, or refuse a provider other than the one that built it.
+
+    Collections created before providers were recorded are checked against the length of a stored vector.
+
+    :param dimension: Length of the provider's vectors, from vectors it returned (see TextEmbeddingProvider.describe).
+    :raises ValueError: If collection holds vectors of another model or dimension.
+    """
+    expected = provider.describe(dimension)
+    metadata = collection.metadata or {}
+    if metadata.get('embedding_provider') is None:
+        stored = collection.get(limit=1, include=['embeddings'])['embeddings']
+        if stored is not None and len(stored) and len(stored[0]) != expected['embedding_dimension']:
+            raise ValueError(
+                f"Collection {collection.name} holds {len(stored[0])}-dimensional vectors, but "
+                f"{expected['embedding_provider']}/{expected['embedding_model']} returns "
+                f"{expected['embedding_dimension']}. Use another TEXT_COLLECTION_NAME for this provider."
+            )
+        collection.modify(metadata={**metadata, **expected})
+        return
+
+    recorded = {key: metadata.get(key) for key in expected}
+    if recorded != expected:
+        raise ValueError(
+            f"Collection {collection.name} was built with {recorded['embedding_provider']}/"
+            f"{recorded['embedding_model']} ({recorded['embedding_dimension']} dimensions), not "
+            f"{expected['embedding_provider']}/{expected['embedding_model']} ({expected['embedding_dimension']}). "
+            f"Switch TEXT_EMBEDDING_PROVIDER back, or use another TEXT_COLLECTION_NAME for this provider."
+        )
@@ -0,0 +1,997 @@
+"""
+Storage backends of the vector store.
+
+    python -m ingestor.vector_backends stats
+    python -m ingestor.vector_backends build-index --collection text_collection
+    python -m ingestor.vector_backends import-chroma
+    python -m ingestor.vector_backends recall --collection text_collection
+    python -m ingestor.vector_backends bench --records 40000 --dimension 1024
+
+`chroma` keeps collections in Chroma's persistent client. `numpy` keeps vectors in memory-mapped arrays, so opening
+the store reads no vectors and memory holds only the pages searches touch. `import-chroma` copies the Chroma
+collections into the NumPy backend without re-embedding anything. `recall` measures how many of the exact nearest
+neighbours the configured index and quantization find. `bench` runs the same measurement on synthetic vectors for
+several quantizations, without touching the store.
+"""
+import argparse
+import json
+import math
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+import chromadb
+import numpy as np
+
+from config.settings import (
+    VECTOR_STORE_BACKEND,
+    VECTOR_STORE_CHROMA_DIR,
+    VECTOR_STORE_NUMPY_DIR,
+    VECTOR_STORE_NUMPY_DTYPE,
+    VECTOR_STORE_NUMPY_INDEX,
+    VECTOR_STORE_NUMPY_IVF_MIN_ROWS,
+    VECTOR_STORE_NUMPY_IVF_LISTS,
+    VECTOR_STORE_NUMPY_IVF_PROBES,
+    VECTOR_STORE_NUMPY_SCAN_BYTES,
+    VECTOR_STORE_NUMPY_DIMENSIONS,
+    VECTOR_STORE_NUMPY_QUANTIZATION,
+    VECTOR_STORE_NUMPY_RESCORE_FACTOR,
+)
+
+DEFAULT_GET_INCLUDE = ['metadatas', 'documents']
+DEFAULT_QUERY_INCLUDE = ['metadatas', 'documents', 'distances']
+# SQLite caps the number of parameters of one statement
+LOOKUP_BATCH_SIZE = 500
+# Rows added to the arrays at least, whenever they grow
+MIN_GROWTH_ROWS = 1024
+KMEANS_ITERATIONS = 8
+KMEANS_SAMPLE_PER_LIST = 32
+KMEANS_MAX_SAMPLE = 50000
+IMPORT_BATCH_SIZE = 1000
+# Clusters of the synthetic vectors of `bench`, and how fast their values shrink along the dimensions
+BENCH_CLUSTERS = 400
+BENCH_DECAY_DIMENSIONS = 300
+QUANTIZATIONS = ('none', 'int8', 'binary')
+# Set bits of every byte value, for Hamming distances between packed sign bits
+POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+class VectorCollection(ABC):
+    """
+    The subset of Chroma's collection API the vector store uses. Embeddings are always computed by the caller.
+    """
+
+    name: str
+
+    @property
+    @abstractmethod
+    def metadata(self) -> Optional[dict]:
+        pass
+
+    @abstractmethod
+    def modify(self, metadata: dict) -> None:
+        """
+        Replace the collection's metadata.
+        """
+        pass
+
+    @abstractmethod
+    def upsert(self, ids, embeddings, documents=None, metadatas=None, uris=None) -> None:
+        """
+        Insert records, or overwrite the records that already exist under ids.
+        """
+        pass
+
+    @abstractmethod
+    def get(self, ids=None, include=DEFAULT_GET_INCLUDE, limit=None, offset=None) -> dict:
+        """
+        :return: Chroma-style dict of the requested fields for ids (or every record), skipping unknown ids.
+        """
+        pass
+
+    @abstractmethod
+    def update(self, ids, embeddings=None, documents=None, metadatas=None, uris=None) -> None:
+        """
+        Change fields of existing records. Metadata is merged into the stored metadata; a None value removes a key.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, ids) -> None:
+        pass
+
+    @abstractmethod
+    def query(self, query_embeddings, n_results=10, include=DEFAULT_QUERY_INCLUDE) -> dict:
+        """
+        :return: Chroma-style dict with one list per query of its n_results nearest records, nearest first.
+        """
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+
+class VectorBackend(ABC):
+    directory: str
+
+    @abstractmethod
+    def get_or_create_collection(self, name, embedding_function=None, data_loader=None):
+        """
+        :return: A VectorCollection (or a Chroma collection, which has the same methods).
+        """
+        pass
+
+    @abstractmethod
+    def list_collections(self) -> List[str]:
+        pass
+
+
+class ChromaBackend(VectorBackend):
+    """Chroma's persistent client: an HNSW index and a SQLite database per store, loaded by Chroma."""
+
+    def __init__(self, directory=VECTOR_STORE_CHROMA_DIR):
+        self.directory = directory
+        self.client = chromadb.PersistentClient(path=directory)
+
+    def get_or_create_collection(self, name, embedding_function=None, data_loader=None):
+        return self.client.get_or_create_collection(name=name, embedding_function=embedding_function,
+                                                    data_loader=data_loader)
+
+    def list_collections(self):
+        return [collection.name for collection in self.client.list_collections()]
+
+
+class NumpyBackend(VectorBackend):
+    """Collections of memory-mapped NumPy arrays, one directory each (see NumpyCollection)."""
+
+    def __init__(self, directory=VECTOR_STORE_NUMPY_DIR, dtype=VECTOR_STORE_NUMPY_DTYPE,
+                 index=VECTOR_STORE_NUMPY_INDEX, ivf_min_rows=VECTOR_STORE_NUMPY_IVF_MIN_ROWS,
+                 ivf_lists=VECTOR_STORE_NUMPY_IVF_LISTS, ivf_probes=VECTOR_STORE_NUMPY_IVF_PROBES,
+                 scan_bytes=VECTOR_STORE_NUMPY_SCAN_BYTES, dimensions=VECTOR_STORE_NUMPY_DIMENSIONS,
+                 quantization=VECTOR_STORE_NUMPY_QUANTIZATION, rescore_factor=VECTOR_STORE_NUMPY_RESCORE_FACTOR):
+        self.directory = directory
+        self.options = {'dtype': dtype, 'index': index, 'ivf_min_rows': ivf_min_rows, 'ivf_lists': ivf_lists,
+                        'ivf_probes': ivf_probes, 'scan_bytes': scan_bytes, 'dimensions': dimensions,
+                        'quantization': quantization, 'rescore_factor': rescore_factor}
+        self._collections = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def get_or_create_collection(self, name, embedding_function=None, data_loader=None):
+        # Vectors are computed by the caller, so the embedding function and data loader are not needed here
+        with self._lock:
+            if name not in self._collections:
+                self._collections[name] = NumpyCollection(os.path.join(self.directory, name), name, **self.options)
+            return self._collections[name]
+
+    def list_collections(self):
+        return sorted(
+            name for name in os.listdir(self.directory)
+            if os.path.exists(os.path.join(self.directory, name, NumpyCollection.RECORDS_FILE))
+        )
+
+
+class NumpyCollection(VectorCollection):
+    """
+    Collection kept in memory-mapped arrays, so opening it deserializes nothing and the OS pages vectors in on
+    demand.
+
+    `vectors.bin` holds one row per record (float16 or float32) and `norms.bin` its squared norm. Rows are addressed
+    by number and reused after deletes. Ids, documents, uris and metadata live in a SQLite sidecar and are only read
+    for the records a call returns.
+
+    Several processes can open the same collection. Writes hold an exclusive lock on `write.lock` in its directory
+    (where fcntl is available), and every call first picks up the rows, settings and file sizes other processes have
+    committed since, so no two of them hand out the same row.
+
+    Queries scan every row in blocks of about `scan_bytes`. Once the collection has `ivf_min_rows` records (and
+    `index` is 'ivf'), its rows are clustered into IVF lists and a query only scans the `ivf_probes` lists nearest
+    to it. The index is retrained whenever the collection has doubled since it was last trained. Distances follow
+    Chroma's l2 space (squared Euclidean), so results are ranked and scored the same by either backend.
+
+    Two settings trade recall for memory:
+    - `dimensions` keeps only the leading values of each vector, rescaled to its original length. Matryoshka-trained
+      models such as text-embedding-3 keep most of their quality that way. Fixed when the collection is created.
+    - `quantization` adds int8 codes (one byte per value, plus a scale per row) or binary codes (one bit per value)
+      in `codes.bin`. The first pass ranks `rescore_factor` times as many candidates on the codes; only those are
+      read from `vectors.bin` and rescored at full precision. Codes are rebuilt when the setting changes.
+    """
+
+    RECORDS_FILE = 'records.db'
+    LOCK_FILE = 'write.lock'
+
+    def __init__(self, path, name, dtype=VECTOR_STORE_NUMPY_DTYPE, index=VECTOR_STORE_NUMPY_INDEX,
+                 ivf_min_rows=VECTOR_STORE_NUMPY_IVF_MIN_ROWS, ivf_lists=VECTOR_STORE_NUMPY_IVF_LISTS,
+                 ivf_probes=VECTOR_STORE_NUMPY_IVF_PROBES, scan_bytes=VECTOR_STORE_NUMPY_SCAN_BYTES,
+                 dimensions=VECTOR_STORE_NUMPY_DIMENSIONS, quantization=VECTOR_STORE_NUMPY_QUANTIZATION,
+                 rescore_factor=VECTOR_STORE_NUMPY_RESCORE_FACTOR):
+        if quantization not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {quantization!r}, expected one of {list(QUANTIZATIONS)}")
+        self.path = path
+        self.name = name
+        self.index = index
+        self.ivf_min_rows = ivf_min_rows
+        self.ivf_lists = ivf_lists
+        self.ivf_probes = max(1, ivf_probes)
+        self.scan_bytes = scan_bytes
+        self.quantization = quantization
+        self.rescore_factor = max(1, rescore_factor)
+        self._lock = threading.RLock()
+        self._training = False
+        self._retrained_rows = set()
+        os.makedirs(path, exist_ok=True)
+        self._lock_file = open(self._file(self.LOCK_FILE), 'a')
+        self._write_depth = 0
+        self._data_version = None
+        self._conn = sqlite3.connect(os.path.join(path, self.RECORDS_FILE), timeout=30, check_same_thread=False)
+
+        with self._writing():
+            self.init_db()
+            self._settings = dict(self._conn.execute('SELECT key, value FROM settings').fetchall())
+            # The dtype and the number of stored dimensions are fixed when the collection is created
+            self.dtype = np.dtype(self._load_setting('dtype', dtype))
+            self.truncate_dimensions = self._load_setting('truncate_dimensions', dimensions)
+            self.dimension = self._load_setting('dimension', None)
+            self.stored_dimension = self._load_setting('stored_dimension', None) or self.dimension
+            self._vectors = self._norms = self._lists = self._centroids = self._codes = self._scales = None
+            self._capacity = 0
+            self.open_arrays()
+
+    def init_db(self):
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('''CREATE TABLE IF NOT EXISTS records (
+                                id TEXT PRIMARY KEY,
+                                row INTEGER NOT NULL UNIQUE,
+                                document TEXT,
+                                uri TEXT,
+                                metadata TEXT)''')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS settings (key TEXT PRIMARY KEY, value TEXT)')
+        self._conn.commit()
+
+    @contextmanager
+    def _writing(self):
+        """
+        Hold the collection for a write: the thread lock, and the directory's lock shared with other processes.
+        Nested calls only lock once.
+        """
+        with self._lock:
+            if self._write_depth == 0 and fcntl is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+            self._write_depth += 1
+            try:
+                self._refresh()
+                yield
+            finally:
+                self._write_depth -= 1
+                if self._write_depth == 0 and fcntl is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """Pick up the rows, settings and array files other processes have committed since the last call."""
+        with self._lock:
+            # data_version only changes on commits of other connections
+            version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+            if self._data_version is None or version == self._data_version:
+                self._data_version = version
+                return
+            self._data_version = version
+            trained_rows = self._settings.get('ivf_trained_rows')
+            self._settings = dict(self._conn.execute('SELECT key, value FROM settings').fetchall())
+            if self.dimension is None:
+                self.dimension = self._settings_value('dimension')
+                self.stored_dimension = self._settings_value('stored_dimension') or self.dimension
+            if self.dimension is not None and os.path.exists(self._file('vectors.bin')):
+                capacity = os.path.getsize(self._file('vectors.bin')) // (self.stored_dimension * self.dtype.itemsize)
+                if capacity > self._capacity or (self._lists is None and os.path.exists(self._file('lists.bin'))):
+                    self._capacity = max(capacity, self._capacity)
+                    self._extend_files(self._capacity)
+                    self._map_arrays()
+            self._load_rows()
+            # Another process retrained the IVF lists
+            if self._settings.get('ivf_trained_rows') != trained_rows and os.path.exists(self._file('centroids.npy')):
+                self._centroids = np.load(self._file('centroids.npy'))
+
+    def _load_rows(self):
+        """Rebuild the live-row mask and the free rows from the sidecar."""
+        rows = np.array([row for row, in self._conn.execute('SELECT row FROM records')], dtype=np.int64)
+        self._size = int(rows.max()) + 1 if len(rows) else 0
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._alive[rows] = True
+        self._free = [int(row) for row in np.flatnonzero(~self._alive[:self._size])[::-1]]
+
+    def _load_setting(self, key, default):
+        if key in self._settings:
+            return json.loads(self._settings[key])
+        if default is not None:
+            self._save_setting(key, default)
+        return default
+
+    def _save_setting(self, key, value):
+        self._settings[key] = json.dumps(value)
+        self._conn.execute('INSERT OR REPLACE INTO settings (key, value) VALUES (?, ?)', (key, self._settings[key]))
+        self._conn.commit()
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def open_arrays(self):
+        """Map the arrays and rebuild the live-row mask from the sidecar; no vector is read."""
+        recode = (self._settings_value('quantization') or 'none') != self.quantization
+        if recode:
+            for name in ('codes.bin', 'scales.bin'):
+                if os.path.exists(self._file(name)):
+                    os.remove(self._file(name))
+        if self.dimension is not None and os.path.exists(self._file('vectors.bin')):
+            row_bytes = self.stored_dimension * self.dtype.itemsize
+            self._capacity = os.path.getsize(self._file('vectors.bin')) // row_bytes
+            self._extend_files(self._capacity)
+            self._map_arrays()
+        self._load_rows()
+        if os.path.exists(self._file('centroids.npy')) and os.path.exists(self._file('lists.bin')):
+            self._centroids = np.load(self._file('centroids.npy'))
+        if recode:
+            if self._codes is not None:
+                print(f"Encoding the vectors of {self.name} for {self.quantization} quantization")
+                self._encode_rows(np.flatnonzero(self._alive[:self._size]))
+            self._save_setting('quantization', self.quantization)
+
+    def _code_width(self):
+        if self.quantization == 'int8':
+            return self.stored_dimension
+        return (self.stored_dimension + 7) // 8
+
+    def _array_files(self):
+        """
+        :return: (file name, bytes per row) of every array kept for this collection.
+        """
+        files = [('vectors.bin', self.stored_dimension * self.dtype.itemsize), ('norms.bin', 4)]
+        if self._lists is not None or os.path.exists(self._file('lists.bin')):
+            files.append(('lists.bin', 4))
+        if self.quantization != 'none':
+            files.append(('codes.bin', self._code_width()))
+        if self.quantization == 'int8':
+            files.append(('scales.bin', 4))
+        return files
+
+    def _extend_files(self, capacity):
+        # Extending the files keeps the rows in place, so nothing is copied
+        for name, row_bytes in self._array_files():
+            path = self._file(name)
+            if not os.path.exists(path) or os.path.getsize(path) < capacity * row_bytes:
+                with open(path, 'ab') as f:
+                    f.truncate(capacity * row_bytes)
+
+    def _map_arrays(self):
+        if self._capacity == 0:
+            return
+        self._vectors = np.memmap(self._file('vectors.bin'), dtype=self.dtype, mode='r+',
+                                  shape=(self._capacity, self.stored_dimension))
+        self._norms = np.memmap(self._file('norms.bin'), dtype=np.float32, mode='r+', shape=(self._capacity,))
+        if os.path.exists(self._file('lists.bin')):
+            self._lists = np.memmap(self._file('lists.bin'), dtype=np.int32, mode='r+', shape=(self._capacity,))
+        if self.quantization != 'none':
+            self._codes = np.memmap(self._file('codes.bin'), dtype=np.int8 if self.quantization == 'int8' else np.uint8,
+                                    mode='r+', shape=(self._capacity, self._code_width()))
+        if self.quantization == 'int8':
+            self._scales = np.memmap(self._file('scales.bin'), dtype=np.float32, mode='r+', shape=(self._capacity,))
+
+    def _grow(self, rows_needed):
+        if rows_needed <= self._capacity:
+            return
+        old_capacity = self._capacity
+        capacity = max(rows_needed, old_capacity * 2, MIN_GROWTH_ROWS)
+        self._extend_files(capacity)
+        self._capacity = capacity
+        self._map_arrays()
+        if self._lists is not None:
+            self._lists[old_capacity:] = -1
+        self._alive = np.concatenate([self._alive, np.zeros(capacity - old_capacity, dtype=bool)])
+
+    @property
+    def metadata(self):
+        return self._settings_value('metadata')
+
+    def _settings_value(self, key):
+        with self._lock:
+            return json.loads(self._settings[key]) if key in self._settings else None
+
+    def modify(self, metadata=None, name=None):
+        if name is not None and name != self.name:
+            raise ValueError("Renaming is not supported by the NumPy vector backend")
+        if metadata is not None:
+            with self._writing():
+                self._save_setting('metadata', metadata)
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM records').fetchone()[0]
+
+    def _check_embeddings(self, ids, embeddings):
+        embeddings = np.asarray(embeddings, dtype=np.float32)
+        if embeddings.ndim != 2 or len(embeddings) != len(ids):
+            raise ValueError(f"Expected one embedding per id for {len(ids)} id(s)")
+        if self.dimension is None:
+            self.dimension = embeddings.shape[1]
+            self.stored_dimension = min(self.truncate_dimensions or self.dimension, self.dimension)
+            self._save_setting('dimension', self.dimension)
+            self._save_setting('stored_dimension', self.stored_dimension)
+        return self._prepare(embeddings)
+
+    def _prepare(self, embeddings):
+        """
+        Bring embeddings (or queries) to the stored form: their leading stored_dimension values, rescaled to the
+        original length. Vectors already in that form, e.g. read back with get(), are kept as they are.
+        """
+        if embeddings.shape[1] == self.stored_dimension:
+            return embeddings
+        if embeddings.shape[1] != self.dimension:
+            raise ValueError(f"Collection {self.name} holds {self.dimension}-dimensional vectors, "
+                             f"got {embeddings.shape[1]}")
+        truncated = embeddings[:, :self.stored_dimension]
+        truncated_norms = np.linalg.norm(truncated, axis=1, keepdims=True)
+        truncated_norms[truncated_norms == 0] = 1
+        return truncated * (np.linalg.norm(embeddings, axis=1, keepdims=True) / truncated_norms)
+
+    def _encode(self, vectors):
+        """
+        :return: (codes, scales) of vectors; scales is None for binary codes.
+        """
+        if self.quantization == 'int8':
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            return np.round(vectors / scales[:, np.newaxis]).astype(np.int8), scales.astype(np.float32)
+        return np.packbits(vectors > 0, axis=1), None
+
+    def _encode_rows(self, rows):
+        block = self._block_rows()
+        for start in range(0, len(rows), block):
+            block_rows = rows[start:start + block]
+            codes, scales = self._encode(np.asarray(self._vectors[block_rows], dtype=np.float32))
+            self._codes[block_rows] = codes
+            if scales is not None:
+                self._scales[block_rows] = scales
+        self._codes.flush()
+        if self._scales is not None:
+            self._scales.flush()
+
+    def _get_rows(self, ids):
+        rows = {}
+        for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            batch = ids[i:i + LOOKUP_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            rows.update(self._conn.execute(f'SELECT id, row FROM records WHERE id IN ({placeholders})', batch))
+        return rows
+
+    def _write_vectors(self, rows, embeddings):
+        rows = np.asarray(rows, dtype=np.int64)
+        self._vectors[rows] = embeddings.astype(self.dtype)
+        self._norms[rows] = np.einsum('ij,ij->i', embeddings, embeddings)
+        if self._codes is not None:
+            codes, scales = self._encode(embeddings)
+            self._codes[rows] = codes
+            if scales is not None:
+                self._scales[rows] = scales
+            self._codes.flush()
+        if self._centroids is not None:
+            self._lists[rows] = self._nearest_centroids(embeddings, self._centroids)
+        if self._training:
+            self._retrained_rows.update(rows.tolist())
+        self._vectors.flush()
+        self._norms.flush()
+
+    def upsert(self, ids, embeddings, documents=None, metadatas=None, uris=None):
+        ids = list(ids)
+        if len(set(ids)) != len(ids):
+            raise ValueError("Duplicate ids in upsert")
+        if not ids:
+            return
+        with self._writing():
+            embeddings = self._check_embeddings(ids, embeddings)
+            existing = self._get_rows(ids)
+            rows = []
+            for item_id in ids:
+                row = existing.get(item_id)
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = self._size
+                        self._size += 1
+                rows.append(row)
+            self._grow(self._size)
+            # Vectors are written before the sidecar points at them
+            self._write_vectors(rows, embeddings)
+            self._conn.executemany(
+                'INSERT OR REPLACE INTO records (id, row, document, uri, metadata) VALUES (?, ?, ?, ?, ?)',
+                [
+                    (item_id, row, documents[i] if documents else None, uris[i] if uris else None,
+                     json.dumps(metadatas[i], ensure_ascii=False) if metadatas and metadatas[i] is not None else None)
+                    for i, (item_id, row) in enumerate(zip(ids, rows))
+                ]
+            )
+            self._conn.commit()
+            self._alive[rows] = True
+        if self.needs_index():
+            self.build_index()
+
+    def update(self, ids, embeddings=None, documents=None, metadatas=None, uris=None):
+        ids = list(ids)
+        with self._writing():
+            records = {record[0]: record for record in self._get_records(ids)}
+            known = [i for i, item_id in enumerate(ids) if item_id in records]
+            if embeddings is not None:
+                embeddings = self._check_embeddings(ids, embeddings)
+                self._write_vectors([records[ids[i]][1] for i in known], embeddings[known])
+            updates = []
+            for i in known:
+                item_id, row, document, uri, metadata = records[ids[i]]
+                if metadatas is not None and metadatas[i] is not None:
+                    metadata = {**(metadata or {}), **metadatas[i]}
+                    metadata = {key: value for key, value in metadata.items() if value is not None}
+                document = documents[i] if documents is not None else document
+                uri = uris[i] if uris is not None else uri
+                updates.append((document, uri, json.dumps(metadata, ensure_ascii=False) if metadata else None,
+                                item_id))
+            self._conn.executemany('UPDATE records SET document = ?, uri = ?, metadata = ? WHERE id = ?', updates)
+            self._conn.commit()
+
+    def delete(self, ids):
+        ids = list(ids)
+        with self._writing():
+            rows = list(self._get_rows(ids).values())
+            if not rows:
+                return
+            # Rows leave the searches before the sidecar forgets them
+            self._alive[rows] = False
+            self._conn.executemany('DELETE FROM records WHERE id = ?', [(item_id,) for item_id in ids])
+            self._conn.commit()
+            self._free.extend(rows)
+
+    def _get_records(self, ids=None, rows=None, limit=None, offset=None):
+        """
+        :return: (id, row, document, uri, metadata) tuples, in the order of ids or rows when given.
+        """
+        if ids is None and rows is None:
+            records = self._conn.execute('SELECT id, row, document, uri, metadata FROM records ORDER BY row '
+                                         'LIMIT ? OFFSET ?', (-1 if limit is None else limit, offset or 0))
+            return [self._parse_record(record) for record in records]
+
+        column, keys = ('id', list(dict.fromkeys(ids))) if ids is not None else ('row', [int(row) for row in rows])
+        found = {}
+        for i in range(0, len(keys), LOOKUP_BATCH_SIZE):
+            batch = keys[i:i + LOOKUP_BATCH_SIZE]
+            placeholders = ','.join('?' * len(batch))
+            for record in self._conn.execute(f'SELECT id, row, document, uri, metadata FROM records '
+                                             f'WHERE {column} IN ({placeholders})', batch):
+                found[record[0] if column == 'id' else record[1]] = self._parse_record(record)
+        records = [found[key] for key in keys if key in found]
+        return records[offset or 0:][:limit] if limit is not None or offset else records
+
+    @staticmethod
+    def _parse_record(record):
+        item_id, row, document, uri, metadata = record
+        return item_id, row, document, uri, json.loads(metadata) if metadata else None
+
+    def _fields(self, records, include):
+        result = {'ids': [record[0] for record in records], 'included': list(include)}
+        result['embeddings'] = (
+            np.asarray(self._vectors[[record[1] for record in records]], dtype=np.float32).reshape(
+                len(records), self.stored_dimension or 0)
+            if 'embeddings' in include and self._vectors is not None else None
+        )
+        result['documents'] = [record[2] for record in records] if 'documents' in include else None
+        result['uris'] = [record[3] for record in records] if 'uris' in include else None
+        result['metadatas'] = [record[4] for record in records] if 'metadatas' in include else None
+        return result
+
+    def get(self, ids=None, include=DEFAULT_GET_INCLUDE, limit=None, offset=None):
+        with self._lock:
+            self._refresh()
+            records = self._get_records(ids=list(ids) if ids is not None else None, limit=limit, offset=offset)
+            return self._fields(records, include)
+
+    def query(self, query_embeddings, n_results=10, include=DEFAULT_QUERY_INCLUDE):
+        queries = np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32))
+        if self.dimension is not None:
+            queries = self._prepare(queries)
+        matches = self._nearest(self._snapshot(), queries, n_results)
+
+        result = {key: [] for key in ('ids', 'embeddings', 'documents', 'uris', 'metadatas', 'distances')}
+        with self._lock:
+            for rows, distances in matches:
+                # A record deleted during the search is dropped from its results
+                records = self._get_records(rows=rows)
+                kept = {record[1] for record in records}
+                fields = self._fields(records, include)
+                for key in ('ids', 'embeddings', 'documents', 'uris', 'metadatas'):
+                    result[key].append(fields[key])
+                result['distances'].append([float(distance) for row, distance in zip(rows, distances)
+                                            if row in kept])
+        for key in ('embeddings', 'documents', 'uris', 'metadatas', 'distances'):
+            if key not in include:
+                result[key] = None
+        result['included'] = list(include)
+        return result
+
+    def _snapshot(self):
+        # Later writes only add rows or change rows in place, so searches run on these arrays without the lock
+        with self._lock:
+            self._refresh()
+            return {'vectors': self._vectors, 'norms': self._norms, 'codes': self._codes, 'scales': self._scales,
+                    'lists': self._lists, 'alive': self._alive, 'size': self._size, 'centroids': self._centroids}
+
+    def _nearest(self, snapshot, queries, k, exact=False):
+        """
+        :param exact: Scan every row at full precision, ignoring the IVF lists and the quantized codes.
+        :return: (rows, distances) per query, nearest first.
+        """
+        if snapshot['vectors'] is None or snapshot['size'] == 0:
+            return [([], []) for _ in queries]
+        quantized = not exact and snapshot['codes'] is not None
+        # The quantized pass only picks candidates; the best of them are rescored at full precision
+        first_k = k * self.rescore_factor if quantized else k
+        centroids = None if exact else snapshot['centroids']
+        if centroids is None:
+            matches = self._scan(snapshot, queries, first_k, quantized)
+        else:
+            matches = []
+            lists, alive, size = snapshot['lists'], snapshot['alive'], snapshot['size']
+            probes = np.argsort(self._centroid_distances(queries, centroids), axis=1)[:, :self.ivf_probes]
+            for query, query_probes in zip(queries, probes):
+                # The extra last entry stays False, so unassigned rows (list -1) are never candidates
+                probed = np.zeros(len(centroids) + 1, dtype=bool)
+                probed[query_probes] = True
+                candidates = np.flatnonzero(probed[lists[:size]] & alive[:size])
+                matches.extend(self._scan(snapshot, query[np.newaxis], first_k, quantized,
+                                          rows=candidates if len(candidates) >= first_k else None))
+        if quantized:
+            matches = [
+                self._scan(snapshot, query[np.newaxis], k, quantized=False,
+                           rows=np.sort(np.asarray(rows, dtype=np.int64)))[0]
+                for query, (rows, _) in zip(queries, matches)
+            ]
+        return matches
+
+    def _block_rows(self):
+        return max(1, self.scan_bytes // (self.stored_dimension * 4))
+
+    def _scan(self, snapshot, queries, k, quantized, rows=None):
+        """
+        Search rows[:size], or the given rows, in blocks of bounded memory.
+
+        :param quantized: Rank on the quantized codes instead of the full-precision vectors.
+        :return: (rows, distances) per query, nearest first.
+        """
+        alive = snapshot['alive']
+        best_distances = np.zeros((len(queries), 0), dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        query_norms = np.einsum('ij,ij->i', queries, queries)
+        total = snapshot['size'] if rows is None else len(rows)
+        block = self._block_rows()
+        for start in range(0, total, block):
+            stop = min(start + block, total)
+            block_rows = np.arange(start, stop) if rows is None else rows[start:stop]
+            index = slice(start, stop) if rows is None else block_rows
+            mask = alive[index]
+            if not mask.any():
+                continue
+            distances = self._block_distances(snapshot, index, queries, query_norms, quantized)
+            distances[:, ~mask] = np.inf
+            best_distances = np.concatenate([best_distances, distances], axis=1)
+            best_rows = np.concatenate([best_rows, np.broadcast_to(block_rows, distances.shape)], axis=1)
+            if best_distances.shape[1] > k:
+                top = np.argpartition(best_distances, k - 1, axis=1)[:, :k]
+                best_distances = np.take_along_axis(best_distances, top, axis=1)
+                best_rows = np.take_along_axis(best_rows, top, axis=1)
+
+        order = np.argsort(best_distances, axis=1)
+        best_distances = np.take_along_axis(best_distances, order, axis=1)
+        best_rows = np.take_along_axis(best_rows, order, axis=1)
+        matches = []
+        for query_rows, query_distances in zip(best_rows, best_distances):
+            found = np.isfinite(query_distances)
+            matches.append((query_rows[found].tolist(), query_distances[found].tolist()))
+        return matches
+
+    def _block_distances(self, snapshot, index, queries, query_norms, quantized):
+        """
+        :return: (queries, rows) distances; squared Euclidean, or Hamming distances for binary codes.
+        """
+        if quantized and self.quantization == 'binary':
+            codes = snapshot['codes'][index]
+            return np.stack([
+                POPCOUNT[np.bitwise_xor(codes, query_bits)].sum(axis=1, dtype=np.int32)
+                for query_bits in np.packbits(queries > 0, axis=1)
+            ]).astype(np.float32)
+        if quantized:
+            dots = (queries @ np.asarray(snapshot['codes'][index], dtype=np.float32).T) * snapshot['scales'][index]
+        else:
+            dots = queries @ np.asarray(snapshot['vectors'][index], dtype=np.float32).T
+        return np.maximum(snapshot['norms'][index][np.newaxis, :] - 2 * dots + query_norms[:, np.newaxis], 0)
+
+    @staticmethod
+    def _centroid_distances(vectors, centroids):
+        return (np.einsum('ij,ij->i', centroids, centroids)[np.newaxis, :]
+                - 2 * np.asarray(vectors, dtype=np.float32) @ centroids.T)
+
+    def _nearest_centroids(self, vectors, centroids):
+        nearest = np.empty(len(vectors), dtype=np.int32)
+        block = self._block_rows()
+        for start in range(0, len(vectors), block):
+            nearest[start:start + block] = np.argmin(
+                self._centroid_distances(vectors[start:start + block], centroids), axis=1)
+        return nearest
+
+    def needs_index(self):
+        """IVF lists are (re)trained once the collection reaches ivf_min_rows and whenever it doubles."""
+        if self.index != 'ivf' or self._training:
+            return False
+        alive = int(self._alive.sum())
+        trained_rows = self._settings_value('ivf_trained_rows') or 0
+        return alive >= max(1, self.ivf_min_rows) and alive >= 2 * trained_rows
+
+    def build_index(self, lists=None):
+        """
+        Cluster the rows into IVF lists with k-means. Writes may continue meanwhile; rows written during training
+        are assigned once it ends.
+
+        :return: Number of lists.
+        """
+        with self._lock:
+            self._refresh()
+            if self._training:
+                return 0
+            self._training = True
+            self._retrained_rows = set()
+            rows = np.flatnonzero(self._alive[:self._size])
+            vectors = self._vectors
+        try:
+            if len(rows) == 0:
+                return 0
+            lists = min(len(rows), lists or self.ivf_lists or max(1, round(math.sqrt(len(rows)))))
+            print(f"Training {lists} IVF lists over {len(rows)} vectors of {self.name}")
+            rng = np.random.default_rng(0)
+            sample_size = min(len(rows), max(lists, min(lists * KMEANS_SAMPLE_PER_LIST, KMEANS_MAX_SAMPLE)))
+            sample = np.asarray(vectors[np.sort(rng.choice(rows, sample_size, replace=False))], dtype=np.float32)
+            centroids = sample[rng.choice(len(sample), lists, replace=False)].copy()
+            for _ in range(KMEANS_ITERATIONS):
+                assignment = self._nearest_centroids(sample, centroids)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                counts = np.bincount(assignment, minlength=lists)
+                filled = counts > 0
+                centroids[filled] = sums[filled] / counts[filled, np.newaxis]
+                # Empty lists restart from random sample vectors
+                centroids[~filled] = sample[rng.choice(len(sample), int((~filled).sum()))]
+
+            assignment = np.empty(len(rows), dtype=np.int32)
+            block = self._block_rows()
+            for start in range(0, len(rows), block):
+                block_rows = rows[start:start + block]
+                assignment[start:start + block] = self._nearest_centroids(
+                    np.asarray(vectors[block_rows], dtype=np.float32), centroids)
+
+            with self._writing():
+                if self._lists is None:
+                    with open(self._file('lists.bin'), 'ab') as f:
+                        f.truncate(self._capacity * 4)
+                    self._lists = np.memmap(self._file('lists.bin'), dtype=np.int32, mode='r+',
+                                            shape=(self._capacity,))
+                self._lists[:] = -1
+                self._lists[rows] = assignment
+                # Rows rewritten during training, and rows other processes added meanwhile
+                retrained = np.union1d(np.array(sorted(self._retrained_rows), dtype=np.int64),
+                                       np.setdiff1d(np.flatnonzero(self._alive[:self._size]), rows))
+                if len(retrained):
+                    self._lists[retrained] = self._nearest_centroids(
+                        np.asarray(self._vectors[retrained], dtype=np.float32), centroids)
+                self._lists.flush()
+                # Other processes may load the centroids at any time, so they never see a partly written file
+                np.save(self._file('centroids.tmp.npy'), centroids)
+                os.replace(self._file('centroids.tmp.npy'), self._file('centroids.npy'))
+                self._centroids = centroids
+                self._save_setting('ivf_trained_rows', len(rows))
+            return lists
+        finally:
+            with self._lock:
+                self._training = False
+
+    def stats(self):
+        with self._lock:
+            files = [self._file(name) for name in ('vectors.bin', 'norms.bin', 'lists.bin', 'codes.bin', 'scales.bin',
+                                                   'centroids.npy', self.RECORDS_FILE)]
+            return {
+                'name': self.name, 'records': self.count(), 'dimension': self.dimension,
+                'stored_dimension': self.stored_dimension, 'dtype': self.dtype.name,
+                'quantization': self.quantization, 'capacity_rows': self._capacity,
+                'bytes': sum(os.path.getsize(path) for path in files if os.path.exists(path)),
+                'ivf_lists': len(self._centroids) if self._centroids is not None else 0,
+                'ivf_trained_rows': self._settings_value('ivf_trained_rows') or 0,
+            }
+
+    def recall_report(self, queries=100, k=10):
+        """
+        Compare the configured search (IVF lists, quantized first pass and rescoring) with an exact scan of the
+        full-precision vectors, using stored vectors picked at random as queries.
+
+        :return: Dict with recall@k, the mean latency of both searches and the bytes per vector each one reads.
+        """
+        snapshot = self._snapshot()
+        rows = np.flatnonzero(snapshot['alive'][:snapshot['size']])
+        report = {
+            'collection': self.name, 'records': len(rows), 'queries': min(queries, len(rows)), 'k': k,
+            'dimension': self.dimension, 'stored_dimension': self.stored_dimension, 'dtype': self.dtype.name,
+            'quantization': self.quantization, 'rescore_factor': self.rescore_factor,
+            'ivf_lists': len(snapshot['centroids']) if snapshot['centroids'] is not None else 0,
+            'ivf_probes': self.ivf_probes,
+        }
+        if not len(rows):
+            return report
+        sample = np.sort(np.random.default_rng(0).choice(rows, report['queries'], replace=False))
+        query_vectors = np.asarray(snapshot['vectors'][sample], dtype=np.float32)
+
+        found, timings = {}, {}
+        for mode, exact in (('approximate', False), ('exact', True)):
+            started = time.perf_counter()
+            found[mode] = [self._nearest(snapshot, query[np.newaxis], k, exact=exact)[0][0] for query in query_vectors]
+            timings[mode] = (time.perf_counter() - started) / len(query_vectors) * 1000
+        report['recall'] = float(np.mean([
+            len(set(approximate) & set(exact)) / max(1, len(exact))
+            for approximate, exact in zip(found['approximate'], found['exact'])
+        ]))
+        report['approximate_ms'] = round(timings['approximate'], 3)
+        report['exact_ms'] = round(timings['exact'], 3)
+        report['full_bytes_per_vector'] = self.stored_dimension * self.dtype.itemsize
+        report['first_pass_bytes_per_vector'] = (
+            self._code_width() + (4 if self.quantization == 'int8' else 0) if self.quantization != 'none'
+            else report['full_bytes_per_vector']
+        )
+        return report
+
+
+VECTOR_BACKENDS = {
+    'chroma': ChromaBackend,
+    'numpy': NumpyBackend,
+}
+
+
+def get_vector_backend(name=VECTOR_STORE_BACKEND) -> VectorBackend:
+    if name not in VECTOR_BACKENDS:
+        raise ValueError(f"Unknown vector store backend {name!r}, expected one of {list(VECTOR_BACKENDS)}")
+    return VECTOR_BACKENDS[name]()
+
+
+def import_chroma(chroma_backend, numpy_backend):
+    """
+    Copy every Chroma collection, vectors included, into the NumPy backend.
+
+    :return: Number of records copied per collection.
+    """
+    copied = {}
+    for name in chroma_backend.list_collections():
+        source = chroma_backend.get_or_create_collection(name)
+        target = numpy_backend.get_or_create_collection(name)
+        copied[name] = 0
+        offset = 0
+        while True:
+            records = source.get(include=['embeddings', 'documents', 'metadatas', 'uris'], limit=IMPORT_BATCH_SIZE,
+                                 offset=offset)
+            if not records['ids']:
+                break
+            target.upsert(ids=records['ids'], embeddings=records['embeddings'], documents=records['documents'],
+                          metadatas=records['metadatas'], uris=records['uris'])
+            copied[name] += len(records['ids'])
+            offset += len(records['ids'])
+        if source.metadata:
+            target.modify(metadata=source.metadata)
+    return copied
+
+
+def synthetic_vectors(records, dimension, seed=0):
+    """
+    Unit vectors drawn around random cluster centres. Their values shrink along the dimensions, like those of
+    Matryoshka-trained models, so truncating them keeps most of the neighbourhood.
+    """
+    rng = np.random.default_rng(seed)
+    decay = np.exp(-np.arange(dimension) / BENCH_DECAY_DIMENSIONS).astype(np.float32)
+    centres = rng.normal(size=(BENCH_CLUSTERS, dimension)).astype(np.float32) * decay
+    vectors = centres[rng.integers(0, BENCH_CLUSTERS, records)]
+    vectors += 0.5 * rng.normal(size=(records, dimension)).astype(np.float32) * decay
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def benchmark(records=40000, dimension=1024, quantizations=QUANTIZATIONS, rescore_factors=(4,), dimensions=0,
+              dtype=VECTOR_STORE_NUMPY_DTYPE, index='exact', queries=50, k=10, seed=0):
+    """
+    Recall and latency of every quantization and rescore factor on the same synthetic vectors (see recall_report),
+    in collections created in a temporary directory.
+
+    :return: One recall report per (quantization, rescore factor).
+    """
+    vectors = synthetic_vectors(records, dimension, seed=seed)
+    reports = []
+    with tempfile.TemporaryDirectory() as directory:
+        for quantization in quantizations:
+            collection = NumpyCollection(os.path.join(directory, quantization), 'bench', dtype=dtype, index=index,
+                                         dimensions=dimensions, quantization=quantization)
+            for start in range(0, records, IMPORT_BATCH_SIZE):
+                stop = min(start + IMPORT_BATCH_SIZE, records)
+                collection.upsert(ids=[str(i) for i in range(start, stop)], embeddings=vectors[start:stop])
+            if index == 'ivf':
+                # Trained now whatever the size, as `build-index` would
+                collection.build_index()
+            for rescore_factor in rescore_factors if quantization != 'none' else rescore_factors[:1]:
+                collection.rescore_factor = rescore_factor
+                reports.append(collection.recall_report(queries=queries, k=k))
+    return reports
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or maintain the NumPy vector backend.")
+    parser.add_argument('--dir', default=VECTOR_STORE_NUMPY_DIR, help="NumPy backend directory")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    subparsers.add_parser('stats', help="Show the size of every collection")
+    index_parser = subparsers.add_parser('build-index', help="Train the IVF lists of a collection now")
+    index_parser.add_argument('--collection', required=True)
+    index_parser.add_argument('--lists', type=int, default=None, help="Number of lists (default: sqrt of rows)")
+    import_parser = subparsers.add_parser('import-chroma', help="Copy the Chroma collections into this backend")
+    import_parser.add_argument('--chroma-dir', default=VECTOR_STORE_CHROMA_DIR)
+    recall_parser = subparsers.add_parser('recall', help="Measure recall against an exact full-precision search")
+    recall_parser.add_argument('--collection', required=True)
+    recall_parser.add_argument('--queries', type=int, default=100, help="Stored vectors used as queries")
+    recall_parser.add_argument('-k', type=int, default=10)
+    recall_parser.add_argument('--probes', type=int, default=None, help="IVF lists scanned per query")
+    recall_parser.add_argument('--rescore-factor', type=int, default=None,
+                               help="Candidates rescored at full precision, as a multiple of k")
+    bench_parser = subparsers.add_parser('bench', help="Measure recall and latency on synthetic vectors")
+    bench_parser.add_argument('--records', type=int, default=40000)
+    bench_parser.add_argument('--dimension', type=int, default=1024)
+    bench_parser.add_argument('--quantization', nargs='+', choices=QUANTIZATIONS, default=list(QUANTIZATIONS))
+    bench_parser.add_argument('--rescore-factor', type=int, nargs='+', default=[4, 10])
+    bench_parser.add_argument('--dimensions', type=int, default=0, help="Leading dimensions kept (0: all)")
+    bench_parser.add_argument('--dtype', default=VECTOR_STORE_NUMPY_DTYPE)
+    bench_parser.add_argument('--index', default='exact', help="'exact', or 'ivf' to add IVF lists")
+    bench_parser.add_argument('--queries', type=int, default=50)
+    bench_parser.add_argument('-k', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.command == 'bench':
+        reports = benchmark(records=args.records, dimension=args.dimension, quantizations=args.quantization,
+                            rescore_factors=args.rescore_factor, dimensions=args.dimensions, dtype=args.dtype,
+                            index=args.index, queries=args.queries, k=args.k)
+        print(json.dumps(reports, indent=2))
+        return
+
+    backend = NumpyBackend(directory=args.dir)
+    if args.command == 'stats':
+        stats = [backend.get_or_create_collection(name).stats() for name in backend.list_collections()]
+        print(json.dumps(stats, indent=2))
+    elif args.command == 'build-index':
+        print(f"Trained {backend.get_or_create_collection(args.collection).build_index(args.lists)} list(s)")
+    elif args.command == 'import-chroma':
+        copied = import_chroma(ChromaBackend(directory=args.chroma_dir), backend)
+        for name, count in copied.items():
+            print(f"Copied {count} record(s) of {name}")
+    elif args.command == 'recall':
+        collection = backend.get_or_create_collection(args.collection)
+        # Probes and rescoring only apply at query time, so other values can be tried without rebuilding anything
+        if args.probes:
+            collection.ivf_probes = args.probes
+        if args.rescore_factor:
+            collection.rescore_factor = args.rescore_factor
+        print(json.dumps(collection.recall_report(queries=args.queries, k=args.k), indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,32 +1,104 @@
-import chromadb
+import hashlib
+import re
 import sqlite3
-from chromadb.utils.embedding_functions import OpenCLIPEmbeddingFunction
+import threading
+import uuid
 from chromadb.utils.data_loaders import ImageLoader
-import chromadb.utils.embedding_functions as embedding_functions
 
-from config.settings import OPEN_AI_API_KEY
-
-openai_ef = embedding_functions.OpenAIEmbeddingFunction(
-    api_key=OPEN_AI_API_KEY,
-    model_name="text-embedding-3-large"
+from config.settings import (
+    IMAGE_EMBED_BATCH_SIZE,
+    IMAGE_EMBED_MAX_IN_FLIGHT,
+    IMAGE_EMBED_BATCH_LINGER_SECONDS,
+    QUERY_EMBEDDING_CACHE_ENABLED,
+    CHUNK_EMBEDDING_CACHE_ENABLED,
+    CHUNK_EMBEDDING_CACHE_PATH,
+    CHUNK_EMBEDDING_CACHE_MAX_BYTES,
+    TEXT_COLLECTION_NAME,
+    SEARCH_MODE,
+    SEARCH_HYBRID_CANDIDATES,
+    SEARCH_RRF_K,
 )
+from data_loaders.image_loaders import load_thumbnail, submit_thumbnail
+from data_loaders.ocr_cache import get_content_hash
+from ingestor.batch_writer import EmbeddingBatcher, EmbeddingInputError, wait_for_embeddings
+from ingestor.clip_embeddings import check_clip_collection, get_clip_embedding_function
+from ingestor.embedding_cache import EmbeddingCache, get_model_key
+from ingestor.text_embeddings import check_collection, get_text_embedding_provider
+from ingestor.vector_backends import get_vector_backend
+from utils.metrics import metrics
+
+SEARCH_MODES = ('vector', 'keyword', 'hybrid')
+# SQLite caps the number of parameters of one statement
+LOOKUP_BATCH_SIZE = 500
+
+def get_chunk_hash(content):
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get_chunk_locator(metadata):
+    """Where a chunk sits inside its source: the page for documents, the record type otherwise."""
+    if metadata.get('page_number') is not None:
+        return str(metadata['page_number'])
+    return str(metadata.get('type', '')).lower()
+
+
+def make_chunk_id(source, locator, chunk_hash):
+    """Deterministic id so re-indexing the same chunk of the same source overwrites instead of duplicating."""
+    return hashlib.sha1(f"{source}\x00{locator}\x00{chunk_hash}".encode('utf-8')).hexdigest()
+
+
+def make_match_query(query):
+    """
+    Turn a free-text query into an FTS5 query matching any of its words. Each word is quoted, so operators and
+    punctuation in queries are taken literally, and identifiers like INV-2024-001 must match as a whole.
+    """
+    words = [word for word in query.split() if re.search(r'\w', word)]
+    return ' OR '.join(dict.fromkeys('"' + word.replace('"', '""') + '"' for word in words))
 
 
 class VectorStore:
-    def __init__(self, db_path="source_ids.db"):
-        # Initialize Chroma client
-        self.directory = "./vector_store"
-        self.client = chromadb.PersistentClient(path=self.directory)
+    def __init__(self, db_path="source_ids.db", text_embedding_function=None,
+                 text_collection_name=TEXT_COLLECTION_NAME):
+        # Chroma or memory-mapped NumPy arrays, per VECTOR_STORE_BACKEND
+        self.client = get_vector_backend()
+        self.directory = self.client.directory
 
-        # Set up the text collection
+        # Set up the text collection. Vectors are always passed in, so Chroma never calls the embedding function
+        self.text_embedding_function = text_embedding_function or get_text_embedding_provider()
         self.text_collection = self.client.get_or_create_collection(
-            name="text_collection",
-            embedding_function=openai_ef,
+            name=text_collection_name,
+            embedding_function=None,
         )
+        # Checked against the first vectors the provider returns, so startup loads and calls no model
+        self._text_collection_checked = False
+        self._check_lock = threading.Lock()
+        # Shared by every writer so chunks from different files go out in the same embedding requests
+        if self.text_embedding_function.runs_locally:
+            # One forward pass at a time: the model already uses every thread it is given
+            self.text_batcher = EmbeddingBatcher(self.text_embedding_function,
+                                                 max_items=self.text_embedding_function.batch_size, max_in_flight=1)
+        else:
+            self.text_batcher = EmbeddingBatcher(self.text_embedding_function)
+        # Chunks embedded before (copies, restores, metadata-only edits, rebuilt collections) are not sent again
+        self.chunk_cache = EmbeddingCache(
+            path=CHUNK_EMBEDDING_CACHE_PATH,
+            max_bytes=CHUNK_EMBEDDING_CACHE_MAX_BYTES,
+            memory_items=0,
+            name='chunk',
+        ) if CHUNK_EMBEDDING_CACHE_ENABLED else None
 
-        # Initialize embedding function and data loader for multimodal data
-        self.clip_embedding_function = OpenCLIPEmbeddingFunction()
+        # CLIP is loaded on first use, in this process or in the shared model worker (CLIP_SERVER_ADDRESS)
+        self.clip_embedding_function = get_clip_embedding_function()
         self.image_loader = ImageLoader()
+        # Images are decoded to thumbnails in a process pool and embedded in batched CLIP forward passes
+        self.image_batcher = EmbeddingBatcher(
+            self.embed_thumbnails,
+            max_items=IMAGE_EMBED_BATCH_SIZE,
+            max_in_flight=IMAGE_EMBED_MAX_IN_FLIGHT,
+            linger=IMAGE_EMBED_BATCH_LINGER_SECONDS,
+            token_counter=None,
+            kind='image',
+        )
 
         # Create or get a multimodal collection for images, now to be used for both text and images
         self.multimodal_collection = self.client.get_or_create_collection(
@@ -34,78 +106,369 @@ class VectorStore:
             embedding_function=self.clip_embedding_function,
             data_loader=self.image_loader
         )
+        check_clip_collection(self.multimodal_collection, self.clip_embedding_function)
+
+        # Repeated queries skip the text embedding request or the CLIP forward pass
+        self.query_cache = EmbeddingCache() if QUERY_EMBEDDING_CACHE_ENABLED else None
 
         # Initialize the SQLite database to store source-ids mapping
         self.db_path = db_path
         self.init_db()
+        self.backfill_keyword_index()
 
     def init_db(self):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('''CREATE TABLE IF NOT EXISTS source_ids (
-                            source TEXT PRIMARY KEY,
-                            ids TEXT)''')
+        # One row per (source, id) so large sources can gain or lose chunks without rewriting their whole id list
+        cursor.execute('''CREATE TABLE IF NOT EXISTS source_chunk_ids (
+                            source TEXT NOT NULL,
+                            id TEXT NOT NULL,
+                            PRIMARY KEY (source, id)) WITHOUT ROWID''')
+        cursor.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'source_ids'")
+        if cursor.fetchone():
+            # Migrate the comma-separated mapping used by earlier versions
+            for source, ids in cursor.execute('SELECT source, ids FROM source_ids').fetchall():
+                cursor.executemany('INSERT OR IGNORE INTO source_chunk_ids (source, id) VALUES (?, ?)',
+                                   [(source, chunk_id) for chunk_id in (ids or '').split(',') if chunk_id])
+            cursor.execute('DROP TABLE source_ids')
+
+        # Keyword index of the text collection: chunk_fts indexes the documents of chunk_text, kept in sync by triggers
+        cursor.execute('''CREATE TABLE IF NOT EXISTS chunk_text (
+                            rowid INTEGER PRIMARY KEY,
+                            id TEXT NOT NULL UNIQUE,
+                            source TEXT,
+                            document TEXT NOT NULL)''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_chunk_text_source ON chunk_text (source)')
+        cursor.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS chunk_fts USING fts5(
+                            document, content='chunk_text', content_rowid='rowid',
+                            tokenize='unicode61 remove_diacritics 2')''')
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS chunk_text_insert AFTER INSERT ON chunk_text BEGIN
+                            INSERT INTO chunk_fts (rowid, document) VALUES (new.rowid, new.document);
+                          END''')
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS chunk_text_delete AFTER DELETE ON chunk_text BEGIN
+                            INSERT INTO chunk_fts (chunk_fts, rowid, document)
+                            VALUES ('delete', old.rowid, old.document);
+                          END''')
+        cursor.execute('''CREATE TRIGGER IF NOT EXISTS chunk_text_update AFTER UPDATE OF document ON chunk_text
+                          BEGIN
+                            INSERT INTO chunk_fts (chunk_fts, rowid, document)
+                            VALUES ('delete', old.rowid, old.document);
+                            INSERT INTO chunk_fts (rowid, document) VALUES (new.rowid, new.document);
+                          END''')
+        conn.commit()
+        conn.close()
+
+    def backfill_keyword_index(self):
+        """Index the chunks of a text collection built before the keyword index existed."""
+        conn = sqlite3.connect(self.db_path)
+        try:
+            if conn.execute('SELECT 1 FROM chunk_text LIMIT 1').fetchone() or not self.text_collection.count():
+                return
+            print(f"Building the keyword index of {self.text_collection.count()} text chunk(s)")
+            offset = 0
+            while True:
+                records = self.text_collection.get(include=['documents', 'metadatas'], limit=LOOKUP_BATCH_SIZE,
+                                                   offset=offset)
+                if not records['ids']:
+                    break
+                self.add_keyword_rows(conn, [
+                    (chunk_id, (metadata or {}).get('source'), document)
+                    for chunk_id, document, metadata in zip(records['ids'], records['documents'], records['metadatas'])
+                ])
+                offset += len(records['ids'])
+            conn.commit()
+        finally:
+            conn.close()
+
+    @staticmethod
+    def add_keyword_rows(conn, rows):
+        """
+        :param rows: (id, source, document) of text chunks; chunks without a document are skipped.
+        """
+        conn.executemany('''INSERT INTO chunk_text (id, source, document) VALUES (?, ?, ?)
+                              ON CONFLICT (id) DO UPDATE SET source = excluded.source, document = excluded.document''',
+                         [row for row in rows if row[2] is not None])
+
+    def remove_keyword_rows(self, ids):
+        conn = sqlite3.connect(self.db_path)
+        for i in range(0, len(ids), LOOKUP_BATCH_SIZE):
+            batch = ids[i:i + LOOKUP_BATCH_SIZE]
+            conn.execute(f"DELETE FROM chunk_text WHERE id IN ({','.join('?' * len(batch))})", batch)
         conn.commit()
         conn.close()
 
     def update_db(self, source, ids):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('INSERT OR REPLACE INTO source_ids (source, ids) VALUES (?, ?)', (source, ','.join(ids)))
+        cursor.execute('DELETE FROM source_chunk_ids WHERE source = ?', (source,))
+        cursor.executemany('INSERT OR IGNORE INTO source_chunk_ids (source, id) VALUES (?, ?)',
+                           [(source, chunk_id) for chunk_id in ids])
+        conn.commit()
+        conn.close()
+
+    def add_ids_to_db(self, source, ids):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany('INSERT OR IGNORE INTO source_chunk_ids (source, id) VALUES (?, ?)',
+                           [(source, chunk_id) for chunk_id in ids])
+        conn.commit()
+        conn.close()
+
+    def remove_ids_from_db(self, source, ids):
+        conn = sqlite3.connect(self.db_path)
+        cursor = conn.cursor()
+        cursor.executemany('DELETE FROM source_chunk_ids WHERE source = ? AND id = ?',
+                           [(source, chunk_id) for chunk_id in ids])
         conn.commit()
         conn.close()
 
     def get_ids_by_source(self, source):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('SELECT ids FROM source_ids WHERE source = ?', (source,))
-        row = cursor.fetchone()
+        cursor.execute('SELECT id FROM source_chunk_ids WHERE source = ?', (source,))
+        rows = cursor.fetchall()
         conn.close()
-        return row[0].split(',') if row else []
+        return [row[0] for row in rows]
 
     def delete_source_from_db(self, source):
         conn = sqlite3.connect(self.db_path)
         cursor = conn.cursor()
-        cursor.execute('DELETE FROM source_ids WHERE source = ?', (source,))
+        cursor.execute('DELETE FROM source_chunk_ids WHERE source = ?', (source,))
         conn.commit()
         conn.close()
 
-    def multimodal_index(self, ids, contents=None, image_uris=None, metadatas=None):
+    def embed_texts(self, contents):
+        """
+        Embed contents through the chunk cache and, for the misses, the shared batcher.
+
+        :return: (embeddings, errors) aligned with contents; failed items have embedding None and an error.
+        """
+        if self.chunk_cache is None:
+            return self.text_batcher.embed(contents)
+
+        provider, model = get_model_key(self.text_embedding_function)
+        keys = [EmbeddingCache.make_key(provider, model, get_chunk_hash(content)) for content in contents]
+        cached = self.chunk_cache.get_many(keys)
+        missing = {}
+        for key, content in zip(keys, contents):
+            if key not in cached and key not in missing:
+                missing[key] = content
+
+        errors_by_key = {}
+        if missing:
+            embeddings, errors = self.text_batcher.embed(list(missing.values()))
+            computed = {key: embedding for key, embedding in zip(missing, embeddings) if embedding is not None}
+            self.chunk_cache.put_many(provider, model, computed)
+            cached.update(computed)
+            errors_by_key = {key: error for key, error in zip(missing, errors) if error is not None}
+        return [cached.get(key) for key in keys], [errors_by_key.get(key) for key in keys]
+
+    def submit_images(self, image_uris):
+        """
+        Start decoding images and queue them for embedding without waiting for either.
+
+        :return: One Future per image, resolving to its embedding or raising the error it failed with.
+        """
+        return self.image_batcher.submit([submit_thumbnail(uri) for uri in image_uris])
+
+    def embed_images(self, image_uris):
+        """
+        :return: (embeddings, errors) aligned with image_uris, like embed_texts.
+        """
+        return wait_for_embeddings(self.submit_images(image_uris))
+
+    def embed_thumbnails(self, thumbnails):
+        # Waits for the decodes of one batch; the next batch keeps decoding meanwhile
+        images = []
+        for thumbnail in thumbnails:
+            try:
+                images.append(thumbnail.result())
+            except Exception as e:
+                # An unreadable image fails only itself: the batcher bisects the batch to find it
+                raise EmbeddingInputError(str(e)) from e
+        return self.clip_embedding_function(images)
+
+    def multimodal_index(self, ids, contents=None, image_uris=None, metadatas=None,
+                         embeddings=None, image_embeddings=None):
+        """
+        Index text contents and/or images under ids.
+
+        :return: Per-item report [{'id': ..., 'error': None | str}]; only items without an error were indexed.
+        """
+        with metrics.timer('vector_index_seconds'):
+            report = self._multimodal_index(ids, contents, image_uris, metadatas, embeddings, image_embeddings)
+        failed = sum(1 for item in report if item['error'])
+        metrics.inc('vector_items_indexed_total', len(report) - failed)
+        if failed:
+            metrics.inc('vector_index_errors_total', failed)
+        return report
+
+    def _multimodal_index(self, ids, contents, image_uris, metadatas, embeddings, image_embeddings):
+        report = [{'id': item_id, 'error': None} for item_id in ids]
         if contents is not None:
-            self.text_collection.add(
-                ids=ids,
-                documents=contents,
-                metadatas=metadatas
-            )
+            if embeddings is None:
+                embeddings, errors = self.embed_texts(contents)
+                for item, error in zip(report, errors):
+                    if error is not None:
+                        item['error'] = str(error)
+            indexed = [i for i, embedding in enumerate(embeddings) if embedding is not None]
+            for i, embedding in enumerate(embeddings):
+                if embedding is None and report[i]['error'] is None:
+                    report[i]['error'] = 'embedding failed'
+            if indexed:
+                self.check_text_collection(embeddings[indexed[0]])
+                self.map_ids([ids[i] for i in indexed], [metadatas[i] for i in indexed] if metadatas else None,
+                             contents=[contents[i] for i in indexed])
+                self.text_collection.upsert(
+                    ids=[ids[i] for i in indexed],
+                    documents=[contents[i] for i in indexed],
+                    embeddings=[embeddings[i] for i in indexed],
+                    metadatas=[metadatas[i] for i in indexed] if metadatas else None
+                )
 
         if image_uris is not None:
-            images = self.image_loader(image_uris)
-            embeddings = self.clip_embedding_function(images)
-            self.multimodal_collection.add(
-                ids=ids,
-                embeddings=embeddings,
-                uris=image_uris,
-                metadatas=metadatas if metadatas else [{'source': uri} for uri in image_uris]
+            if image_embeddings is None:
+                image_embeddings, errors = self.embed_images(image_uris)
+                for item, error in zip(report, errors):
+                    if error is not None:
+                        item['error'] = str(error)
+            metadatas = metadatas if metadatas else [{'source': uri} for uri in image_uris]
+            indexed = [i for i, embedding in enumerate(image_embeddings) if embedding is not None]
+            for i, embedding in enumerate(image_embeddings):
+                if embedding is None and report[i]['error'] is None:
+                    report[i]['error'] = 'embedding failed'
+            if indexed:
+                self.map_ids([ids[i] for i in indexed], [metadatas[i] for i in indexed])
+                self.multimodal_collection.upsert(
+                    ids=[ids[i] for i in indexed],
+                    embeddings=[image_embeddings[i] for i in indexed],
+                    uris=[image_uris[i] for i in indexed],
+                    metadatas=[metadatas[i] for i in indexed]
+                )
+        return report
+
+    def map_ids(self, ids, metadatas, contents=None):
+        """
+        Record ids under their metadata source and, for text chunks, index contents for keyword search, in one
+        transaction. This runs before the vectors are written, so after a crash every vector that may exist is still
+        reachable from its source and gets overwritten or cleaned up on retry.
+        """
+        sources = [(metadata or {}).get('source') for metadata in metadatas] if metadatas else [None] * len(ids)
+        conn = sqlite3.connect(self.db_path)
+        conn.executemany('INSERT OR IGNORE INTO source_chunk_ids (source, id) VALUES (?, ?)',
+                         [(source, item_id) for item_id, source in zip(ids, sources) if source])
+        if contents is not None:
+            self.add_keyword_rows(conn, list(zip(ids, sources, contents)))
+        conn.commit()
+        conn.close()
+
+    def embed_queries(self, embedding_function, queries, keys=None, prepare=None):
+        """Embed search queries through the query cache (see EmbeddingCache.embed)."""
+        if self.query_cache is None:
+            return embedding_function(prepare(queries) if prepare else queries)
+        return self.query_cache.embed(embedding_function, queries, keys=keys, prepare=prepare)
+
+    def embed_text_queries(self, queries):
+        embeddings = self.embed_queries(self.text_embedding_function, queries)
+        if len(embeddings):
+            self.check_text_collection(embeddings[0])
+        return embeddings
+
+    def check_text_collection(self, embedding):
+        """
+        Record or verify the text collection's provider (see check_collection) the first time its vectors are
+        written or searched, using the length of one of them.
+
+        :raises ValueError: If the collection holds vectors of another model or dimension.
+        """
+        if self._text_collection_checked:
+            return
+        with self._check_lock:
+            if not self._text_collection_checked:
+                check_collection(self.text_collection, self.text_embedding_function, dimension=len(embedding))
+                self._text_collection_checked = True
+
+    def search_text(self, queries, top_k=2, mode=SEARCH_MODE):
+        """
+        :param mode: 'vector' ranks chunks by embedding distance, 'keyword' by BM25 over the keyword index without
+            embedding the queries, and 'hybrid' fuses both rankings with reciprocal-rank fusion.
+        :return: Chroma query results. Keyword and hybrid results carry `scores` (higher is better) and
+            `keyword_matches` (whether the keyword index matched the chunk); hybrid results also keep the `distances`
+            of chunks the vector search found, None for chunks only matched by keywords.
+        """
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Unknown search mode {mode!r}, expected one of {list(SEARCH_MODES)}")
+        if mode == 'vector':
+            return self.text_collection.query(
+                query_embeddings=self.embed_text_queries(queries),
+                n_results=top_k,
             )
 
-        # Update the source-ids mapping in the SQLite database
-        if metadatas:
-            for metadata in metadatas:
-                source = metadata.get('source')
-                if source:
-                    existing_ids = self.get_ids_by_source(source)
-                    new_ids = list(set(existing_ids + ids))  # Ensure IDs are unique
-                    self.update_db(source, new_ids)
-
-    def search_text(self, queries, top_k=2):
-        results = self.text_collection.query(
-            query_texts=queries,
-            n_results=top_k,
-        )
+        candidates = max(top_k, SEARCH_HYBRID_CANDIDATES) if mode == 'hybrid' else top_k
+        rankings = [[self.keyword_search(query, candidates)] for query in queries]
+        vector_distances = [{} for _ in queries]
+        if mode == 'hybrid':
+            vector_results = self.text_collection.query(
+                query_embeddings=self.embed_text_queries(queries),
+                n_results=candidates,
+                include=['distances'],
+            )
+            for ranking, distances, vector_ids, vector_ranking in zip(rankings, vector_distances, vector_results['ids'],
+                                                                       vector_results['distances']):
+                ranking.append(list(zip(vector_ids, vector_ranking)))
+                distances.update(ranking[-1])
+
+        ranked_per_query = []
+        for ranking in rankings:
+            if mode == 'keyword':
+                # BM25 ranks best first with the most negative score
+                ranked_per_query.append([(chunk_id, -score) for chunk_id, score in ranking[0]])
+                continue
+            fused = {}
+            for ranked_ids in ranking:
+                for rank, (chunk_id, _) in enumerate(ranked_ids, start=1):
+                    fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (SEARCH_RRF_K + rank)
+            ranked_per_query.append(sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k])
+
+        found_ids = list(dict.fromkeys(chunk_id for ranked in ranked_per_query for chunk_id, _ in ranked))
+        by_id = {}
+        if found_ids:
+            records = self.text_collection.get(ids=found_ids, include=['documents', 'metadatas'])
+            by_id = {chunk_id: (document, metadata) for chunk_id, document, metadata
+                     in zip(records['ids'], records['documents'], records['metadatas'])}
+
+        results = {'ids': [], 'documents': [], 'metadatas': [], 'scores': [], 'keyword_matches': []}
+        if mode == 'hybrid':
+            results['distances'] = []
+        for ranking, ranked, distances in zip(rankings, ranked_per_query, vector_distances):
+            keyword_ids = {chunk_id for chunk_id, _ in ranking[0]}
+            # Chunks whose vectors were never written (an interrupted indexing run) are left out
+            ranked = [(chunk_id, score) for chunk_id, score in ranked if chunk_id in by_id]
+            results['ids'].append([chunk_id for chunk_id, _ in ranked])
+            results['documents'].append([by_id[chunk_id][0] for chunk_id, _ in ranked])
+            results['metadatas'].append([by_id[chunk_id][1] for chunk_id, _ in ranked])
+            results['scores'].append([score for _, score in ranked])
+            results['keyword_matches'].append([chunk_id in keyword_ids for chunk_id, _ in ranked])
+            if mode == 'hybrid':
+                results['distances'].append([distances.get(chunk_id) for chunk_id, _ in ranked])
         return results
 
+    def keyword_search(self, query, top_k):
+        """
+        :return: Up to top_k (id, bm25 score) of the chunks matching any word of query, best first.
+        """
+        match_query = make_match_query(query)
+        if not match_query:
+            return []
+        conn = sqlite3.connect(self.db_path)
+        rows = conn.execute('''SELECT chunk_text.id, bm25(chunk_fts) AS score FROM chunk_fts
+                               JOIN chunk_text ON chunk_text.rowid = chunk_fts.rowid
+                               WHERE chunk_fts MATCH ? ORDER BY score LIMIT ?''', (match_query, top_k)).fetchall()
+        conn.close()
+        return rows
+
     def search_text_to_image(self, queries, top_k=2):
-        embeddings = self.clip_embedding_function(queries)
+        embeddings = self.embed_queries(self.clip_embedding_function, queries)
         results = self.multimodal_collection.query(
             query_embeddings=embeddings,
             n_results=top_k,
@@ -113,8 +476,14 @@ class VectorStore:
         return results
 
     def image_to_image(self, queries, top_k=2):
-        images = self.image_loader(queries)
-        embeddings = self.clip_embedding_function(images)
+        # Query images are cached by content, and only decoded when their embedding is not cached
+        provider, model = get_model_key(self.clip_embedding_function)
+        keys = []
+        for query in queries:
+            with open(query, 'rb') as f:
+                keys.append(EmbeddingCache.make_key(provider, model, f"image:{get_content_hash(f.read())}"))
+        embeddings = self.embed_queries(self.clip_embedding_function, queries, keys=keys,
+                                        prepare=lambda paths: [load_thumbnail(path) for path in paths])
         results = self.multimodal_collection.query(
             query_embeddings=embeddings,
             n_results=top_k
@@ -124,28 +493,98 @@ class VectorStore:
     def delete_by_source(self, source):
         ids = self.get_ids_by_source(source)
         if ids:
-            self.text_collection.delete(where={"id": {"$in": ids}})
-            self.multimodal_collection.delete(where={"id": {"$in": ids}})
+            self.text_collection.delete(ids=ids)
+            self.multimodal_collection.delete(ids=ids)
+            self.remove_keyword_rows(ids)
             self.delete_source_from_db(source)
 
+    def get_chunk_keys(self, source):
+        """
+        Map (locator, chunk_hash) of every text chunk indexed for source to its id.
+        """
+        ids = self.get_ids_by_source(source)
+        if not ids:
+            return {}
+        records = self.text_collection.get(ids=ids, include=['metadatas'])
+        return {
+            (get_chunk_locator(metadata), metadata['chunk_hash']): chunk_id
+            for chunk_id, metadata in zip(records['ids'], records['metadatas'])
+            if metadata and metadata.get('chunk_hash')
+        }
+
+    def delete_ids(self, source, ids):
+        if not ids:
+            return
+        self.text_collection.delete(ids=ids)
+        self.multimodal_collection.delete(ids=ids)
+        self.remove_keyword_rows(ids)
+        self.remove_ids_from_db(source, ids)
+
     def update_source(self, old_source, new_source):
-        ids = self.get_ids_by_source(old_source)
-        if ids:
-            # Update source in text collection
-            self.text_collection.update(
-                ids=ids,
-                metadatas=[{"source": new_source} for _ in ids]
-            )
+        """
+        Move the records of old_source to new_source.
+
+        Chunk ids are derived from the source (see make_chunk_id), so the records are re-keyed under new_source's ids
+        instead of being relabeled in place. Kept under old_source's ids, they would be overwritten by the next file
+        indexed at old_source, and deleting old_source would delete them.
+        """
+        if self.copy_source(old_source, new_source):
+            self.delete_by_source(old_source)
+
+    def copy_source(self, source, new_source):
+        """
+        Index new_source with the vectors already stored for source (same content hash), without re-embedding.
+
+        The records are copied rather than mapped to the second source: a record's metadata holds a single `source`,
+        which search results cite and filter on, and its id is derived from that source. Mapping one record to two
+        paths would cite only one of them, and deleting either file would take the other's vectors along. A copy
+        costs storage, not OCR or embedding calls.
+
+        :return: The ids created for new_source, empty if nothing is stored for source.
+        """
+        ids = self.get_ids_by_source(source)
+        if not ids:
+            return []
 
-            # Update source in multimodal collection
-            self.multimodal_collection.update(
-                ids=ids,
-                metadatas=[{"source": new_source} for _ in ids]
+        # Text and image records of one file share ids, so both collections use the same mapping
+        id_map = {}
+        new_ids = []
+        keyword_rows = []
+        for collection in (self.text_collection, self.multimodal_collection):
+            records = collection.get(ids=ids, include=['embeddings', 'documents', 'metadatas', 'uris'])
+            if not records['ids']:
+                continue
+            for old_id, metadata in zip(records['ids'], records['metadatas']):
+                if old_id in id_map:
+                    continue
+                metadata = metadata or {}
+                if metadata.get('chunk_hash'):
+                    id_map[old_id] = make_chunk_id(new_source, get_chunk_locator(metadata), metadata['chunk_hash'])
+                else:
+                    id_map[old_id] = str(uuid.uuid4())
+            has_documents = any(document is not None for document in records['documents'])
+            has_uris = any(uri is not None for uri in records['uris'] or [])
+            collection.upsert(
+                ids=[id_map[old_id] for old_id in records['ids']],
+                embeddings=records['embeddings'],
+                documents=records['documents'] if has_documents else None,
+                uris=[new_source for _ in records['ids']] if has_uris else None,
+                metadatas=[{**(metadata or {}), 'source': new_source} for metadata in records['metadatas']]
             )
+            new_ids.extend(id_map[old_id] for old_id in records['ids'])
+            if collection is self.text_collection:
+                keyword_rows = [(id_map[old_id], new_source, document)
+                                for old_id, document in zip(records['ids'], records['documents'])]
 
-            # Update the source-ids mapping in the SQLite database
-            self.delete_source_from_db(old_source)
-            self.update_db(new_source, ids)
+        new_ids = list(dict.fromkeys(new_ids))
+        if new_ids:
+            self.update_db(new_source, new_ids)
+        if keyword_rows:
+            conn = sqlite3.connect(self.db_path)
+            self.add_keyword_rows(conn, keyword_rows)
+            conn.commit()
+            conn.close()
+        return new_ids
 
 # img_loader = ImageLoader()
 # image = img_loader(uris=['/Users/rohanverma/PycharmProjects/NoteAI/working/img1.jpeg'])
@@ -1,13 +1,24 @@
 from ingestor.ingestor import DirectoryIngestor
 from ingestor.link_generator import FileHandler, Normalizer, MarkdownParser
+from ingestor.scheduler import BackgroundIngestionService
 from ingestor.vector_store import VectorStore
+from config.settings import METRICS_EXPORT_PATH, METRICS_EXPORT_INTERVAL_SECONDS, METRICS_HTTP_PORT
 from todo_manager.db import init_db
+from utils.metrics import start_metrics_exporter, start_metrics_server
 
 default_vector_store = VectorStore()
 ingestor = DirectoryIngestor(default_vector_store)
+# Directories are ingested in the background so the chat can use whatever is already indexed
+ingestion_service = BackgroundIngestionService(ingestor)
 # Initialize database
 init_db()
 
+# Publish ingestion metrics for tools outside the app
+if METRICS_EXPORT_PATH:
+    start_metrics_exporter(METRICS_EXPORT_PATH, METRICS_EXPORT_INTERVAL_SECONDS)
+if METRICS_HTTP_PORT:
+    start_metrics_server(METRICS_HTTP_PORT)
+
 # Initialize the classes
 file_handler = FileHandler()
 normalizer = Normalizer()
@@ -0,0 +1,92 @@
+from concurrent.futures import Future
+
+import pytest
+from sqlalchemy import create_engine, event
+
+from ingestor.vector_store import get_chunk_locator
+
+
+class FakeVectorStore:
+    """In-memory stand-in for VectorStore: chunks are kept as id -> {'source', 'content', 'metadata'}."""
+
+    def __init__(self):
+        self.chunks = {}
+        self.images = {}
+        self.embedded = []
+
+    def sources(self):
+        return {chunk['source'] for chunk in self.chunks.values()}
+
+    def contents(self, source):
+        return sorted(chunk['content'] for chunk in self.chunks.values() if chunk['source'] == source)
+
+    def embed_texts(self, contents):
+        self.embedded.extend(contents)
+        return [[float(len(content))] for content in contents], [None] * len(contents)
+
+    def submit_images(self, image_uris):
+        futures = [Future() for _ in image_uris]
+        for future in futures:
+            future.set_result([1.0])
+        return futures
+
+    def multimodal_index(self, ids, contents=None, image_uris=None, metadatas=None,
+                         embeddings=None, image_embeddings=None):
+        records = self.chunks if contents is not None else self.images
+        for i, chunk_id in enumerate(ids):
+            metadata = dict(metadatas[i]) if metadatas else {}
+            records[chunk_id] = {'source': metadata.get('source'), 'metadata': metadata,
+                                 'content': contents[i] if contents is not None else image_uris[i]}
+        return [{'id': chunk_id, 'error': None} for chunk_id in ids]
+
+    def get_ids_by_source(self, source):
+        return [chunk_id for records in (self.chunks, self.images)
+                for chunk_id, chunk in records.items() if chunk['source'] == source]
+
+    def get_chunk_keys(self, source):
+        return {
+            (get_chunk_locator(chunk['metadata']), chunk['metadata']['chunk_hash']): chunk_id
+            for chunk_id, chunk in self.chunks.items()
+            if chunk['source'] == source and chunk['metadata'].get('chunk_hash')
+        }
+
+    def delete_ids(self, source, ids):
+        for chunk_id in ids:
+            self.chunks.pop(chunk_id, None)
+            self.images.pop(chunk_id, None)
+
+    def delete_by_source(self, source):
+        self.delete_ids(source, self.get_ids_by_source(source))
+
+    def copy_source(self, source, new_source):
+        new_ids = []
+        for records in (self.chunks, self.images):
+            for chunk_id, chunk in list(records.items()):
+                if chunk['source'] == source:
+                    new_id = f'{new_source}:{chunk_id}'
+                    records[new_id] = {**chunk, 'source': new_source,
+                                       'metadata': {**chunk['metadata'], 'source': new_source}}
+                    new_ids.append(new_id)
+        return new_ids
+
+    def update_source(self, old_source, new_source):
+        if self.copy_source(old_source, new_source):
+            self.delete_by_source(old_source)
+
+
+@pytest.fixture
+def ingestor(tmp_path, monkeypatch):
+    """DirectoryIngestor over a FakeVectorStore, with its catalog in tmp_path."""
+    # Imported here: todo_manager.db creates the catalog in the working directory when it is imported
+    monkeypatch.chdir(tmp_path)
+    from todo_manager import db
+    from ingestor.ingestor import DirectoryIngestor
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'file_manager.db'}",
+                           connect_args={'check_same_thread': False, 'timeout': 30})
+    event.listen(engine, 'connect', db.set_sqlite_pragma)
+    monkeypatch.setattr(db, 'engine', engine)
+    ingestor = DirectoryIngestor(FakeVectorStore())
+    yield ingestor
+    ingestor.stop_all_watchers()
+    engine.dispose()
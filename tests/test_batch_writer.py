@@ -0,0 +1,68 @@
+import pytest
+
+from ingestor.batch_writer import EmbeddingBatcher, EmbeddingInputError
+
+
+class StatusError(Exception):
+    """Error of an HTTP API client, which carries the response's status code like OpenAI's errors do."""
+
+    def __init__(self, status_code):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+class RecordingFunction:
+    """Embeds each input as [len(input)], failing every batch that contains `bad` with `error`."""
+
+    def __init__(self, error=None, bad='bad'):
+        self.error = error
+        self.bad = bad
+        self.batches = []
+
+    def __call__(self, inputs):
+        self.batches.append(list(inputs))
+        if self.error is not None and (self.bad is None or self.bad in inputs):
+            raise self.error
+        return [[float(len(item))] for item in inputs]
+
+
+def make_batcher(embedding_function, **kwargs):
+    return EmbeddingBatcher(embedding_function, max_items=64, max_in_flight=1, linger=0.01, token_counter=None,
+                            **kwargs)
+
+
+@pytest.mark.parametrize('error', [StatusError(400), EmbeddingInputError("CLIP model worker rejected the inputs"),
+                                   ValueError("bad input")])
+def test_input_error_fails_only_the_bad_input(error):
+    function = RecordingFunction(error)
+    inputs = [f'item{i}' for i in range(63)] + ['bad']
+    embeddings, errors = make_batcher(function).embed(inputs)
+
+    assert errors[-1] is error
+    assert embeddings[-1] is None
+    assert errors[:-1] == [None] * 63
+    assert embeddings[:-1] == [[float(len(item))] for item in inputs[:-1]]
+    # One full batch, then two halves per level down to the bad input
+    assert len(function.batches) == 1 + 2 * 6
+
+
+@pytest.mark.parametrize('error', [StatusError(429), StatusError(408), StatusError(500), TimeoutError("timed out"),
+                                   ConnectionError("refused"), OSError("worker unreachable"),
+                                   RuntimeError("CLIP model worker failed: CUDA out of memory")])
+def test_other_errors_fail_the_whole_batch_at_once(error):
+    function = RecordingFunction(error, bad=None)
+    embeddings, errors = make_batcher(function).embed([f'item{i}' for i in range(64)])
+
+    assert len(function.batches) == 1
+    assert embeddings == [None] * 64
+    assert all(item_error is error for item_error in errors)
+
+
+def test_batches_are_bounded_by_tokens():
+    function = RecordingFunction()
+    batcher = EmbeddingBatcher(function, max_items=64, max_tokens=10, max_in_flight=1, linger=0.01,
+                               token_counter=len)
+    embeddings, errors = batcher.embed(['aaaa', 'bbbb', 'cccc', 'dddddddddddddddd', 'ee'])
+
+    assert errors == [None] * 5
+    assert [len(batch) for batch in function.batches] == [2, 1, 1, 1]
@@ -0,0 +1,103 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+
+@pytest.fixture
+def hashed(ingestor, monkeypatch):
+    """Paths the ingestor reads to hash, in order."""
+    hashed = []
+    get_file_hash = ingestor.get_file_hash
+    monkeypatch.setattr(ingestor, 'get_file_hash', lambda path: hashed.append(path) or get_file_hash(path))
+    return hashed
+
+
+def ingest(ingestor, path):
+    return ingestor.process_job(ingestor.new_job(path))
+
+
+def test_new_file_is_hashed_once(ingestor, hashed, tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('some text')
+
+    ingest(ingestor, str(path))
+
+    assert hashed == [str(path)]
+    record = ingestor.get_file_record(str(path))
+    stat = os.stat(path)
+    assert (record['size'], record['mtime_ns'], record['inode']) == (stat.st_size, stat.st_mtime_ns, stat.st_ino)
+
+
+def test_unchanged_file_is_not_read(ingestor, hashed, tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('some text')
+    ingest(ingestor, str(path))
+    hashed.clear()
+
+    assert ingestor.detect_change(str(path)) is None
+    assert hashed == []
+
+
+def test_touched_file_is_hashed_but_not_reingested(ingestor, hashed, tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('some text')
+    ingest(ingestor, str(path))
+    embedded = list(ingestor.vector_store.embedded)
+    os.utime(path, ns=(0, 10 ** 18))
+
+    assert ingest(ingestor, str(path)) is None
+    assert ingestor.vector_store.embedded == embedded
+    # The new stat is recorded, so the next check reads nothing
+    assert ingestor.get_file_record(str(path))['mtime_ns'] == 10 ** 18
+    hashed.clear()
+    assert ingestor.detect_change(str(path)) is None
+    assert hashed == []
+
+
+def test_modified_file_is_detected(ingestor, tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('some text')
+    ingest(ingestor, str(path))
+    path.write_text('other text, longer')
+
+    file_stat, file_hash = ingestor.detect_change(str(path))
+
+    assert file_stat['size'] == len('other text, longer')
+    assert file_hash == ingestor.get_file_hash(str(path))
+
+
+def test_hash_is_streamed_in_chunks(ingestor, tmp_path, monkeypatch):
+    reads = []
+
+    class RecordingFile(io.BytesIO):
+        def read(self, size=-1):
+            reads.append(size)
+            return super().read(size)
+
+    monkeypatch.setattr('ingestor.ingestor.HASH_CHUNK_SIZE', 4)
+    monkeypatch.setattr('ingestor.ingestor.open', lambda path, mode: RecordingFile(b'0123456789'), raising=False)
+
+    assert ingestor.get_file_hash('a.bin') == hashlib.md5(b'0123456789').hexdigest()
+    assert reads == [4, 4, 4, 4]
+
+
+def test_scan_yields_only_changed_files(ingestor, tmp_path):
+    root = tmp_path / 'root'
+    (root / 'sub').mkdir(parents=True)
+    unchanged, modified, new = root / 'unchanged.txt', root / 'sub' / 'modified.txt', root / 'new.txt'
+    unchanged.write_text('unchanged')
+    modified.write_text('before')
+    for path in (unchanged, modified):
+        ingest(ingestor, str(path))
+    modified.write_text('after the edit')
+    new.write_text('new')
+    (root / 'ignored.bin').write_bytes(b'\x00')
+
+    existing_files = set()
+    changed = dict(ingestor.iter_changed_files(str(root), existing_files))
+
+    assert set(changed) == {str(modified), str(new)}
+    assert changed[str(new)]['size'] == 3
+    assert existing_files == {str(unchanged), str(modified), str(new), str(root / 'ignored.bin')}
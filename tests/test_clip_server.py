@@ -0,0 +1,79 @@
+import threading
+import time
+
+import pytest
+
+from ingestor.batch_writer import EmbeddingBatcher, EmbeddingInputError
+from ingestor.clip_embeddings import CLIPClient
+from ingestor.clip_server import CLIPServer
+
+
+class FakeCLIPFunction:
+    """Embeds each input as [len(input)]. 'bad' is an input the model rejects; 'oom' takes the whole worker down."""
+
+    model_name = 'fake'
+    checkpoint = 'none'
+    device = 'cpu'
+
+    def __init__(self):
+        self.calls = []
+
+    def load(self):
+        pass
+
+    def __call__(self, inputs):
+        self.calls.append(list(inputs))
+        if 'oom' in inputs:
+            raise RuntimeError("CUDA out of memory")
+        if 'bad' in inputs:
+            raise ValueError("cannot identify image")
+        return [[float(len(item))] for item in inputs]
+
+
+@pytest.fixture
+def worker(tmp_path):
+    """A CLIP worker on a Unix socket in tmp_path, and a client of it."""
+    address = str(tmp_path / 'clip.sock')
+    server = CLIPServer(address=address, authkey='test', embedding_function=FakeCLIPFunction())
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = CLIPClient(address=address, authkey='test', autostart=False)
+    deadline = time.monotonic() + 10
+    while True:
+        try:
+            client.request('status')
+            break
+        except OSError:
+            assert time.monotonic() < deadline, "CLIP worker did not start"
+            time.sleep(0.05)
+    return server, client
+
+
+def test_embeds_through_the_worker(worker):
+    _, client = worker
+    assert client.request('embed', ['a', 'abc']) == [[1.0], [3.0]]
+
+
+def test_rejected_inputs_raise_an_input_error(worker):
+    _, client = worker
+    with pytest.raises(EmbeddingInputError, match='cannot identify image'):
+        client.request('embed', ['bad'])
+
+
+def test_worker_failures_are_not_input_errors(worker):
+    server, client = worker
+    with pytest.raises(RuntimeError, match='CUDA out of memory') as raised:
+        client.request('embed', ['oom'])
+    assert not isinstance(raised.value, EmbeddingInputError)
+
+    # A batching client sends the failing batch once instead of bisecting it
+    requests = []
+
+    def embed(inputs):
+        requests.append(list(inputs))
+        return client.request('embed', inputs)
+
+    batcher = EmbeddingBatcher(embed, max_items=8, max_in_flight=1, linger=0.01, token_counter=None)
+    embeddings, errors = batcher.embed(['a', 'b', 'oom', 'd', 'e', 'f', 'g', 'h'])
+    assert len(requests) == 1
+    assert embeddings == [None] * 8
+    assert all(isinstance(error, RuntimeError) for error in errors)
@@ -0,0 +1,74 @@
+import numpy as np
+
+from ingestor.embedding_cache import EmbeddingCache, get_model_key
+
+
+class CountingFunction:
+    def __init__(self, model_name='model-a', offset=0.0):
+        self.model_name = model_name
+        self.offset = offset
+        self.calls = []
+
+    @staticmethod
+    def name():
+        return 'test'
+
+    def get_config(self):
+        return {'model_name': self.model_name}
+
+    def __call__(self, inputs):
+        self.calls.append(list(inputs))
+        return [[float(len(item)) + self.offset, 1.0] for item in inputs]
+
+
+def make_cache(tmp_path, **kwargs):
+    return EmbeddingCache(path=str(tmp_path / 'embeddings.db'), **{'max_bytes': 10 ** 6, **kwargs})
+
+
+def test_embeds_only_missing_inputs(tmp_path):
+    cache = make_cache(tmp_path)
+    function = CountingFunction()
+    first = cache.embed(function, ['a dog', 'a cat', 'a dog'])
+    second = cache.embed(function, ['A  Dog', 'a bird'])
+
+    assert function.calls == [['a dog', 'a cat'], ['a bird']]
+    np.testing.assert_array_equal(first[0], first[2])
+    np.testing.assert_array_equal(second[0], first[0])
+    assert all(vector.dtype == np.float32 for vector in first + second)
+
+
+def test_models_do_not_share_entries(tmp_path):
+    cache = make_cache(tmp_path)
+    model_a, model_b = CountingFunction('model-a'), CountingFunction('model-b', offset=10.0)
+    vector_a = cache.embed(model_a, ['query'])[0]
+    vector_b = cache.embed(model_b, ['query'])[0]
+
+    assert model_b.calls == [['query']]
+    assert vector_a[0] != vector_b[0]
+    assert get_model_key(model_a) == ('test', 'model-a')
+
+
+def test_entries_survive_a_restart(tmp_path):
+    function = CountingFunction()
+    make_cache(tmp_path, memory_items=0).embed(function, ['persisted'])
+    restarted = make_cache(tmp_path, memory_items=0)
+
+    assert restarted.embed(function, ['persisted'])[0][0] == len('persisted')
+    assert len(function.calls) == 1
+    assert restarted.stats()['entries'] == 1
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    # Every vector takes 8 bytes, so the cache holds two of them
+    cache = make_cache(tmp_path, max_bytes=16, memory_items=0)
+    function = CountingFunction()
+    cache.embed(function, ['first'])
+    cache.embed(function, ['second'])
+    cache.embed(function, ['first'])
+    cache.embed(function, ['third'])
+
+    # 'second' was used least recently
+    assert cache.stats()['entries'] == 2
+    cache.embed(function, ['first', 'third'])
+    cache.embed(function, ['second'])
+    assert function.calls == [['first'], ['second'], ['third'], ['second']]
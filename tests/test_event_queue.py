@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+import pytest
+
+from ingestor.event_queue import CoalescingEventQueue
+
+
+class RecordingIngestor:
+    """Records the actions the queue applies instead of ingesting."""
+
+    def __init__(self):
+        self.actions = []
+        self.lock = threading.Lock()
+
+    def claim_path(self, *paths, blocking=True):
+        return True
+
+    def release_path(self, *paths):
+        pass
+
+    def move_file(self, old_path, new_path):
+        with self.lock:
+            self.actions.append(('move', old_path, new_path))
+
+    def remove_file(self, file_path):
+        with self.lock:
+            self.actions.append(('remove', file_path))
+
+    async def ingest_document(self, file_path):
+        with self.lock:
+            self.actions.append(('ingest', file_path))
+
+
+@pytest.fixture
+def queue():
+    ingestor = RecordingIngestor()
+    queue = CoalescingEventQueue(ingestor, quiet_period=0.1, workers=2)
+    queue.start()
+    yield queue
+    queue.stop()
+
+
+def settle(queue, timeout=10):
+    deadline = time.monotonic() + timeout
+    while queue.pending_count():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+    return sorted(queue.ingestor.actions)
+
+
+def test_create_and_modifications_cost_one_ingest(queue, tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('text')
+    for event_type in ('created', 'modified', 'modified'):
+        queue.push(event_type, str(path))
+
+    assert settle(queue) == [('ingest', str(path))]
+
+
+def test_events_within_the_quiet_period_are_held(queue, tmp_path):
+    path = tmp_path / 'a.txt'
+    path.write_text('text')
+    for _ in range(5):
+        queue.push('modified', str(path))
+        time.sleep(0.05)
+    assert queue.ingestor.actions == []
+
+    assert settle(queue) == [('ingest', str(path))]
+
+
+def test_created_then_deleted_is_removed(queue, tmp_path):
+    path = str(tmp_path / 'a.txt')
+    queue.push('created', path)
+    queue.push('deleted', path)
+
+    assert settle(queue) == [('remove', path)]
+
+
+def test_atomic_save_ingests_the_final_file(queue, tmp_path):
+    # Editors write a temporary file and rename it over the original
+    temp, path = tmp_path / '.a.txt.swp', tmp_path / 'a.txt'
+    path.write_text('saved')
+    queue.push('created', str(temp))
+    queue.push('modified', str(temp))
+    queue.push('moved', str(temp), str(path))
+
+    assert settle(queue) == [('ingest', str(path)), ('remove', str(temp))]
+
+
+def test_move_chain_is_one_move(queue, tmp_path):
+    a, b, c = (str(tmp_path / name) for name in ('a.txt', 'b.txt', 'c.txt'))
+    (tmp_path / 'c.txt').write_text('text')
+    queue.push('moved', a, b)
+    queue.push('moved', b, c)
+
+    assert settle(queue) == [('ingest', c), ('move', a, c)]
+
+
+def test_moved_then_deleted_removes_the_original(queue, tmp_path):
+    a, b = str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')
+    queue.push('moved', a, b)
+    queue.push('deleted', b)
+
+    assert settle(queue) == [('remove', a)]
+
+
+def test_write_to_a_moved_file_is_applied_after_the_move(queue, tmp_path):
+    a, b = str(tmp_path / 'a.txt'), str(tmp_path / 'b.txt')
+    (tmp_path / 'b.txt').write_text('edited')
+    queue.push('moved', a, b)
+    queue.push('modified', b)
+
+    assert settle(queue) == [('ingest', b), ('move', a, b)]
+    assert queue.ingestor.actions.index(('move', a, b)) < queue.ingestor.actions.index(('ingest', b))
+
+
+def test_bulk_operation_costs_one_ingest_per_final_file(queue, tmp_path):
+    paths = []
+    for i in range(50):
+        path = tmp_path / f'{i}.txt'
+        path.write_text('text')
+        paths.append(str(path))
+        for event_type in ('created', 'modified', 'modified'):
+            queue.push(event_type, str(path))
+
+    assert settle(queue) == sorted(('ingest', path) for path in paths)
+
+
+def test_relative_paths_are_made_absolute(queue, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    queue.push('deleted', 'a.txt')
+
+    assert settle(queue) == [('remove', os.path.join(str(tmp_path), 'a.txt'))]
@@ -0,0 +1,91 @@
+import pytest
+
+from ingestor.pipeline import iter_directory_jobs
+
+
+class Crash(Exception):
+    pass
+
+
+def crash_before_cataloging(ingestor, monkeypatch, path):
+    """Ingest path, dying after its vectors were indexed but before its catalog record was written."""
+    def save_file_record(*args, **kwargs):
+        raise Crash()
+
+    with monkeypatch.context() as patch:
+        patch.setattr(ingestor, 'save_file_record', save_file_record)
+        with pytest.raises(Crash):
+            ingestor.process_job(ingestor.new_job(path))
+
+
+def test_interrupted_file_is_journaled(ingestor, tmp_path, monkeypatch):
+    path = tmp_path / 'a.txt'
+    path.write_text('some text')
+
+    crash_before_cataloging(ingestor, monkeypatch, str(path))
+
+    [entry] = ingestor.get_journal_entries()
+    assert (entry['path'], entry['stage'], entry['parts_committed']) == (str(path), 'indexing', 1)
+    assert entry['hash'] == ingestor.get_file_hash(str(path))
+    assert ingestor.get_file_record(str(path)) is None
+
+
+def test_resume_neither_duplicates_nor_reembeds(ingestor, tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    root.mkdir()
+    path = root / 'a.txt'
+    path.write_text('some text')
+    crash_before_cataloging(ingestor, monkeypatch, str(path))
+    chunks = dict(ingestor.vector_store.chunks)
+    ingestor.vector_store.embedded.clear()
+
+    resume_paths = ingestor.recover_journal(str(root))
+    jobs = [job for job, _ in iter_directory_jobs(ingestor, str(root), set(), resume_paths)]
+    assert [(job['path'], job['resume']) for job in jobs] == [(str(path), True)]
+    for job in jobs:
+        ingestor.process_job(job)
+
+    assert ingestor.vector_store.embedded == []
+    assert ingestor.vector_store.chunks == chunks
+    assert ingestor.get_file_record(str(path)) is not None
+    assert ingestor.get_journal_entries() == []
+
+
+def test_journaled_file_is_resumed_even_if_its_stat_is_unchanged(ingestor, tmp_path):
+    root = tmp_path / 'root'
+    root.mkdir()
+    path = root / 'a.txt'
+    path.write_text('some text')
+    ingestor.process_job(ingestor.new_job(str(path)))
+    # E.g. a move interrupted after the catalog was re-pointed
+    ingestor.write_journal(str(path), 'reusing')
+
+    resume_paths = ingestor.recover_journal(str(root))
+    jobs = list(iter_directory_jobs(ingestor, str(root), set(), resume_paths))
+
+    assert [(job['path'], job['resume'], file_stat) for job, file_stat in jobs] == [(str(path), True, None)]
+    assert ingestor.process_job(jobs[0][0]) is not None
+    assert ingestor.get_journal_entries() == []
+
+
+def test_journaled_file_gone_from_disk_is_removed(ingestor, tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    root.mkdir()
+    path = root / 'a.txt'
+    path.write_text('some text')
+    crash_before_cataloging(ingestor, monkeypatch, str(path))
+    path.unlink()
+
+    assert ingestor.recover_journal(str(root)) == []
+    assert ingestor.vector_store.chunks == {}
+    assert ingestor.get_journal_entries() == []
+
+
+def test_recovery_is_scoped_to_the_directory(ingestor, tmp_path):
+    for name in ('a', 'ab'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'file.txt').write_text(name)
+        ingestor.write_journal(str(tmp_path / name / 'file.txt'), 'extracted')
+
+    assert ingestor.recover_journal(str(tmp_path / 'a')) == [str(tmp_path / 'a' / 'file.txt')]
+    assert len(ingestor.get_journal_entries()) == 2
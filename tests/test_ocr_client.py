@@ -0,0 +1,80 @@
+import io
+import json
+import socket
+import threading
+import time
+import urllib.request
+
+import pytest
+import uvicorn
+from pypdf import PdfWriter
+
+from data_loaders.fake_azure_di import create_app
+from data_loaders.ocr_client import OCRClient
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def fake_service():
+    """Starts fake_azure_di in a thread, throttling above 2 requests per second. Yields its endpoint."""
+    port = free_port()
+    server = uvicorn.Server(uvicorn.Config(create_app(requests_per_second=2, latency=0.1), host='127.0.0.1',
+                                           port=port, log_level='error'))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    deadline = time.monotonic() + 10
+    while not server.started:
+        assert time.monotonic() < deadline, "fake Document Intelligence did not start"
+        time.sleep(0.05)
+    yield f'http://127.0.0.1:{port}'
+    server.should_exit = True
+    thread.join(timeout=10)
+
+
+def get_stats(endpoint):
+    with urllib.request.urlopen(f'{endpoint}/stats') as response:
+        return json.loads(response.read())
+
+
+def make_client(endpoint, **kwargs):
+    return OCRClient(api_endpoint=endpoint, api_key='test', polling_interval=0.05, **kwargs)
+
+
+def blank_pdf(pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=612, height=792)
+    data = io.BytesIO()
+    writer.write(data)
+    return data.getvalue()
+
+
+def test_analyze_returns_one_document_per_page(fake_service):
+    pages = make_client(fake_service).analyze_pdf(b'first page\fsecond page\fthird page', 'notes.txt')
+
+    assert [page['content'] for page in pages] == ['first page', 'second page', 'third page']
+    assert [page['metadata']['page_number'] for page in pages] == [1, 2, 3]
+    assert {page['metadata']['source'] for page in pages} == {'notes.txt'}
+
+
+def test_analyze_only_the_requested_pages(fake_service):
+    pages = make_client(fake_service).analyze_pdf(b'one\ftwo\fthree\ffour', 'notes.txt', pages='2,4')
+
+    assert [(page['metadata']['page_number'], page['content']) for page in pages] == [(2, 'two'), (4, 'four')]
+
+
+def test_large_pdf_is_split_and_throttled_requests_are_retried(fake_service):
+    # The client lets 5 requests through at once; the service answers the ones above 2 per second with a 429
+    client = make_client(fake_service, pages_per_request=5, requests_per_second=10, burst=5, max_concurrency=5)
+    pages = client.analyze_pdf(blank_pdf(23), 'large.pdf')
+
+    assert [page['metadata']['page_number'] for page in pages] == list(range(1, 24))
+    stats = get_stats(fake_service)
+    assert stats['analyze_requests'] == 5
+    assert stats['throttled'] > 0
+    assert stats['pages'] == 23
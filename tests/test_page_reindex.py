@@ -0,0 +1,72 @@
+import pytest
+
+from ingestor.vector_store import get_chunk_hash, make_chunk_id
+
+
+def fake_extract_pdf(file_obj, source):
+    """One page per form feed, like the OCR output of a PDF."""
+    text = file_obj.read().decode('utf-8')
+    return [{'content': page, 'metadata': {'source': source, 'page_number': number}}
+            for number, page in enumerate(text.split('\f'), start=1)]
+
+
+@pytest.fixture
+def pdf(ingestor, tmp_path, monkeypatch):
+    monkeypatch.setattr('ingestor.ingestor.extract_pdf', fake_extract_pdf)
+    return tmp_path / 'manual.pdf'
+
+
+def ingest(ingestor, path, pages):
+    path.write_text('\f'.join(pages))
+    ingestor.vector_store.embedded.clear()
+    ingestor.process_job(ingestor.new_job(str(path)))
+    return ingestor.vector_store.embedded
+
+
+def ids_by_page(ingestor, path):
+    return {chunk['metadata']['page_number']: chunk_id
+            for chunk_id, chunk in ingestor.vector_store.chunks.items() if chunk['source'] == str(path)}
+
+
+PAGES = ['first page about setup', 'second page about usage', 'third page about support']
+
+
+def test_page_ids_are_deterministic(ingestor, pdf):
+    ingest(ingestor, pdf, PAGES)
+
+    assert ids_by_page(ingestor, pdf) == {
+        number: make_chunk_id(str(pdf), str(number), get_chunk_hash(page))
+        for number, page in enumerate(PAGES, start=1)
+    }
+
+
+def test_editing_one_page_reembeds_only_that_page(ingestor, pdf):
+    ingest(ingestor, pdf, PAGES)
+    before = ids_by_page(ingestor, pdf)
+
+    edited = [PAGES[0], 'second page about usage, revised', PAGES[2]]
+    assert ingest(ingestor, pdf, edited) == [edited[1]]
+
+    after = ids_by_page(ingestor, pdf)
+    assert after[1] == before[1] and after[3] == before[3]
+    assert after[2] != before[2]
+    assert before[2] not in ingestor.vector_store.chunks
+    assert ingestor.vector_store.contents(str(pdf)) == sorted(edited)
+
+
+def test_removed_pages_are_deleted_without_embedding(ingestor, pdf):
+    ingest(ingestor, pdf, PAGES)
+    before = ids_by_page(ingestor, pdf)
+
+    assert ingest(ingestor, pdf, PAGES[:2]) == []
+    assert ids_by_page(ingestor, pdf) == {1: before[1], 2: before[2]}
+
+
+def test_reingesting_the_same_pages_embeds_nothing(ingestor, pdf):
+    ingest(ingestor, pdf, PAGES)
+    before = dict(ingestor.vector_store.chunks)
+    # Forget the catalog record, as after a crash between indexing and cataloging
+    ingestor.delete_file_record(str(pdf))
+
+    assert ingest(ingestor, pdf, PAGES) == []
+    assert ingestor.vector_store.chunks == before
@@ -0,0 +1,89 @@
+import asyncio
+import threading
+import time
+
+from ingestor.pipeline import STAGES, IngestionPipeline
+
+
+def write_files(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f'{i}.txt'
+        path.write_text(f'text of file {i}')
+        paths.append(str(path))
+    return paths
+
+
+def run(pipeline, jobs):
+    asyncio.run(pipeline.run(jobs))
+
+
+def test_every_file_goes_through_every_stage(ingestor, tmp_path, monkeypatch):
+    paths = write_files(tmp_path, 5)
+    stages = []
+    run_stage = ingestor.run_stage
+    monkeypatch.setattr(ingestor, 'run_stage', lambda stage, job: stages.append(stage) or run_stage(stage, job))
+    done = []
+    pipeline = IngestionPipeline(ingestor, on_file_done=lambda path, failed: done.append((path, failed)))
+
+    run(pipeline, (ingestor.new_job(path) for path in paths))
+
+    assert sorted(done) == [(path, False) for path in sorted(paths)]
+    assert sorted(stages) == sorted(STAGES * len(paths))
+    assert ingestor.vector_store.sources() == set(paths)
+    assert all(ingestor.get_file_record(path) for path in paths)
+    assert ingestor.get_journal_entries() == []
+
+
+def test_a_failing_stage_fails_only_its_file(ingestor, tmp_path, monkeypatch):
+    paths = write_files(tmp_path, 3)
+    run_stage = ingestor.run_stage
+
+    def failing_run_stage(stage, job):
+        if stage == 'embed' and job['path'] == paths[1]:
+            raise RuntimeError('embedding API down')
+        return run_stage(stage, job)
+
+    monkeypatch.setattr(ingestor, 'run_stage', failing_run_stage)
+    done = {}
+    pipeline = IngestionPipeline(ingestor, on_file_done=done.__setitem__)
+
+    run(pipeline, (ingestor.new_job(path) for path in paths))
+
+    assert done == {paths[0]: False, paths[1]: True, paths[2]: False}
+    assert ingestor.vector_store.sources() == {paths[0], paths[2]}
+    # Left out of the catalog and journaled, so the next scan retries it
+    assert ingestor.get_file_record(paths[1]) is None
+    assert [entry['path'] for entry in ingestor.get_journal_entries()] == [paths[1]]
+
+
+def test_jobs_are_pulled_only_when_the_check_queue_has_room(ingestor, tmp_path, monkeypatch):
+    paths = write_files(tmp_path, 10)
+    released = threading.Event()
+    run_stage = ingestor.run_stage
+
+    def blocked_run_stage(stage, job):
+        if stage == 'check':
+            released.wait()
+        return run_stage(stage, job)
+
+    monkeypatch.setattr(ingestor, 'run_stage', blocked_run_stage)
+    pulled = []
+
+    def jobs():
+        for path in paths:
+            pulled.append(path)
+            yield ingestor.new_job(path)
+
+    pipeline = IngestionPipeline(ingestor, queue_depth=1, check_workers=1)
+    thread = threading.Thread(target=run, args=(pipeline, jobs()))
+    thread.start()
+    time.sleep(0.3)
+    # One file in the check worker, one in the check queue and one waiting for room
+    assert len(pulled) == 3
+
+    released.set()
+    thread.join(timeout=10)
+    assert not thread.is_alive()
+    assert len(pulled) == len(paths)
+    assert ingestor.vector_store.sources() == set(paths)
@@ -0,0 +1,115 @@
+import asyncio
+import os
+
+import pytest
+
+
+@pytest.fixture
+def get_prefix_range():
+    # Imported lazily: importing the ingestor creates the catalog in the working directory
+    from ingestor.ingestor import get_prefix_range
+    return get_prefix_range
+
+
+@pytest.mark.parametrize('path, inside', [
+    ('/data/a/file.txt', True),
+    ('/data/a/sub/file.txt', True),
+    ('/data/a/~~~', True),
+    ('/data/a', False),
+    ('/data/ab/file.txt', False),
+    ('/data/a0/file.txt', False),
+    ('/data/a-b/file.txt', False),
+    ('/data/file.txt', False),
+])
+def test_prefix_range_selects_only_paths_under_the_directory(get_prefix_range, path, inside):
+    for directory in ('/data/a', '/data/a/'):
+        low, high = get_prefix_range(directory)
+        assert (low <= path < high) == inside
+
+
+def write(path, content):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    return str(path)
+
+
+def ingest_root(ingestor, root):
+    asyncio.run(ingestor.ingest_directory(str(root)))
+
+
+@pytest.fixture
+def roots(ingestor, tmp_path, monkeypatch):
+    """Two roots whose names share a prefix, both ingested."""
+    monkeypatch.setattr(ingestor, 'start_file_watcher', lambda directory_path: None)
+    a, ab = tmp_path / 'a', tmp_path / 'ab'
+    files = {
+        'a': write(a / 'a.txt', 'text of a'),
+        'a2': write(a / 'sub' / 'a2.txt', 'more text of a'),
+        'ab': write(ab / 'ab.txt', 'text of ab'),
+    }
+    for root in (a, ab):
+        ingest_root(ingestor, root)
+    assert ingestor.vector_store.sources() == set(files.values())
+    return a, ab, files
+
+
+def test_snapshot_is_scoped_to_the_root(ingestor, roots):
+    a, ab, files = roots
+
+    assert set(ingestor.get_snapshot(str(a))) == {files['a'], files['a2']}
+    assert set(ingestor.get_snapshot(str(ab))) == {files['ab']}
+
+
+def test_reconciliation_only_removes_files_of_the_scanned_root(ingestor, roots):
+    a, ab, files = roots
+    os.remove(files['a2'])
+    os.remove(files['ab'])
+
+    ingest_root(ingestor, a)
+
+    assert ingestor.vector_store.sources() == {files['a'], files['ab']}
+    assert ingestor.get_file_record(files['ab']) is not None
+
+    ingest_root(ingestor, ab)
+    assert ingestor.vector_store.sources() == {files['a']}
+
+
+def test_moved_file_keeps_its_vectors(ingestor, roots):
+    a, ab, files = roots
+    chunk_ids = set(ingestor.vector_store.get_ids_by_source(files['a2']))
+    moved = str(a / 'moved.txt')
+    os.rename(files['a2'], moved)
+    ingestor.vector_store.embedded.clear()
+
+    ingest_root(ingestor, a)
+
+    assert ingestor.vector_store.embedded == []
+    assert ingestor.vector_store.sources() == {files['a'], moved, files['ab']}
+    assert len(ingestor.vector_store.get_ids_by_source(moved)) == len(chunk_ids)
+    assert set(ingestor.get_snapshot(str(a))) == {files['a'], moved}
+
+
+def test_unreadable_directory_is_not_reconciled_away(ingestor, roots, monkeypatch):
+    a, ab, files = roots
+    scandir = os.scandir
+
+    def failing_scandir(path):
+        if path == str(a / 'sub'):
+            raise PermissionError(path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', failing_scandir)
+    ingest_root(ingestor, a)
+
+    assert files['a2'] in ingestor.vector_store.sources()
+
+
+def test_roots_are_registered_and_nested_roots_folded(ingestor, tmp_path):
+    outer, inner = tmp_path / 'outer', tmp_path / 'outer' / 'inner'
+    inner.mkdir(parents=True)
+
+    assert ingestor.resolve_directory_conflicts(str(inner)) is None
+    assert ingestor.resolve_directory_conflicts(str(outer)) is None
+    assert set(ingestor.observers) == {str(outer)}
+    # The outer root covers the inner one from now on
+    assert ingestor.resolve_directory_conflicts(str(inner)) == str(outer)
@@ -0,0 +1,74 @@
+from agent.result_packer import merge_hits, pack_search_results
+from utils.tokens import count_tokens
+
+
+def similarity_distance(similarity):
+    """Squared Euclidean distance of two unit vectors with this cosine similarity."""
+    return 2.0 * (1.0 - similarity)
+
+
+def make_results(*queries):
+    """
+    :param queries: One list per query of (id, document, source, page, similarity) hits.
+    """
+    return {
+        'ids': [[hit[0] for hit in hits] for hits in queries],
+        'documents': [[hit[1] for hit in hits] for hits in queries],
+        'metadatas': [[{'source': hit[2], 'page_number': hit[3]} for hit in hits] for hits in queries],
+        'distances': [[similarity_distance(hit[4]) for hit in hits] for hits in queries],
+    }
+
+
+def test_merge_keeps_each_chunk_once_with_its_best_score():
+    results = make_results(
+        [('c1', 'alpha', 'a.pdf', 1, 0.5), ('c2', 'beta', 'b.pdf', None, 0.9)],
+        [('c1', 'alpha', 'a.pdf', 1, 0.8)],
+    )
+    hits = merge_hits(results, min_similarity=0.2)
+
+    assert [(hit['source'], hit['page']) for hit in hits] == [('b.pdf', None), ('a.pdf', 1)]
+    assert hits[1]['score'] == 0.8
+    assert hits[1]['texts'] == ['alpha']
+
+
+def test_merge_groups_chunks_of_one_page():
+    results = make_results([('c1', 'first', 'a.pdf', 2, 0.9), ('c2', 'second', 'a.pdf', 2, 0.7),
+                            ('c3', 'other', 'a.pdf', 3, 0.8)])
+    hits = merge_hits(results, min_similarity=0.2)
+
+    assert [(hit['page'], hit['texts']) for hit in hits] == [(2, ['first', 'second']), (3, ['other'])]
+
+
+def test_merge_drops_weak_hits_unless_the_keyword_index_matched_them():
+    results = make_results([('c1', 'close', 'a.pdf', 1, 0.9), ('c2', 'far', 'b.pdf', 1, 0.1),
+                            ('c3', 'INV-2024-001', 'c.pdf', 1, 0.1)])
+    results['scores'] = [[0.03, 0.02, 0.01]]
+    results['keyword_matches'] = [[False, False, True]]
+    hits = merge_hits(results, min_similarity=0.2)
+
+    assert [hit['source'] for hit in hits] == ['a.pdf', 'c.pdf']
+
+
+def test_pack_numbers_hits_best_first():
+    results = make_results([('c1', 'second   best\n\n\ntext', 'b.pdf', 3, 0.6), ('c2', 'best', 'a.pdf', None, 0.9)])
+    packed = pack_search_results(results, token_budget=500, min_similarity=0.2)
+
+    assert packed == "[1] a.pdf\nbest\n\n[2] b.pdf, page 3\nsecond best\ntext"
+
+
+def test_pack_fits_the_token_budget_and_notes_what_it_left_out():
+    hits = [(f'c{i}', ' '.join(f'word{i}x{j}' for j in range(200)), f'doc{i}.pdf', 1, 0.9 - i / 100)
+            for i in range(10)]
+    budget = 300
+    packed = pack_search_results(make_results(hits), token_budget=budget, min_similarity=0.2)
+
+    assert count_tokens(packed) <= budget
+    assert packed.startswith('[1] doc0.pdf, page 1\n')
+    assert 'left out to fit the token budget' in packed.splitlines()[-1]
+    assert 'doc9.pdf' not in packed
+
+
+def test_pack_without_hits():
+    weak = make_results([('c1', 'far', 'a.pdf', 1, 0.0)])
+    assert pack_search_results({'ids': [[]]}) == "No relevant results found."
+    assert pack_search_results(weak, min_similarity=0.2) == "No relevant results found."
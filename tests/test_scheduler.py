@@ -0,0 +1,200 @@
+import asyncio
+import os
+import threading
+import time
+
+import pytest
+
+from ingestor.event_queue import CoalescingEventQueue
+from ingestor.pipeline import IngestionPipeline
+from ingestor.scheduler import BULK, RECENT, SMALL, BackgroundIngestionService
+
+DAY = 86400
+
+
+def write(path, content, age=10 * DAY):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    mtime = time.time() - age
+    os.utime(path, (mtime, mtime))
+    return str(path)
+
+
+def wait_for(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.02)
+
+
+def wait_until_done(service):
+    wait_for(lambda: all(progress['state'] == 'done' for progress in service.progress()))
+
+
+@pytest.fixture
+def unwatched(ingestor, monkeypatch):
+    monkeypatch.setattr(ingestor, 'start_file_watcher', lambda directory_path: None)
+    return ingestor
+
+
+def scan_only(ingestor, **kwargs):
+    """A service whose pipeline is not started, so the test takes the queued files itself."""
+    service = BackgroundIngestionService(ingestor, small_file_bytes=100, recent_seconds=DAY, **kwargs)
+    service.start = lambda: None
+    return service
+
+
+def test_get_priority_tiers(unwatched):
+    service = scan_only(unwatched)
+    now = time.time_ns()
+
+    assert service.get_priority({'mtime_ns': now, 'size': 10 ** 6}) == (RECENT, -now)
+    assert service.get_priority({'mtime_ns': now - 2 * DAY * 10 ** 9, 'size': 50}) == (SMALL, 50)
+    assert service.get_priority({'mtime_ns': now - 2 * DAY * 10 ** 9, 'size': 500}) == (BULK, 500)
+
+
+def test_files_are_taken_in_priority_order(unwatched, tmp_path):
+    root = tmp_path / 'root'
+    files = {
+        'bulk_large': write(root / 'bulk_large.txt', 'x' * 900),
+        'bulk_mid': write(root / 'sub' / 'bulk_mid.txt', 'x' * 300),
+        'small_b': write(root / 'small_b.txt', 'x' * 60),
+        'small_a': write(root / 'sub' / 'small_a.txt', 'x' * 20),
+        'recent_old': write(root / 'recent_old.txt', 'x' * 900, age=3600),
+        'recent_new': write(root / 'recent_new.txt', 'x' * 900, age=60),
+        'interrupted': write(root / 'interrupted.txt', 'x' * 900),
+    }
+    unwatched.write_journal(files['interrupted'], 'extracted')
+    service = scan_only(unwatched)
+
+    assert service.ingest_directory(str(root))
+    wait_for(lambda: service.progress()[0]['state'] == 'ingesting')
+    jobs = service._jobs()
+    order = [next(jobs)['path'] for _ in files]
+
+    assert order == [files[name] for name in ('interrupted', 'recent_new', 'recent_old', 'small_a', 'small_b',
+                                              'bulk_mid', 'bulk_large')]
+    assert service.pending_count() == 0
+
+
+def test_referenced_files_jump_the_backlog(unwatched, tmp_path):
+    root = tmp_path / 'root'
+    small = write(root / 'notes.txt', 'x' * 10)
+    report = write(root / 'report_q3.md', 'x' * 900)
+    service = scan_only(unwatched)
+    service.ingest_directory(str(root))
+    wait_for(lambda: service.progress()[0]['state'] == 'ingesting')
+
+    assert service.promote_referenced('what does the report_q3 say?') == [report]
+    jobs = service._jobs()
+    assert [next(jobs)['path'], next(jobs)['path']] == [report, small]
+
+
+def test_scan_waits_while_the_backlog_is_full(unwatched, tmp_path):
+    root = tmp_path / 'root'
+    for i in range(5):
+        write(root / f'{i}.txt', 'x' * (i + 1))
+    service = scan_only(unwatched, max_backlog=2)
+    service.ingest_directory(str(root))
+
+    wait_for(lambda: service.pending_count() == 2)
+    time.sleep(0.2)
+    assert service.pending_count() == 2
+    assert service.progress()[0]['state'] == 'scanning'
+
+    jobs = service._jobs()
+    taken = [next(jobs)['path'] for _ in range(5)]
+    wait_for(lambda: service.progress()[0]['state'] == 'ingesting')
+    assert len(set(taken)) == 5
+    assert service.progress()[0]['queued'] == 5
+
+
+def test_directory_is_ingested_and_reconciled(unwatched, tmp_path):
+    root = tmp_path / 'root'
+    kept = write(root / 'kept.txt', 'kept text')
+    gone = write(root / 'gone.txt', 'gone text')
+    service = BackgroundIngestionService(unwatched)
+    service.ingest_directory(str(root))
+    wait_until_done(service)
+    assert unwatched.vector_store.sources() == {kept, gone}
+
+    os.remove(gone)
+    assert service.ingest_directory(str(root))
+    wait_until_done(service)
+
+    progress = service.progress()[0]
+    assert (progress['queued'], progress['done'], progress['failed']) == (0, 0, 0)
+    assert unwatched.vector_store.sources() == {kept}
+    assert set(unwatched.get_snapshot(str(root))) == {kept}
+
+
+def test_watcher_starts_before_the_scan(unwatched, tmp_path, monkeypatch):
+    root = tmp_path / 'root'
+    write(root / 'a.txt', 'some text')
+    calls = []
+    scan = unwatched.iter_changed_files
+    monkeypatch.setattr(unwatched, 'start_file_watcher', lambda path: calls.append('watch'))
+    monkeypatch.setattr(unwatched, 'iter_changed_files',
+                        lambda *args: calls.append('scan') or scan(*args))
+    service = BackgroundIngestionService(unwatched)
+    service.ingest_directory(str(root))
+    wait_until_done(service)
+
+    assert calls == ['watch', 'scan']
+
+
+def test_nested_root_stays_watched_while_its_parent_is_ingested(ingestor, tmp_path):
+    root = tmp_path / 'root'
+    write(root / 'child' / 'a.txt', 'some text')
+    service = BackgroundIngestionService(ingestor)
+    service.ingest_directory(str(root / 'child'))
+    wait_until_done(service)
+    assert list(ingestor.observers) == [str(root / 'child')]
+
+    service.ingest_directory(str(root))
+    wait_until_done(service)
+    assert list(ingestor.observers) == [str(root)]
+
+
+def test_reconciliation_keeps_files_created_after_the_walk(unwatched, tmp_path):
+    root = tmp_path / 'root'
+    late = write(root / 'late.txt', 'late text')
+    # Ingested by the watcher after the walk had passed, so absent from the files the walk found
+    unwatched.process_job(unwatched.new_job(late))
+
+    unwatched.remove_missing_files(str(root), existing_files=set())
+
+    assert unwatched.vector_store.sources() == {late}
+
+
+def test_pipeline_waits_for_a_file_the_watcher_works_on(unwatched, tmp_path):
+    path = write(tmp_path / 'a.txt', 'some text')
+    done = []
+    pipeline = IngestionPipeline(unwatched, on_file_done=lambda path, failed: done.append(path))
+    unwatched.claim_path(path)
+    thread = threading.Thread(target=asyncio.run, args=(pipeline.run(iter([unwatched.new_job(path)])),))
+    thread.start()
+
+    time.sleep(0.2)
+    assert done == []
+    unwatched.release_path(path)
+    thread.join(timeout=10)
+    assert done == [path]
+
+
+def test_watcher_waits_for_a_file_the_pipeline_works_on(unwatched, tmp_path):
+    path = write(tmp_path / 'a.txt', 'some text')
+    queue = CoalescingEventQueue(unwatched, quiet_period=0.05, workers=1)
+    queue.start()
+    try:
+        unwatched.claim_path(path)
+        queue.push('created', path)
+        time.sleep(0.3)
+        assert queue.pending_count() == 1
+        assert unwatched.vector_store.sources() == set()
+
+        unwatched.release_path(path)
+        wait_for(lambda: queue.pending_count() == 0)
+        assert unwatched.vector_store.sources() == {path}
+    finally:
+        queue.stop()
@@ -0,0 +1,118 @@
+import asyncio
+import codecs
+
+import pytest
+
+from data_loaders.text_loaders import detect_encoding, get_text_kind, iter_csv_segments, iter_text_segments
+from ingestor.pipeline import IngestionPipeline
+
+
+def paragraphs(count, words=120):
+    return ''.join(f"paragraph {i} " + 'lorem ipsum dolor sit amet ' * (words // 5) + '\n\n' for i in range(count))
+
+
+def test_get_text_kind():
+    assert get_text_kind('notes.md') == 'text'
+    assert get_text_kind('data.tsv') == 'csv'
+    assert get_text_kind('package.lock') is None
+    assert get_text_kind('bundle.min.js') is None
+    assert get_text_kind('photo.png') is None
+
+
+@pytest.mark.parametrize('data, expected', [
+    ('héllo wörld'.encode('utf-8'), 'utf-8'),
+    (codecs.BOM_UTF8 + b'hello', 'utf-8-sig'),
+    ('hello'.encode('utf-16'), 'utf-16'),
+    (b'\x89PNG\r\n\x1a\n\x00\x00', None),
+])
+def test_detect_encoding(tmp_path, data, expected):
+    path = tmp_path / 'file.txt'
+    path.write_bytes(data)
+
+    assert detect_encoding(str(path)) == expected
+
+
+def test_legacy_encoding_is_not_read_as_utf8(tmp_path):
+    path = tmp_path / 'file.txt'
+    path.write_bytes('Prix unitaire : 12 € — remise déjà appliquée\n'.encode('cp1252') * 20)
+
+    encoding = detect_encoding(str(path))
+
+    assert encoding not in (None, 'utf-8')
+    path.read_bytes().decode(encoding)
+
+
+def test_text_is_streamed_in_bounded_segments(tmp_path):
+    text = paragraphs(50) + 'x' * 5000 + '\n' + paragraphs(10)
+    path = tmp_path / 'big.txt'
+    path.write_text(text)
+
+    segments = list(iter_text_segments(str(path), 'utf-8', segment_chars=1000))
+
+    assert ''.join(segment['content'] for segment in segments) == text
+    assert all(len(segment['content']) <= 2000 for segment in segments)
+    for segment in segments:
+        assert text[segment['char_offset']:].startswith(segment['content'])
+        assert text.count('\n', 0, segment['char_offset']) + 1 == segment['line_start']
+
+
+def test_csv_groups_repeat_the_header(tmp_path):
+    path = tmp_path / 'table.csv'
+    path.write_text('id,name\n' + ''.join(f'{i},"name\n{i}"\n' for i in range(100)))
+
+    segments = list(iter_csv_segments(str(path), 'utf-8', target_tokens=50))
+
+    assert len(segments) > 1
+    assert all(segment['content'].startswith('id,name\n') for segment in segments)
+    assert sum(segment['content'].count('"name') for segment in segments) == 100
+    # Every record spans two lines
+    assert [segment['line_start'] for segment in segments][:2] == [2, 2 + 2 * (segments[0]['content'].count('"name'))]
+
+
+def test_large_text_file_is_indexed_in_parts(ingestor, tmp_path, monkeypatch):
+    monkeypatch.setattr('ingestor.ingestor.TEXT_LOADER_CHUNKS_PER_PART', 2)
+    path = tmp_path / 'big.md'
+    path.write_text(paragraphs(40))
+    stages = []
+    run_stage = ingestor.run_stage
+    monkeypatch.setattr(ingestor, 'run_stage', lambda stage, job: stages.append(stage) or run_stage(stage, job))
+    done = []
+    pipeline = IngestionPipeline(ingestor, on_file_done=lambda path, failed: done.append((path, failed)))
+
+    asyncio.run(pipeline.run(iter([ingestor.new_job(str(path))])))
+
+    chunks = [chunk for chunk in ingestor.vector_store.chunks.values() if chunk['source'] == str(path)]
+    # Full parts of two chunks, then the remainder
+    assert stages.count('commit') == len(chunks) // 2 + 1 > 2
+    assert done == [(str(path), False)]
+    assert sorted(chunk['metadata']['chunk_index'] for chunk in chunks) == list(range(len(chunks)))
+    assert ingestor.get_file_record(str(path)) is not None
+    assert ingestor.get_journal_entries() == []
+
+
+def test_editing_a_streamed_file_removes_stale_chunks(ingestor, tmp_path, monkeypatch):
+    monkeypatch.setattr('ingestor.ingestor.TEXT_LOADER_CHUNKS_PER_PART', 2)
+    path = tmp_path / 'big.md'
+    path.write_text(paragraphs(40))
+    ingestor.process_job(ingestor.new_job(str(path)))
+
+    path.write_text(paragraphs(10))
+    ingestor.process_job(ingestor.new_job(str(path)))
+
+    text = ''.join(ingestor.vector_store.contents(str(path)))
+    assert all(f'paragraph {i} ' in text for i in range(10))
+    assert not any(f'paragraph {i} ' in text for i in range(10, 40))
+
+
+def test_oversized_and_binary_files_are_skipped(ingestor, tmp_path, monkeypatch):
+    monkeypatch.setattr('ingestor.ingestor.TEXT_LOADER_MAX_FILE_BYTES', 100)
+    large, binary = tmp_path / 'large.log', tmp_path / 'binary.txt'
+    large.write_text('x' * 101)
+    binary.write_bytes(b'\x00\x01\x02')
+
+    for path in (large, binary):
+        assert ingestor.process_job(ingestor.new_job(str(path))) is None
+
+    assert ingestor.vector_store.chunks == {}
+    # Remembered in the snapshot, so the next scan does not look at them again
+    assert set(ingestor.get_snapshot(str(tmp_path))) == {str(large), str(binary)}
@@ -0,0 +1,84 @@
+import numpy as np
+import pytest
+
+from ingestor.vector_backends import NumpyCollection, synthetic_vectors
+
+RECORDS = 300
+DIMENSION = 32
+K = 10
+
+
+def open_collection(path, quantization, dimensions):
+    # Rescoring every row makes the quantized first pass exact, so any row it loses shows up as a wrong result
+    return NumpyCollection(str(path), 'test', dtype='float32', index='exact', dimensions=dimensions,
+                           quantization=quantization, rescore_factor=RECORDS)
+
+
+def stored_form(vectors, dimensions):
+    """Leading `dimensions` values of vectors, rescaled to their original length, as NumpyCollection stores them."""
+    if not dimensions:
+        return vectors
+    truncated = vectors[:, :dimensions]
+    return truncated * (np.linalg.norm(vectors, axis=1, keepdims=True)
+                        / np.linalg.norm(truncated, axis=1, keepdims=True))
+
+
+def exact_search(records, queries, dimensions):
+    """
+    :param records: {id: full vector} of the live records.
+    :return: (ids, distances) per query, nearest first.
+    """
+    ids = list(records)
+    stored = stored_form(np.array([records[item_id] for item_id in ids]), dimensions)
+    results = []
+    for query in stored_form(queries, dimensions):
+        distances = ((stored - query) ** 2).sum(axis=1)
+        order = np.argsort(distances)[:K]
+        results.append(([ids[i] for i in order], distances[order]))
+    return results
+
+
+def assert_matches_exact(collection, records, queries, dimensions):
+    result = collection.query(query_embeddings=queries, n_results=K, include=['distances'])
+    for ids, distances, (expected_ids, expected_distances) in zip(
+            result['ids'], result['distances'], exact_search(records, queries, dimensions)):
+        assert ids == expected_ids
+        np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-5)
+
+
+@pytest.mark.parametrize('dimensions', [0, 16])
+@pytest.mark.parametrize('quantization', ['none', 'int8', 'binary'])
+def test_query_matches_exact_scan(tmp_path, quantization, dimensions):
+    vectors = synthetic_vectors(RECORDS + 50, DIMENSION, seed=1)
+    queries = synthetic_vectors(5, DIMENSION, seed=2)
+    records = {f'id{i}': vectors[i] for i in range(RECORDS)}
+    collection = open_collection(tmp_path, quantization, dimensions)
+    collection.upsert(ids=list(records), embeddings=np.array(list(records.values())))
+    assert_matches_exact(collection, records, queries, dimensions)
+
+    # Deleted rows are reused by the next records
+    deleted = [f'id{i}' for i in range(0, RECORDS, 3)]
+    collection.delete(deleted)
+    for item_id in deleted:
+        del records[item_id]
+    added = {f'new{i}': vectors[RECORDS + i] for i in range(50)}
+    collection.upsert(ids=list(added), embeddings=np.array(list(added.values())))
+    records.update(added)
+    assert collection.count() == len(records)
+    assert_matches_exact(collection, records, queries, dimensions)
+
+    reopened = open_collection(tmp_path, quantization, dimensions)
+    assert reopened.count() == len(records)
+    assert_matches_exact(reopened, records, queries, dimensions)
+
+
+def test_instances_sharing_a_collection_allocate_distinct_rows(tmp_path):
+    # Two instances stand in for two processes: each keeps its own row allocation in memory
+    first = open_collection(tmp_path, 'none', 0)
+    second = open_collection(tmp_path, 'none', 0)
+    vectors = synthetic_vectors(2, DIMENSION)
+    first.upsert(ids=['a'], embeddings=vectors[:1])
+    second.upsert(ids=['b'], embeddings=vectors[1:])
+    assert first.count() == 2
+    assert first.query(query_embeddings=vectors[1:], n_results=1, include=[])['ids'] == [['b']]
+    assert second.query(query_embeddings=vectors[:1], n_results=1, include=[])['ids'] == [['a']]
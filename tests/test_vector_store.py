@@ -0,0 +1,170 @@
+import numpy as np
+import pytest
+
+import ingestor.vector_store as vector_store
+from config.settings import SEARCH_RRF_K
+from ingestor.text_embeddings import TextEmbeddingProvider
+from ingestor.vector_backends import NumpyBackend
+from ingestor.vector_store import VectorStore, make_match_query
+
+
+class BagOfWordsProvider(TextEmbeddingProvider):
+    """One dimension per vocabulary word, plus one every text has, so similar texts share words."""
+
+    VOCABULARY = ['cat', 'dog', 'mat', 'invoice', 'overdue', 'report', 'revenue']
+
+    def __init__(self):
+        super().__init__('bag-of-words')
+        self.calls = []
+
+    @staticmethod
+    def name():
+        return 'test'
+
+    def __call__(self, input):
+        self.calls.append(list(input))
+        embeddings = []
+        for text in input:
+            words = text.lower().split()
+            vector = np.array([words.count(word) for word in self.VOCABULARY] + [1], dtype=np.float32)
+            embeddings.append(vector / np.linalg.norm(vector))
+        return embeddings
+
+    @property
+    def dimension(self):
+        return len(self.VOCABULARY) + 1
+
+
+CHUNKS = {
+    'c1': 'the cat sat on the mat',
+    'c2': 'invoice INV-2024-001 is overdue',
+    'c3': 'a dog and a cat',
+    'c4': 'quarterly revenue report',
+}
+
+
+@pytest.fixture
+def backend(tmp_path, monkeypatch):
+    # The caches and the keyword index live in the working directory
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(vector_store, 'get_vector_backend',
+                        lambda: NumpyBackend(directory=str(tmp_path / 'index'), index='exact'))
+
+
+def open_store(tmp_path, provider):
+    return VectorStore(db_path=str(tmp_path / 'source_ids.db'), text_embedding_function=provider)
+
+
+@pytest.fixture
+def store(tmp_path, backend):
+    store = open_store(tmp_path, BagOfWordsProvider())
+    report = store.multimodal_index(ids=list(CHUNKS), contents=list(CHUNKS.values()),
+                                    metadatas=[{'source': f'{chunk_id}.txt'} for chunk_id in CHUNKS])
+    assert [item['error'] for item in report] == [None] * len(CHUNKS)
+    return store
+
+
+@pytest.mark.parametrize('query, expected', [
+    ('cat dog', '"cat" OR "dog"'),
+    ('INV-2024-001', '"INV-2024-001"'),
+    ('cat AND NOT dog*', '"cat" OR "AND" OR "NOT" OR "dog*"'),
+    ('say "hi" cat cat', '"say" OR """hi""" OR "cat"'),
+    ('- ? !!', ''),
+    ('', ''),
+])
+def test_make_match_query(query, expected):
+    assert make_match_query(query) == expected
+
+
+def test_keyword_search_matches_identifiers_as_a_whole(store):
+    assert [chunk_id for chunk_id, _ in store.keyword_search('INV-2024-001', 10)] == ['c2']
+    assert store.keyword_search('INV-2024-999', 10) == []
+    assert store.keyword_search('"; DROP TABLE chunk_text', 10) == []
+
+
+def test_keyword_mode_does_not_embed_the_query(store):
+    store.text_embedding_function.calls.clear()
+    results = store.search_text(['overdue invoice'], top_k=3, mode='keyword')
+
+    assert store.text_embedding_function.calls == []
+    assert results['ids'] == [['c2']]
+    assert results['keyword_matches'] == [[True]]
+    assert results['scores'][0][0] > 0
+
+
+def test_hybrid_mode_fuses_both_rankings(store):
+    query = 'cat invoice'
+    results = store.search_text([query], top_k=4, mode='hybrid')
+
+    keyword_ranking = [chunk_id for chunk_id, _ in store.keyword_search(query, 20)]
+    vector_results = store.text_collection.query(query_embeddings=store.text_embedding_function([query]),
+                                                 n_results=20, include=['distances'])
+    vector_ranking = vector_results['ids'][0]
+    expected = {
+        chunk_id: sum(1.0 / (SEARCH_RRF_K + ranking.index(chunk_id) + 1)
+                      for ranking in (keyword_ranking, vector_ranking) if chunk_id in ranking)
+        for chunk_id in CHUNKS
+    }
+
+    assert sorted(results['ids'][0]) == sorted(CHUNKS)
+    assert results['scores'][0] == sorted(results['scores'][0], reverse=True)
+    for chunk_id, score in zip(results['ids'][0], results['scores'][0]):
+        assert score == pytest.approx(expected[chunk_id])
+    matches = dict(zip(results['ids'][0], results['keyword_matches'][0]))
+    assert matches == {'c1': True, 'c2': True, 'c3': True, 'c4': False}
+    distances = dict(zip(results['ids'][0], results['distances'][0]))
+    assert distances == pytest.approx(dict(zip(vector_ranking, vector_results['distances'][0])))
+
+
+def test_hybrid_mode_ranks_an_exact_identifier_first(store):
+    # The identifier means nothing to the embedding model; only the keyword index knows it
+    results = store.search_text(['INV-2024-001'], top_k=2, mode='hybrid')
+
+    assert results['ids'][0][0] == 'c2'
+    assert results['keyword_matches'][0][0] is True
+
+
+class UnloadedProvider(BagOfWordsProvider):
+    """Fails the test if anything asks for its dimension, which would load (or call) the model."""
+
+    @property
+    def dimension(self):
+        raise AssertionError('dimension read before any vector was embedded')
+
+
+class OtherModelProvider(BagOfWordsProvider):
+    def __init__(self):
+        TextEmbeddingProvider.__init__(self, 'other-model')
+        self.calls = []
+
+
+def test_startup_does_not_touch_the_model(tmp_path, backend):
+    provider = UnloadedProvider()
+    store = open_store(tmp_path, provider)
+
+    assert provider.calls == []
+    assert (store.text_collection.metadata or {}).get('embedding_provider') is None
+
+
+def test_first_index_records_the_provider(tmp_path, backend):
+    store = open_store(tmp_path, UnloadedProvider())
+    store.multimodal_index(ids=['c1'], contents=[CHUNKS['c1']])
+
+    assert store.text_collection.metadata == {
+        'embedding_provider': 'test',
+        'embedding_model': 'bag-of-words',
+        'embedding_dimension': len(BagOfWordsProvider.VOCABULARY) + 1,
+    }
+
+
+@pytest.mark.parametrize('use', [
+    lambda store: store.multimodal_index(ids=['c2'], contents=[CHUNKS['c2']]),
+    lambda store: store.search_text(['cat'], mode='vector'),
+])
+def test_another_model_is_refused_on_first_use(tmp_path, backend, use):
+    open_store(tmp_path, BagOfWordsProvider()).multimodal_index(ids=['c1'], contents=[CHUNKS['c1']])
+    store = open_store(tmp_path, OtherModelProvider())
+
+    with pytest.raises(ValueError, match='other-model'):
+        use(store)
+    assert store.text_collection.count() == 1
@@ -1,19 +1,22 @@
 from sqlalchemy import create_engine, event
-from sqlalchemy.pool import StaticPool
+
+from utils.metrics import metrics
 
 DATABASE_URL = "sqlite:///file_manager.db"
 
-# Create an SQLAlchemy engine with a connection pool
+# Create an SQLAlchemy engine with a connection pool. Each thread of the ingestion
+# pipeline checks out its own connection; SQLite locking (and retry_on_lock) serializes writers.
 engine = create_engine(
     DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool
+    connect_args={"check_same_thread": False, "timeout": 30},
 )
 
 @event.listens_for(engine, "connect")
 def set_sqlite_pragma(dbapi_connection, connection_record):
     cursor = dbapi_connection.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    # WAL lets the check stage read the catalog while the commit stage writes to it
+    cursor.execute("PRAGMA journal_mode=WAL")
     cursor.close()
 
 def get_db_connection():
@@ -34,13 +37,22 @@ def retry_on_lock(func):
             except OperationalError as e:
                 if 'database is locked' in str(e):
                     retries -= 1
+                    metrics.inc('db_lock_retries_total', operation=func.__name__)
                     print(f"Database is locked. Retrying in {delay} seconds...")
                     time.sleep(delay)
                 else:
                     raise
+        metrics.inc('db_lock_failures_total', operation=func.__name__)
         raise OperationalError("Failed to acquire database lock after multiple retries")
     return wrapper
 
+def add_missing_columns(cursor, table, columns):
+    cursor.execute(f'PRAGMA table_info({table})')
+    existing_columns = {row[1] for row in cursor.fetchall()}
+    for name, column_type in columns.items():
+        if name not in existing_columns:
+            cursor.execute(f'ALTER TABLE {table} ADD COLUMN {name} {column_type}')
+
 def init_db():
     conn = get_db_connection()
     cursor = conn.connection.cursor()
@@ -49,9 +61,42 @@ def init_db():
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             path TEXT UNIQUE,
             hash TEXT,
-            url TEXT
+            url TEXT,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER
+        )
+    ''')
+    # Catalogs created before stat-based change detection lack these columns
+    add_missing_columns(cursor, 'files', {'size': 'INTEGER', 'mtime_ns': 'INTEGER', 'inode': 'INTEGER'})
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_files_hash ON files (hash)')
+    # Write-ahead record of files whose ingestion started but has not been committed to `files` yet
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_journal (
+            path TEXT PRIMARY KEY,
+            hash TEXT,
+            stage TEXT NOT NULL,
+            parts_committed INTEGER NOT NULL DEFAULT 0,
+            error TEXT,
+            updated_at REAL
+        )
+    ''')
+    # Stat of every file under the ingested roots as of its last ingestion (including files skipped as binary or
+    # too large), so startup only re-checks files whose stat differs. Read by path prefix, one root at a time.
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS file_snapshots (
+            path TEXT PRIMARY KEY,
+            size INTEGER,
+            mtime_ns INTEGER,
+            inode INTEGER
         )
     ''')
+    if cursor.execute('SELECT 1 FROM file_snapshots LIMIT 1').fetchone() is None:
+        # Catalogs created before snapshots start from the stats already recorded in `files`
+        cursor.execute('''
+            INSERT OR IGNORE INTO file_snapshots (path, size, mtime_ns, inode)
+            SELECT path, size, mtime_ns, inode FROM files
+        ''')
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS directories (
             id TEXT PRIMARY KEY,
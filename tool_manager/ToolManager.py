@@ -59,6 +59,9 @@ class ToolManager(BaseToolManager):
                     "type": field_type,
                     "description": field_schema.get('description', 'No description available')
                 }
+                # Literal fields only accept their listed values
+                if 'enum' in field_schema:
+                    properties[field]["enum"] = field_schema['enum']
 
         openai_tool_description = {
             "type": "function",
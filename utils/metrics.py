@@ -0,0 +1,222 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config.settings import METRICS_RATE_WINDOW_SECONDS
+
+# Upper bounds (seconds) of the latency histogram buckets
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format_labels(label_key):
+    if not label_key:
+        return ''
+    return '{' + ','.join(f'{name}="{value}"' for name, value in label_key) + '}'
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                return
+        self.counts[-1] += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by interpolating inside the bucket that contains it."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for i, count in enumerate(self.counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+            if count and seen + count >= rank:
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+            lower = upper
+        return self.buckets[-1]
+
+
+class MetricsRegistry:
+    """
+    Thread-safe, in-process counters, gauges and histograms.
+
+    Metrics are created on first use and identified by name plus keyword labels, e.g.
+    `metrics.observe('ingest_stage_seconds', 0.2, stage='embed')`. Counters also keep their recent increments so
+    `snapshot()` can report per-second rates over the last `rate_window` seconds.
+    """
+
+    def __init__(self, rate_window=METRICS_RATE_WINDOW_SECONDS):
+        self.rate_window = rate_window
+        self.started_at = time.time()
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._recent = {}
+        self._gauges = {}
+        self._histograms = {}
+
+    def inc(self, name, value=1, **labels):
+        key = (name, _label_key(labels))
+        now = time.monotonic()
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+            recent = self._recent.setdefault(key, deque())
+            recent.append((now, value))
+            while recent and recent[0][0] < now - self.rate_window:
+                recent.popleft()
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._gauges[(name, _label_key(labels))] = value
+
+    def observe(self, name, value, **labels):
+        key = (name, _label_key(labels))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def rate(self, name, **labels):
+        """Per-second rate of a counter over the rate window."""
+        with self._lock:
+            return self._rate((name, _label_key(labels)), time.monotonic())
+
+    def _rate(self, key, now):
+        recent = self._recent.get(key, ())
+        return sum(value for moment, value in recent if moment >= now - self.rate_window) / self.rate_window
+
+    def snapshot(self):
+        """
+        :return: JSON-serializable dict of every metric, with counter rates and histogram p50/p95 estimates.
+        """
+        now = time.monotonic()
+        with self._lock:
+            counters = [
+                {'name': name, 'labels': dict(labels), 'value': value, 'rate': self._rate((name, labels), now)}
+                for (name, labels), value in sorted(self._counters.items())
+            ]
+            gauges = [
+                {'name': name, 'labels': dict(labels), 'value': value}
+                for (name, labels), value in sorted(self._gauges.items())
+            ]
+            histograms = [
+                {
+                    'name': name, 'labels': dict(labels), 'count': histogram.count, 'sum': histogram.sum,
+                    'p50': histogram.quantile(0.5), 'p95': histogram.quantile(0.95),
+                }
+                for (name, labels), histogram in sorted(self._histograms.items())
+            ]
+        return {
+            'timestamp': time.time(),
+            'uptime_seconds': time.time() - self.started_at,
+            'rate_window_seconds': self.rate_window,
+            'counters': counters,
+            'gauges': gauges,
+            'histograms': histograms,
+        }
+
+    def to_prometheus(self):
+        """Render every metric in the Prometheus text exposition format."""
+        lines = []
+        typed = set()
+
+        def header(name, metric_type):
+            if name not in typed:
+                typed.add(name)
+                lines.append(f"# TYPE {name} {metric_type}")
+
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                header(name, 'counter')
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), value in sorted(self._gauges.items()):
+                header(name, 'gauge')
+                lines.append(f"{name}{_format_labels(labels)} {value}")
+            for (name, labels), histogram in sorted(self._histograms.items()):
+                header(name, 'histogram')
+                cumulative = 0
+                for bound, count in zip(list(histogram.buckets) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    bucket_labels = _format_labels(labels + (('le', bound),))
+                    lines.append(f"{name}_bucket{bucket_labels} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path):
+        """Write the snapshot as JSON, replacing the file atomically."""
+        temp_path = f"{path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(temp_path, path)
+
+
+# Process-wide registry used by the ingestion code
+metrics = MetricsRegistry()
+
+
+def start_metrics_exporter(path, interval):
+    """Export the snapshot to `path` every `interval` seconds from a daemon thread."""
+    def run():
+        while True:
+            time.sleep(interval)
+            try:
+                metrics.export(path)
+            except OSError as e:
+                print(f"Failed to export metrics to {path}: {e}")
+
+    thread = threading.Thread(target=run, name='metrics-exporter', daemon=True)
+    thread.start()
+    return thread
+
+
+def start_metrics_server(port, host='127.0.0.1'):
+    """Serve /metrics (Prometheus text) and /metrics.json from a daemon thread."""
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body, content_type = metrics.to_prometheus(), 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body, content_type = json.dumps(metrics.snapshot()), 'application/json'
+            else:
+                self.send_error(404)
+                return
+            data = body.encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server